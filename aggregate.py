@@ -0,0 +1,373 @@
+'''
+Mergeable partial summaries. These allow a column to be summarised in pieces
+(e.g. one piece per file) and the pieces combined afterwards, giving the same
+statistics as `Series.describe()` on the whole column.
+
+Summaries can also profile the column's missing data (see `PartialGaps`),
+from the same null mask as the statistics.
+'''
+
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+from pandas import DataFrame, Series, Timestamp
+
+from planner import (
+    plan_selection,
+    planned_subset,
+    select_cells,
+    selected_timestamps,
+)
+
+
+# The statistics produced by `Series.describe()` for numeric data, in order.
+DESCRIBE_INDEX = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+# The missing-data statistics added to a summary when profiling gaps, in
+# order. Durations are in seconds.
+GAPS_INDEX = [
+    'null fraction',
+    'gaps',
+    'longest gap (s)',
+    'longest gap start',
+    'median interval (s)',
+]
+
+# Missing times, e.g. the end of a run of nulls which has not ended yet.
+NAT = np.datetime64('NaT', 'ns')
+
+
+def _times(*values: np.datetime64):
+    '''Create an array of times from the values given.'''
+    return np.array(values, dtype='datetime64[ns]')
+
+
+@dataclass
+class PartialGaps:
+    '''
+    The missing data in part of a column, which can be merged with that of
+    the parts that follow it.
+
+    A gap is a run of consecutive null rows. It starts at its first row's
+    time and lasts until the next row's time, or until the last row's time
+    if the column ends with it. Each part keeps the start and end of its
+    gaps; a gap which reaches the end of the part is left open (ending at
+    `NaT`), since it may continue into the next part. The intervals between
+    consecutive non-null readings are kept for their median, which cannot
+    be merged exactly.
+    '''
+    rows: int = 0
+    nulls: int = 0
+    first_time: np.datetime64 = NAT
+    last_time: np.datetime64 = NAT
+    first_reading: np.datetime64 = NAT
+    last_reading: np.datetime64 = NAT
+    starts_null: bool = False
+    gap_starts: np.ndarray = field(default_factory=_times)
+    gap_ends: np.ndarray = field(default_factory=_times)
+    intervals: np.ndarray = field(
+        default_factory=lambda: np.empty(0, dtype='timedelta64[ns]'),
+    )
+
+    def merge(self, other: 'PartialGaps'):
+        '''
+        Combine these gaps with those of the part which follows, returning
+        a new `PartialGaps`.
+        '''
+        return merge_gaps([self, other])
+
+    def statistics(self):
+        '''
+        Return the statistics named in `GAPS_INDEX`.
+        '''
+        if self.rows == 0:
+            return [np.nan, 0.0, np.nan, None, np.nan]
+
+        # Gaps still open run to the end of the column.
+        ends = np.where(np.isnat(self.gap_ends), self.last_time, self.gap_ends)
+        durations = (ends - self.gap_starts) / np.timedelta64(1, 's')
+        longest = int(np.argmax(durations)) if len(durations) > 0 else None
+
+        # The median is found in seconds, since NumPy's median of
+        # floats is much faster than that of `timedelta64`s.
+        return [
+            self.nulls / self.rows,
+            float(len(durations)),
+            np.nan if longest is None else float(durations[longest]),
+            None if longest is None
+                else str(Timestamp(self.gap_starts[longest])),
+            float(np.median(self.intervals / np.timedelta64(1, 's')))
+                if len(self.intervals) > 0 else np.nan,
+        ]
+
+
+def partial_gaps(nulls: np.ndarray, timestamps: np.ndarray):
+    '''
+    Create the `PartialGaps` of part of a column, from which of its rows are
+    null and the time of each row.
+    '''
+    if len(nulls) == 0:
+        return PartialGaps()
+
+    # Gaps start where the mask rises and stop where it
+    # falls, at the next row.
+    changes = np.diff(nulls.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(changes == 1)
+    stops = np.flatnonzero(changes == -1)
+    ends = np.full(len(stops), NAT)
+    closed = stops < len(nulls)
+    ends[closed] = timestamps[stops[closed]]
+
+    readings = timestamps[~nulls]
+    return PartialGaps(
+        rows = len(nulls),
+        nulls = len(nulls) - len(readings),
+        first_time = timestamps[0],
+        last_time = timestamps[-1],
+        first_reading = readings[0] if len(readings) > 0 else NAT,
+        last_reading = readings[-1] if len(readings) > 0 else NAT,
+        starts_null = bool(nulls[0]),
+        gap_starts = timestamps[starts],
+        gap_ends = ends,
+        intervals = np.diff(readings),
+    )
+
+def merge_gaps(parts: list[PartialGaps]):
+    '''
+    Merge the gaps of consecutive parts of a column, in order. A gap left
+    open at the end of a part is joined to the gap at the start of the next
+    part, or ends at that part's first row.
+    '''
+    parts = [part for part in parts if part.rows > 0]
+    if len(parts) == 0:
+        return PartialGaps()
+
+    starts, ends, intervals = [], [], []
+    open_start = NAT
+    last_reading = NAT
+    for part in parts:
+        gap_starts, gap_ends = part.gap_starts, part.gap_ends
+        if not np.isnat(open_start):
+            if part.starts_null:
+                gap_starts = gap_starts.copy()
+                gap_starts[0] = open_start
+            else:
+                starts.append(_times(open_start))
+                ends.append(_times(part.first_time))
+
+        open_start = NAT
+        if len(gap_ends) > 0 and np.isnat(gap_ends[-1]):
+            open_start = gap_starts[-1]
+            gap_starts, gap_ends = gap_starts[:-1], gap_ends[:-1]
+        starts.append(gap_starts)
+        ends.append(gap_ends)
+
+        # Readings either side of the boundary are consecutive.
+        if not np.isnat(last_reading) and not np.isnat(part.first_reading):
+            intervals.append(_times(part.first_reading) - last_reading)
+        intervals.append(part.intervals)
+        if not np.isnat(part.last_reading):
+            last_reading = part.last_reading
+
+    if not np.isnat(open_start):
+        starts.append(_times(open_start))
+        ends.append(_times(NAT))
+
+    readings = [
+        part.first_reading for part in parts
+        if not np.isnat(part.first_reading)
+    ]
+    return PartialGaps(
+        rows = sum(part.rows for part in parts),
+        nulls = sum(part.nulls for part in parts),
+        first_time = parts[0].first_time,
+        last_time = parts[-1].last_time,
+        first_reading = readings[0] if len(readings) > 0 else NAT,
+        last_reading = last_reading,
+        starts_null = parts[0].starts_null,
+        gap_starts = np.concatenate(starts),
+        gap_ends = np.concatenate(ends),
+        intervals = np.concatenate(intervals),
+    )
+
+
+@dataclass
+class PartialSummary:
+    '''
+    Summary statistics for part of a column which can be merged with the
+    statistics of other parts of the same column.
+
+    The count, mean, sum of squared deviations (`m2`), minimum and maximum are
+    combined using Chan et al.'s parallel algorithm. Quantiles cannot be merged
+    exactly, so the non-null values themselves are kept for them. If gaps are
+    being profiled, `gaps` holds the missing data of the same part.
+    '''
+    count: int = 0
+    mean: float = np.nan
+    m2: float = 0.0
+    minimum: float = np.nan
+    maximum: float = np.nan
+    values: np.ndarray = field(default_factory=lambda: np.empty(0))
+    gaps: PartialGaps | None = None
+
+    def merge(self, other: 'PartialSummary', keep_values: bool = True):
+        '''
+        Combine this partial summary with another one for the same column,
+        returning a new `PartialSummary`. Values are kept in the order
+        `self`, `other`, unless `keep_values` is false, in which case only
+        the moments are combined and the values of `self` are kept as they
+        are.
+        '''
+        # Gaps are merged even if either side has no readings.
+        gaps = self.gaps
+        if other.gaps is not None:
+            gaps = other.gaps if gaps is None else gaps.merge(other.gaps)
+
+        # Nothing else to combine if either side is empty.
+        if other.count == 0:
+            return replace(self, gaps=gaps)
+        if self.count == 0:
+            return replace(other, gaps=gaps)
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+
+        return PartialSummary(
+            count = count,
+            mean = self.mean + delta * other.count / count,
+            m2 = self.m2 + other.m2
+                + delta * delta * self.count * other.count / count,
+            minimum = min(self.minimum, other.minimum),
+            maximum = max(self.maximum, other.maximum),
+            values = np.concatenate([self.values, other.values])
+                if keep_values else self.values,
+            gaps = gaps,
+        )
+
+    def to_series(self):
+        '''
+        Return the statistics in the same form as `Series.describe()`,
+        followed by those in `GAPS_INDEX` if gaps are being profiled.
+        '''
+        if self.count == 0:
+            statistics = [0.0] + [np.nan] * (len(DESCRIBE_INDEX) - 1)
+        else:
+            # Sample standard deviation, as used by pandas.
+            std = np.sqrt(self.m2 / (self.count - 1))\
+                if self.count > 1 else np.nan
+
+            # Linear interpolation matches pandas' default.
+            quartiles = np.quantile(self.values, [0.25, 0.5, 0.75])
+
+            statistics = [
+                float(self.count),
+                self.mean,
+                std,
+                self.minimum,
+                *quartiles,
+                self.maximum,
+            ]
+
+        if self.gaps is None:
+            return Series(statistics, index=DESCRIBE_INDEX)
+        return Series(
+            statistics + self.gaps.statistics(),
+            index = DESCRIBE_INDEX + GAPS_INDEX,
+        )
+
+
+def partial_summary(column: np.ndarray, timestamps: np.ndarray | None = None):
+    '''
+    Create a `PartialSummary` of the column provided. NaN values are ignored,
+    as in `Series.describe()`. If the time of each row is passed, the
+    column's gaps are profiled too, from the same null mask.
+    '''
+    values = np.asarray(column, dtype=float)
+    nulls = np.isnan(values)
+    values = values[~nulls]
+    gaps = None if timestamps is None else partial_gaps(nulls, timestamps)
+
+    if len(values) == 0:
+        return PartialSummary(gaps=gaps)
+
+    mean = values.mean()
+    return PartialSummary(
+        count = len(values),
+        mean = mean,
+        m2 = float(np.square(values - mean).sum()),
+        minimum = values.min(),
+        maximum = values.max(),
+        values = values,
+        gaps = gaps,
+    )
+
+def merge_partials(partials: list[PartialSummary]):
+    '''
+    Merge a list of partial summaries of the same column, in order.
+    '''
+    merged = PartialSummary()
+    for partial in partials:
+        merged = merged.merge(replace(partial, gaps=None), keep_values=False)
+
+    # Concatenate the values and gaps once, rather than at
+    # every merge.
+    gaps = [partial.gaps for partial in partials if partial.gaps is not None]
+    return replace(
+        merged,
+        values = np.concatenate(
+            [np.empty(0)] + [partial.values for partial in partials]
+        ),
+        gaps = merge_gaps(gaps) if len(gaps) > 0 else None,
+    )
+
+def describe_groups(job: tuple[np.ndarray, list[tuple[int, int]]]):
+    '''
+    Describe each group of rows of a column whose rows have been sorted by
+    group, so that each group is a contiguous slice.
+
+    `job` holds the column and the `(start, end)` slice of each group. Returns
+    one `describe()`-style `Series` per group.
+    '''
+    column, bounds = job
+    return [
+        partial_summary(column[start:end]).to_series() for start, end in bounds
+    ]
+
+def describe_with_gaps(job: tuple[np.ndarray, np.ndarray]):
+    '''
+    Describe a column and profile its gaps. `job` holds the column and the
+    time of each of its rows. Returns a `describe()`-style `Series` followed
+    by the statistics in `GAPS_INDEX`.
+    '''
+    column, timestamps = job
+    return partial_summary(column, timestamps).to_series()
+
+def summarise_rows(
+        df: DataFrame,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+        gaps: bool = False,
+    ):
+    '''
+    Select the rows and sensors of a `DataFrame` read from part of a dataset,
+    cleaning only the rows selected, and provide a `PartialSummary` of each
+    selected sensor, profiling its gaps if `gaps` is true.
+
+    Returns the list of partial summaries and the number of broken and
+    recovering rows removed.
+    '''
+    if not gaps:
+        columns, removed = planned_subset(
+            df, *time_range, *sensor_range, no_clean,
+        )
+        return [partial_summary(column) for column in columns], removed
+
+    rows, names, keep, removed = plan_selection(
+        df, *time_range, *sensor_range, no_clean,
+    )
+    timestamps = selected_timestamps(df, rows, keep)
+    return [
+        partial_summary(column, timestamps)
+        for column in select_cells(df, rows, names, keep)
+    ], removed
@@ -0,0 +1,321 @@
+'''
+Zone-mapped columnar block store. Each column of a data file is saved as a
+NumPy array, split logically into fixed-size blocks, and the minimum, maximum
+and null count of every block (its zone map) are recorded. Value filters can
+then skip every block whose zone map shows it cannot contain a match.
+'''
+
+from dataclasses import dataclass
+from json import dump, load
+from pathlib import Path
+from re import fullmatch
+from warnings import catch_warnings, simplefilter
+
+import numpy as np
+from pandas import read_csv
+
+import logger
+from util import sensor_name
+
+
+# Extension added to a data file's name to give the name of its store.
+STORE_SUFFIX = '.store'
+
+# Default number of rows per block.
+BLOCK_SIZE = 4096
+
+# Comparison operators supported by `--where` filters.
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+# Machine status values which are removed when cleaning.
+BAD_STATUSES = ('BROKEN', 'RECOVERING')
+
+
+@dataclass
+class BlockStore:
+    '''
+    An opened block store. Columns are memory-mapped when loaded, so only the
+    blocks which are actually sliced are read from disk.
+    '''
+    directory: Path
+    block_size: int
+    num_rows: int
+    sensors: list[str]
+    statuses: list[str]
+    # Zone maps of each sensor: one `[min, max, null count]` list per block,
+    # with `None` bounds for blocks which only contain nulls.
+    zones: dict[str, list[list]]
+
+    @property
+    def num_blocks(self):
+        '''The number of blocks each column is split into.'''
+        return -(-self.num_rows // self.block_size)
+
+    def column(self, name: str) -> np.ndarray:
+        '''
+        Memory-map a stored column (a sensor, `timestamp` or
+        `machine_status`).
+        '''
+        return np.load(self.directory / f'{name}.npy', mmap_mode='r')
+
+    def zone(self, sensor: str, block: int):
+        '''
+        Get the minimum and maximum of a block, as NaN if it only contains
+        nulls.
+        '''
+        minimum, maximum, _ = self.zones[sensor][block]
+        return (
+            np.nan if minimum is None else minimum,
+            np.nan if maximum is None else maximum,
+        )
+
+
+@dataclass(frozen=True)
+class Predicate:
+    '''
+    A single `COLUMN OPERATOR VALUE` filter, e.g. `sensor_04 > 600`. Rows with
+    a null value in the column never match.
+    '''
+    column: str
+    operator: str
+    value: float
+
+    def may_match(self, minimum: float, maximum: float):
+        '''
+        Check, using a block's zone map, whether any row of the block could
+        match. Blocks which only contain nulls have NaN bounds and never match.
+        '''
+        if np.isnan(minimum):
+            return False
+
+        match self.operator:
+            case '<':
+                return minimum < self.value
+            case '<=':
+                return minimum <= self.value
+            case '>':
+                return maximum > self.value
+            case '>=':
+                return maximum >= self.value
+            case '==':
+                return minimum <= self.value <= maximum
+            case _:
+                return not minimum == maximum == self.value
+
+    def mask(self, values: np.ndarray):
+        '''
+        Return a boolean mask of the values which match.
+        '''
+        with np.errstate(invalid='ignore'):
+            return OPERATORS[self.operator](values, self.value)\
+                & ~np.isnan(values)
+
+
+def parse_predicate(text: str):
+    '''
+    Validation function for use with `argparse`. Parses a filter such as
+    `"sensor_04 > 600"` into a `Predicate`, raising a `ValueError` if it is
+    invalid.
+    '''
+    match = fullmatch(
+        r'\s*(sensor_\d{2})\s*(<=|>=|==|!=|<|>)\s*(\S+)\s*', text,
+    )
+    if match is None:
+        raise ValueError(
+            'Filters must take the form "sensor_NN OPERATOR VALUE", where'
+            f' OPERATOR is one of: {" ".join(OPERATORS)}.'
+        )
+
+    column, operator, value = match.groups()
+    return Predicate(column, operator, float(value))
+
+def store_path(file_path: str | Path):
+    '''
+    Get the path of the block store directory for the data file specified.
+    '''
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + STORE_SUFFIX)
+
+def build_block_store(file_path: str | Path, block_size: int = BLOCK_SIZE):
+    '''
+    Read a CSV data file once and save it as a zone-mapped block store next
+    to the file. Returns the path of the store.
+    '''
+    file_path = Path(file_path)
+    directory = store_path(file_path)
+    directory.mkdir(exist_ok=True)
+
+    df = read_csv(file_path)
+    sensors = [column for column in df.columns if column.startswith('sensor_')]
+
+    # Timestamps are stored as datetime64 so that time
+    # ranges can be found by binary search, and statuses as
+    # small integer codes.
+    np.save(
+        directory / 'timestamp.npy',
+        df['timestamp'].to_numpy(dtype='datetime64[ns]'),
+    )
+    statuses = sorted(df['machine_status'].dropna().unique())
+    codes = np.full(len(df), -1, dtype=np.int8)
+    for code, status in enumerate(statuses):
+        codes[(df['machine_status'] == status).to_numpy()] = code
+    np.save(directory / 'machine_status.npy', codes)
+
+    # Save each sensor column and work out its zone maps by
+    # padding it to a whole number of blocks with NaN.
+    num_blocks = -(-len(df) // block_size)
+    padding = num_blocks * block_size - len(df)
+    zones = {}
+    for sensor in sensors:
+        values = df[sensor].to_numpy(dtype=float)
+        np.save(directory / f'{sensor}.npy', values)
+
+        blocks = np.concatenate([values, np.full(padding, np.nan)])\
+            .reshape(num_blocks, block_size)
+        nulls = np.isnan(blocks).sum(axis=1)
+        if num_blocks > 0:
+            nulls[-1] -= padding
+
+        # Blocks containing only nulls give NaN bounds, and a
+        # warning which is not needed here.
+        with catch_warnings():
+            simplefilter('ignore', RuntimeWarning)
+            minimums = np.nanmin(blocks, axis=1)
+            maximums = np.nanmax(blocks, axis=1)
+
+        zones[sensor] = [
+            [
+                None if np.isnan(minimum) else float(minimum),
+                None if np.isnan(maximum) else float(maximum),
+                int(null_count),
+            ]
+            for minimum, maximum, null_count in zip(minimums, maximums, nulls)
+        ]
+
+    stat = file_path.stat()
+    with open(directory / 'meta.json', 'w', encoding='utf-8') as file:
+        dump({
+            'block_size': block_size,
+            'num_rows': len(df),
+            'sensors': sensors,
+            'statuses': statuses,
+            'zones': zones,
+            'source_size': stat.st_size,
+            'source_mtime': stat.st_mtime_ns,
+        }, file)
+
+    return directory
+
+def open_block_store(file_path: str | Path):
+    '''
+    Open the block store of the data file specified. Returns `None` if there
+    is no store, or if the data file has changed since the store was built
+    (a stale store could give wrong results, so it is ignored).
+    '''
+    file_path = Path(file_path)
+    directory = store_path(file_path)
+    if not (directory / 'meta.json').exists():
+        return None
+
+    with open(directory / 'meta.json', encoding='utf-8') as file:
+        meta = load(file)
+
+    stat = file_path.stat()
+    if (meta['source_size'], meta['source_mtime'])\
+            != (stat.st_size, stat.st_mtime_ns):
+        logger.warn(
+            f'Ignoring stale block store "{directory}"; rebuild it with'
+            ' `build-store`.\n'
+        )
+        return None
+
+    return BlockStore(
+        directory = directory,
+        block_size = meta['block_size'],
+        num_rows = meta['num_rows'],
+        sensors = meta['sensors'],
+        statuses = meta['statuses'],
+        zones = meta['zones'],
+    )
+
+def select_columns(
+        store: BlockStore,
+        predicates: list[Predicate],
+        time_start: str,
+        time_end: str,
+        sensor_start: int,
+        sensor_end: int,
+        no_clean: bool = False,
+    ):
+    '''
+    Select the values of each sensor in the sensor range from the rows in the
+    time range which match every predicate, reading only the blocks whose
+    zone maps show they may contain a match.
+
+    Returns the list of columns (as for `util.subset_df()`), the number of
+    blocks in the time range and the number of those blocks skipped.
+    '''
+    for predicate in predicates:
+        if predicate.column not in store.sensors:
+            raise ValueError(f'Unknown filter column "{predicate.column}".')
+
+    # Find the rows, and thus the blocks, in the time range.
+    timestamps = store.column('timestamp')
+    row_start = int(np.searchsorted(timestamps, np.datetime64(time_start), 'left'))
+    row_end = int(np.searchsorted(timestamps, np.datetime64(time_end), 'right'))
+    blocks = range(
+        row_start // store.block_size,
+        -(-row_end // store.block_size) if row_end > row_start else 0,
+    )
+
+    # Keep only the blocks which may contain a match for
+    # every predicate.
+    candidates = [
+        block for block in blocks
+        if all(
+            predicate.may_match(*store.zone(predicate.column, block))
+            for predicate in predicates
+        )
+    ]
+
+    filter_columns = {
+        predicate.column: store.column(predicate.column)
+        for predicate in predicates
+    }
+    statuses = store.column('machine_status')
+    bad_codes = [
+        store.statuses.index(status)
+        for status in BAD_STATUSES if status in store.statuses
+    ]
+    sensors = [
+        store.column(sensor_name(index))
+        for index in range(sensor_start, sensor_end + 1)
+    ]
+
+    # Decode the candidate blocks, keeping the matching rows.
+    parts: list[list[np.ndarray]] = [[] for _ in sensors]
+    for block in candidates:
+        start = max(block * store.block_size, row_start)
+        end = min((block + 1) * store.block_size, row_end)
+
+        mask = np.ones(end - start, dtype=bool)
+        for predicate in predicates:
+            mask &= predicate.mask(filter_columns[predicate.column][start:end])
+        if not no_clean:
+            mask &= ~np.isin(statuses[start:end], bad_codes)
+
+        for sensor_parts, sensor in zip(parts, sensors):
+            sensor_parts.append(np.asarray(sensor[start:end])[mask])
+
+    columns = [
+        np.concatenate(sensor_parts) if len(sensor_parts) > 0 else np.empty(0)
+        for sensor_parts in parts
+    ]
+    return columns, len(blocks), len(blocks) - len(candidates)
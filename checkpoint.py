@@ -0,0 +1,230 @@
+'''
+Checkpoints for long-running summaries of partitioned datasets. As each
+partition (a file, or a byte range of one) is summarised, its mergeable
+partial summaries are saved to a state directory, so that an interrupted
+summary can be resumed without redoing the partitions already done.
+
+The state of each summary is kept in its own directory, named after a hash
+of everything the result depends on: the partitions (and the size and
+modification time of their files), the time and sensor ranges, and whether
+the data is cleaned. A resumed run therefore never mixes in partials from a
+different summary, or from data files which have since changed.
+'''
+
+from dataclasses import dataclass
+from hashlib import sha256
+from json import dump, dumps
+from os import replace
+from pathlib import Path
+from shutil import rmtree
+from time import perf_counter
+
+import numpy as np
+
+from aggregate import PartialGaps, PartialSummary
+from reader import ByteRange
+
+
+# Default directory for checkpoint state, relative to the program.
+CHECKPOINT_DIR = '.checkpoints'
+
+# Size of the byte ranges a single data file is split into when checkpointing,
+# so that progress is saved regularly.
+CHECKPOINT_RANGE_BYTES = 16 * 1024 * 1024
+
+
+@dataclass
+class Checkpoint:
+    '''
+    The saved state of one summary. `done` holds the indices of the
+    partitions which have been saved; the time and bytes spent saving them
+    are recorded to measure the overhead of checkpointing.
+    '''
+    directory: Path
+    num_partitions: int
+    done: set[int]
+    save_time: float = 0.0
+    bytes_saved: int = 0
+
+    def _unit_path(self, index: int):
+        return self.directory / f'partition-{index:05d}.npz'
+
+    def save(
+            self,
+            index: int,
+            partials: list[PartialSummary],
+            removed: tuple[int, int],
+        ):
+        '''
+        Save the partial summaries (one per sensor) and the number of broken
+        and recovering rows removed from a partition. The file is written
+        under a temporary name and then renamed, so a crash while saving never
+        leaves a partial checkpoint behind.
+        '''
+        start_time = perf_counter()
+        path = self._unit_path(index)
+        temporary = path.with_name(f'{path.stem}.tmp.npz')
+
+        np.savez(
+            temporary,
+            counts = np.array([partial.count for partial in partials]),
+            means = np.array([partial.mean for partial in partials]),
+            m2s = np.array([partial.m2 for partial in partials]),
+            minimums = np.array([partial.minimum for partial in partials]),
+            maximums = np.array([partial.maximum for partial in partials]),
+            lengths = np.array([len(partial.values) for partial in partials]),
+            values = np.concatenate(
+                [np.empty(0)] + [partial.values for partial in partials]
+            ),
+            removed = np.array(removed),
+            **_gap_arrays(partials),
+        )
+        replace(temporary, path)
+
+        self.done.add(index)
+        self.bytes_saved += path.stat().st_size
+        self.save_time += perf_counter() - start_time
+
+    def load(self, index: int):
+        '''
+        Load the partial summaries and removed row counts of a saved
+        partition, exactly as they were saved.
+        '''
+        with np.load(self._unit_path(index)) as data:
+            values = np.split(data['values'], np.cumsum(data['lengths'])[:-1])
+            gaps = _load_gaps(data) if 'gap_rows' in data\
+                else [None] * len(values)
+            partials = [
+                PartialSummary(
+                    count = int(count),
+                    mean = float(mean),
+                    m2 = float(m2),
+                    minimum = float(minimum),
+                    maximum = float(maximum),
+                    values = column,
+                    gaps = column_gaps,
+                )
+                for count, mean, m2, minimum, maximum, column, column_gaps
+                in zip(
+                    data['counts'], data['means'], data['m2s'],
+                    data['minimums'], data['maximums'], values, gaps,
+                )
+            ]
+            removed = tuple(int(count) for count in data['removed'])
+        return partials, removed
+
+    def remove(self):
+        '''Delete the saved state, once the summary is complete.'''
+        rmtree(self.directory, ignore_errors=True)
+
+
+def _gap_arrays(partials: list[PartialSummary]):
+    '''
+    Flatten the gaps of the partial summaries (if they were profiled) into
+    arrays to save with them.
+    '''
+    if len(partials) == 0 or partials[0].gaps is None:
+        return {}
+
+    gaps = [partial.gaps for partial in partials]
+    return {
+        'gap_rows': np.array([part.rows for part in gaps]),
+        'gap_nulls': np.array([part.nulls for part in gaps]),
+        'gap_times': np.array([
+            (part.first_time, part.last_time,
+                part.first_reading, part.last_reading)
+            for part in gaps
+        ], dtype='datetime64[ns]'),
+        'gap_starts_null': np.array([part.starts_null for part in gaps]),
+        'gap_lengths': np.array([len(part.gap_starts) for part in gaps]),
+        'gap_starts': np.concatenate([part.gap_starts for part in gaps]),
+        'gap_ends': np.concatenate([part.gap_ends for part in gaps]),
+        'interval_lengths': np.array([len(part.intervals) for part in gaps]),
+        'intervals': np.concatenate([part.intervals for part in gaps]),
+    }
+
+def _load_gaps(data):
+    '''
+    Rebuild the gaps of each sensor from the arrays saved by `_gap_arrays()`.
+    '''
+    gap_splits = np.cumsum(data['gap_lengths'])[:-1]
+    interval_splits = np.cumsum(data['interval_lengths'])[:-1]
+    return [
+        PartialGaps(
+            rows = int(rows),
+            nulls = int(nulls),
+            first_time = times[0],
+            last_time = times[1],
+            first_reading = times[2],
+            last_reading = times[3],
+            starts_null = bool(starts_null),
+            gap_starts = starts,
+            gap_ends = ends,
+            intervals = intervals,
+        )
+        for rows, nulls, times, starts_null, starts, ends, intervals in zip(
+            data['gap_rows'], data['gap_nulls'], data['gap_times'],
+            data['gap_starts_null'],
+            np.split(data['gap_starts'], gap_splits),
+            np.split(data['gap_ends'], gap_splits),
+            np.split(data['intervals'], interval_splits),
+        )
+    ]
+
+def describe_partition(partition: Path | ByteRange):
+    '''
+    Describe a partition for the checkpoint key: its file's path, size and
+    modification time, and its byte range (if any).
+    '''
+    file_path = Path(
+        partition.file_path if isinstance(partition, ByteRange) else partition
+    ).resolve()
+    stat = file_path.stat()
+    description = {
+        'file': str(file_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+    }
+    if isinstance(partition, ByteRange):
+        description['range'] = [partition.start, partition.end]
+    return description
+
+def open_checkpoint(
+        state_dir: str | Path,
+        partitions: list[Path | ByteRange],
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+        resume: bool,
+        gaps: bool = False,
+    ):
+    '''
+    Open the checkpoint of a summary. If `resume` is true, the partitions
+    already saved are kept; otherwise any saved state is discarded and the
+    summary starts from scratch.
+    '''
+    manifest = {
+        'partitions': [describe_partition(partition) for partition in partitions],
+        'time_range': list(time_range),
+        'sensor_range': list(sensor_range),
+        'no_clean': no_clean,
+    }
+    # Only added when profiling gaps, so that the keys of
+    # other summaries are unchanged.
+    if gaps:
+        manifest['gaps'] = True
+    key = sha256(dumps(manifest, sort_keys=True).encode()).hexdigest()[:16]
+    directory = Path(state_dir) / key
+
+    if not resume:
+        rmtree(directory, ignore_errors=True)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / 'manifest.json', 'w', encoding='utf-8') as file:
+        dump(manifest, file, indent=2)
+
+    checkpoint = Checkpoint(directory, len(partitions), set())
+    checkpoint.done = {
+        index for index in range(len(partitions))
+        if checkpoint._unit_path(index).exists()
+    }
+    return checkpoint
@@ -3,119 +3,882 @@ Command definitions.
 '''
 
 from argparse import Namespace
+from functools import wraps
 from pathlib import Path
 
+from pandas import DataFrame
+
 import logger
-from proc import benchmark, summarise_file
-from util import date_string
+from block_store import BLOCK_SIZE, build_block_store, parse_predicate
+from checkpoint import CHECKPOINT_DIR
+from compression import compression_benchmark
+from correlation import correlate
+from episodes import EPISODE_WINDOWS, HOURS_BEFORE, summarise_episodes
+from extremes import TOP_K, find_extremes, threshold_string
+from histogram import HISTOGRAM_FORMATS, NUM_BINS, build_histograms
+from metadata import build_metadata, dataset_bounds, metadata_path
+from multi_query import (
+    load_query_specs,
+    max_difference,
+    summarise_queries,
+    summarise_queries_separately,
+)
+from output import OUTPUT_FORMATS, get_result_writer, write_table
+from placement import (
+    Placement,
+    affinity_string,
+    current as current_placement,
+    make_placement,
+    use as use_placement,
+)
+from proc import (
+    benchmark,
+    collate_results,
+    collate_grouped_results,
+    summarise_by_status,
+    summarise_file,
+)
+from reader import read_benchmark
+from rolling import (
+    ROLLING_EVERY,
+    ROLLING_WINDOWS,
+    duration_string,
+    interval_string,
+    rolling_statistics,
+)
+from sampling import sample_summary
+from spectrum import (
+    GAP_METHODS,
+    SEGMENT_LENGTH,
+    TOP_FREQUENCIES,
+    compute_spectrum,
+)
+from time_index import INDEX_EVERY, build_time_index, index_path
+from util import (
+    date_string,
+    get_summaries_per_df,
+    resolve_data_files,
+    sensor_name,
+    use_query_bounds,
+)
 
 
 this_dir = dirpath = Path(__file__).resolve().parent
 
+def with_dataset_bounds(func):
+    '''
+    Run an analysis command with its queries validated against the bounds of
+    the data file's metadata manifest (if it has one). Time and sensor ranges
+    which are not given default to those bounds.
+    '''
+    @wraps(func)
+    def run(ns: Namespace):
+        time_bounds, sensor_bounds = dataset_bounds(this_dir / ns.file_path)
+        defaults = {
+            'time_start': time_bounds[0],
+            'time_end': time_bounds[1],
+            'sensor_start': sensor_bounds[0],
+            'sensor_end': sensor_bounds[1],
+        }
+        for name, value in defaults.items():
+            if getattr(ns, name, value) is None:
+                setattr(ns, name, value)
+
+        with use_query_bounds(time_bounds, sensor_bounds):
+            return func(ns)
+    return run
+
+@with_dataset_bounds
 def generate_summary(ns: Namespace):
-    data, time_taken = summarise_file(
+    summary_args = dict(
+        method = ns.method,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
+        no_clean = ns.no_clean,
+        parallel_read = ns.parallel_read,
+        where = ns.where,
+        checkpoint_dir = this_dir / CHECKPOINT_DIR
+            if ns.checkpoint or ns.resume else None,
+        resume = ns.resume,
+        gaps = ns.gaps,
+    )
+
+    if (ns.checkpoint or ns.resume) and (ns.group_by_status
+            or ns.sample is not None or ns.max_error is not None):
+        raise ValueError(
+            'Only exact, ungrouped summaries can be checkpointed.'
+        )
+    if ns.gaps and (ns.group_by_status
+            or ns.sample is not None or ns.max_error is not None):
+        raise ValueError('Gaps can only be profiled in exact, ungrouped summaries.')
+
+    if ns.group_by_status:
+        generate_status_summary(ns)
+        return
+    if ns.sample is not None or ns.max_error is not None:
+        generate_sampled_summary(ns)
+        return
+
+    # If an output file was requested, stream each result
+    # straight to it instead of formatting it for display.
+    if ns.output is not None:
+        output_format, output_path = ns.output
+        with get_result_writer(output_format, this_dir / output_path) as writer:
+            _, time_taken = summarise_file(
+                this_dir / ns.file_path,
+                on_result = writer.write,
+                **summary_args,
+            )
+        logger.result(
+            f'Wrote {writer.num_written} sensor summaries to'
+            f' "{writer.file_path}".\n\rProcessing took {time_taken:.3f}'
+            ' seconds.'
+        )
+        return
+
+    data, time_taken = summarise_file(this_dir / ns.file_path, **summary_args)
+    for df in data:
+        logger.result(f'{df}\n\n')
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.')
+
+def generate_status_summary(ns: Namespace):
+    if ns.where:
+        raise ValueError('Filters cannot be combined with --group-by-status.')
+
+    statuses, results, time_taken = summarise_by_status(
         this_dir / ns.file_path,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
         method = ns.method,
+    )
+
+    if ns.output is not None:
+        output_format, output_path = ns.output
+        with get_result_writer(output_format, this_dir / output_path) as writer:
+            for index, descriptions in enumerate(results):
+                sensor = sensor_name(ns.sensor_start + index)
+                for status, description in zip(statuses, descriptions):
+                    writer.write(f'{sensor}:{status}', description)
+        logger.result(
+            f'Wrote {writer.num_written} sensor summaries to'
+            f' "{writer.file_path}".\n'
+        )
+    else:
+        for df in collate_grouped_results(
+            statuses, results, ns.sensor_start, get_summaries_per_df(),
+        ):
+            logger.result(f'{df}\n\n')
+
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.')
+
+def generate_sampled_summary(ns: Namespace):
+    if ns.sample is not None and ns.max_error is not None:
+        raise ValueError('Only one of --sample and --max-error can be given.')
+    if ns.where or ns.group_by_status or ns.parallel_read:
+        raise ValueError(
+            'Sampled summaries cannot be combined with --where,'
+            ' --group-by-status or --parallel-read.'
+        )
+
+    estimates, lows, highs, fraction, error, time_taken = sample_summary(
+        this_dir / ns.file_path,
         time_range = (ns.time_start, ns.time_end),
         sensor_range = (ns.sensor_start, ns.sensor_end),
         no_clean = ns.no_clean,
+        fraction = ns.sample,
+        max_error = ns.max_error,
     )
-    # Clean this up
-    data_str = "\n\n".join([str(df) for df in data])
-    logger.log(f'{data_str}\n\r\n\rProcessing took {time_taken:.3f} seconds.')
+    groups = ['estimate', 'low', 'high']
+    results = [list(result) for result in zip(estimates, lows, highs)]
+
+    if ns.output is not None:
+        output_format, output_path = ns.output
+        with get_result_writer(output_format, this_dir / output_path) as writer:
+            for index, descriptions in enumerate(results):
+                sensor = sensor_name(ns.sensor_start + index)
+                for group, description in zip(groups, descriptions):
+                    writer.write(f'{sensor}:{group}', description)
+        logger.result(
+            f'Wrote {writer.num_written} sensor summaries to'
+            f' "{writer.file_path}".\n'
+        )
+    else:
+        for df in collate_grouped_results(
+            groups, results, ns.sensor_start, get_summaries_per_df(),
+        ):
+            logger.result(f'{df}\n\n')
 
+    logger.result(
+        f'\rEstimated from {fraction:.2%} of rows, with 95% confidence'
+        f' intervals (largest relative error {error:.3g}).\n'
+        f'Processing took {time_taken:.3f} seconds.'
+    )
+
+@with_dataset_bounds
 def benchmark_summary(ns: Namespace):
-    bench_analysis, time_taken_ext, time_taken_int = benchmark(
+    if ns.compare_affinity:
+        benchmark_placements(ns)
+        return
+
+    (
+        bench_analysis, phase_analysis, time_taken_int, time_taken_ext,
+        pipeline_copies,
+    ) = benchmark(
         this_dir / ns.file_path,
         method = ns.method,
         time_range = (ns.time_start, ns.time_end),
         sensor_range = (ns.sensor_start, ns.sensor_end),
         times = ns.ntimes,
         no_clean = ns.no_clean,
+        parallel_read = ns.parallel_read,
+        measure_pipelines = ns.compare_pipelines,
     )
-    logger.log(f'''
+    logger.result(f'''
 Benchmarking results:
 
+Worker placement: {current_placement().describe()}
 External recorded time (entire test): {time_taken_ext:.3f}
 Internal recorded time (entire test): {time_taken_int:.3f}
 Internal time analysis:
 {bench_analysis}
+
+Phase timing breakdown (seconds):
+{phase_analysis.to_string()}
+''')
+
+    if pipeline_copies is not None:
+        logger.result(f'''
+Selection pipeline (bytes copied per stage):
+{pipeline_copies.to_string(index=False)}
+''')
+
+def benchmark_placements(ns: Namespace):
+    # Compare unpinned workers with the placement requested,
+    # or with workers spread across NUMA nodes by default.
+    pinned = current_placement()
+    if pinned.cpu_sets is None:
+        pinned = make_placement(ns.workers, 'spread')
+    placements = [Placement(ns.workers), pinned]
+
+    rows = []
+    for worker_placement in placements:
+        with use_placement(worker_placement):
+            bench_analysis, _, _, _, _ = logger.log_task(
+                f'Benchmarking with {worker_placement.mode} placement... '
+            )(benchmark)(
+                this_dir / ns.file_path,
+                method = ns.method,
+                time_range = (ns.time_start, ns.time_end),
+                sensor_range = (ns.sensor_start, ns.sensor_end),
+                times = ns.ntimes,
+                no_clean = ns.no_clean,
+                parallel_read = ns.parallel_read,
+            )
+        rows.append({
+            'placement': worker_placement.mode,
+            'mean (s)': bench_analysis['mean'],
+            'std (s)': bench_analysis['std'],
+            'cv': bench_analysis['std'] / bench_analysis['mean'],
+            'min (s)': bench_analysis['min'],
+            'max (s)': bench_analysis['max'],
+            'runs/s': 1 / bench_analysis['mean'],
+        })
+
+    descriptions = '\n'.join(
+        f'  {worker_placement.mode}: {worker_placement.describe()}'
+        for worker_placement in placements
+    )
+    logger.result(f'''
+Placement comparison ({ns.ntimes} runs each):
+
+{DataFrame(rows).to_string(index=False)}
+
+Worker placements:
+{descriptions}
+''')
+
+def benchmark_read(ns: Namespace):
+    results = read_benchmark(
+        this_dir / ns.file_path,
+        method = ns.method,
+        times = ns.ntimes,
+    )
+    logger.result(f'''
+Ingestion benchmark results (fastest of {ns.ntimes} runs):
+
+{results.to_string(index=False)}
+''')
+
+    if ns.compressed:
+        results = logger.log_task('Benchmarking compressed input... ')\
+            (compression_benchmark)(
+                this_dir / ns.file_path,
+                method = ns.method,
+                times = ns.ntimes,
+            )
+        logger.result(f'''
+Compressed input benchmark results (fastest of {ns.ntimes} runs):
+
+{results.to_string(index=False)}
+''')
+
+@with_dataset_bounds
+def generate_multi_summary(ns: Namespace):
+    file_path = this_dir / ns.file_path
+    specs = load_query_specs(this_dir / ns.queries)
+    results, time_taken = summarise_queries(
+        file_path, specs, method=ns.method, no_clean=ns.no_clean,
+    )
+
+    if ns.output is not None:
+        # Results are labelled with the query number as well
+        # as the sensor, since sensors repeat across queries.
+        output_format, output_path = ns.output
+        with get_result_writer(output_format, this_dir / output_path) as writer:
+            for number, (spec, query_results) in enumerate(zip(specs, results)):
+                for sensor, description in zip(spec.sensors, query_results):
+                    writer.write(f'{number}:{sensor_name(sensor)}', description)
+        logger.result(
+            f'Wrote {writer.num_written} sensor summaries to'
+            f' "{writer.file_path}".\n'
+        )
+    else:
+        for number, (spec, query_results) in enumerate(zip(specs, results)):
+            logger.result(
+                f'Query {number}: {spec.time_start} to {spec.time_end},'
+                f' {sensor_name(spec.sensor_start)} to'
+                f' {sensor_name(spec.sensor_end)}\n\n'
+            )
+            for df in collate_results(
+                query_results, spec.sensor_start, spec.sensor_end,
+                get_summaries_per_df(),
+            ):
+                logger.result(f'{df}\n\n')
+
+    logger.result(
+        f'\rProcessing {len(specs)} queries in one shared scan took'
+        f' {time_taken:.3f} seconds.\n'
+    )
+
+    if ns.compare:
+        separate_results, separate_time = logger.log_task(
+            'Running each query separately for comparison... '
+        )(summarise_queries_separately)(
+            file_path, specs, method=ns.method, no_clean=ns.no_clean,
+        )
+        logger.result(f'''
+Separate queries took {separate_time:.3f} seconds ({separate_time / time_taken:.2f}x the shared scan).
+Largest difference between results: {max_difference(results, separate_results):.3g}
 ''')
 
+@with_dataset_bounds
+def find_episodes(ns: Namespace):
+    table, per_episode, combined, time_taken = summarise_episodes(
+        this_dir / ns.file_path,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
+        method = ns.method,
+        hours_before = ns.hours_before,
+        hours_failure = ns.hours_failure,
+        hours_after = ns.hours_after,
+    )
+
+    if ns.output is not None:
+        # Each result is labelled with its sensor, window and
+        # episode number, or `all` for the combined results.
+        output_format, output_path = ns.output
+        with get_result_writer(output_format, this_dir / output_path) as writer:
+            for index, sensor_results in enumerate(per_episode):
+                sensor = sensor_name(ns.sensor_start + index)
+                for window_index, window in enumerate(EPISODE_WINDOWS):
+                    writer.write(
+                        f'{sensor}:{window}:all',
+                        combined[index][window_index],
+                    )
+                    for number, descriptions in enumerate(sensor_results):
+                        writer.write(
+                            f'{sensor}:{window}:{number}',
+                            descriptions[window_index],
+                        )
+        logger.result(
+            f'Wrote {writer.num_written} sensor summaries to'
+            f' "{writer.file_path}".\n'
+        )
+    else:
+        logger.result(f'Failure episodes:\n{table.to_string()}\n\n')
+        logger.result('Sensor summaries over all episodes:\n\n')
+        for df in collate_grouped_results(
+            EPISODE_WINDOWS, combined, ns.sensor_start, get_summaries_per_df(),
+        ):
+            logger.result(f'{df}\n\n')
+
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.')
+
+@with_dataset_bounds
+def compute_rolling(ns: Namespace):
+    table, time_taken = rolling_statistics(
+        this_dir / ns.file_path,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
+        method = ns.method,
+        no_clean = ns.no_clean,
+        windows = ns.windows,
+        every = ns.every,
+    )
+
+    if ns.output is not None:
+        output_format, output_path = ns.output
+        logger.log_task('Writing rolling statistics... ')\
+            (write_table)(table, output_format, this_dir / output_path)
+        logger.result(
+            f'Wrote {len(table)} rows of rolling statistics to'
+            f' "{this_dir / output_path}".\n'
+        )
+    else:
+        # Long tables are shortened by pandas for display.
+        logger.result(f'{table}\n\n')
+
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.')
+
+@with_dataset_bounds
+def compute_correlation(ns: Namespace):
+    matrix, time_taken, pandas_time, max_difference = correlate(
+        this_dir / ns.file_path,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
+        method = ns.method,
+        no_clean = ns.no_clean,
+        compare = ns.compare,
+    )
+
+    if ns.output is not None:
+        output_format, output_path = ns.output
+        logger.log_task('Writing correlation matrix... ')(write_table)(
+            matrix.rename_axis('sensor').reset_index(),
+            output_format,
+            this_dir / output_path,
+        )
+        logger.result(
+            f'Wrote the correlation matrix to "{this_dir / output_path}".\n'
+        )
+    else:
+        logger.result(f'{matrix}\n\n')
+
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.\n')
+    if ns.compare:
+        logger.result(
+            f'DataFrame.corr() took {pandas_time:.3f} seconds'
+            f' ({pandas_time / time_taken:.2f}x). Largest difference between'
+            f' results: {max_difference:.3g}\n'
+        )
+
+@with_dataset_bounds
+def compute_spectra(ns: Namespace):
+    table, spectra, time_taken = compute_spectrum(
+        this_dir / ns.file_path,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
+        method = ns.method,
+        no_clean = ns.no_clean,
+        segment = ns.segment,
+        gaps = ns.gaps,
+        top = ns.top,
+    )
+
+    logger.result(
+        f'Dominant frequencies (Hz):\n{table.to_string(index=False)}\n\n'
+    )
+    if ns.output is not None:
+        output_format, output_path = ns.output
+        logger.log_task('Writing power spectra... ')\
+            (write_table)(spectra, output_format, this_dir / output_path)
+        logger.result(
+            f'Wrote the power spectra of {spectra.shape[1] - 1} sensors to'
+            f' "{this_dir / output_path}".\n'
+        )
+
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.')
+
+@with_dataset_bounds
+def compute_extremes(ns: Namespace):
+    extremes, excursions, time_taken, compare_times, matches = find_extremes(
+        this_dir / ns.file_path,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
+        method = ns.method,
+        no_clean = ns.no_clean,
+        k = ns.top,
+        above = ns.above,
+        below = ns.below,
+        compare = ns.compare,
+    )
+
+    if ns.output is not None:
+        # Excursions are written next to the extremes.
+        output_format, output_path = ns.output
+        output_path = this_dir / output_path
+        excursions_path = output_path.with_stem(
+            f'{output_path.stem}-excursions',
+        )
+        logger.log_task('Writing extremes... ')\
+            (write_table)(extremes, output_format, output_path)
+        if len(excursions) > 0:
+            logger.log_task('Writing excursions... ')\
+                (write_table)(excursions, output_format, excursions_path)
+        logger.result(
+            f'Wrote the extremes to "{output_path}"'
+            + (f' and the excursions to "{excursions_path}"'
+                if len(excursions) > 0 else '')
+            + '.\n'
+        )
+    else:
+        logger.result(f'Extremes:\n{extremes.to_string(index=False)}\n\n')
+        if len(excursions) > 0:
+            logger.result(
+                f'Excursions:\n{excursions.to_string(index=False)}\n\n'
+            )
+
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.\n')
+    if ns.compare:
+        partition_time, sort_time = compare_times
+        logger.result(
+            f'Finding the extremes by partitioning took'
+            f' {partition_time:.3f} seconds, and by sorting each column'
+            f' {sort_time:.3f} seconds ({sort_time / partition_time:.2f}x).'
+            f' Results {"match" if matches else "differ"}.\n'
+        )
+
+@with_dataset_bounds
+def compute_histograms(ns: Namespace):
+    if ns.output is not None and ns.output[0] not in HISTOGRAM_FORMATS:
+        raise ValueError(
+            f'Output format must be one of: {", ".join(HISTOGRAM_FORMATS)}.'
+        )
+
+    histograms, time_taken, numpy_time, matches = build_histograms(
+        this_dir / ns.file_path,
+        time_range = (ns.time_start, ns.time_end),
+        sensor_range = (ns.sensor_start, ns.sensor_end),
+        method = ns.method,
+        no_clean = ns.no_clean,
+        num_bins = ns.bins,
+        value_range = ns.range,
+        edges = ns.edges,
+        compare = ns.compare,
+    )
+
+    logger.result(
+        f'Histograms:\n{histograms.summary().to_string(index=False)}\n\n'
+    )
+    if ns.output is not None:
+        output_format, output_path = ns.output
+        logger.log_task('Writing histograms... ')\
+            (histograms.write)(output_format, this_dir / output_path)
+        logger.result(
+            f'Wrote the histograms of {len(histograms.sensors)} sensors to'
+            f' "{this_dir / output_path}".\n'
+        )
+
+    logger.result(f'\rProcessing took {time_taken:.3f} seconds.\n')
+    if ns.compare:
+        logger.result(
+            f'Computing the histograms with `np.histogram()` took'
+            f' {numpy_time:.3f} seconds ({numpy_time / time_taken:.2f}x).'
+            f' Results {"match" if matches else "differ"}.\n'
+        )
+
+def configure_logging(ns: Namespace):
+    if ns.level is not None:
+        logger.set_level(LOG_LEVELS[ns.level])
+
+    # Close any log files before opening new ones.
+    file_sinks = [
+        sink for sink in logger.get_sinks()
+        if isinstance(sink, logger.FileSink)
+    ]
+    if ns.close or ns.file is not None or ns.json is not None:
+        for sink in file_sinks:
+            logger.remove_sink(sink)
+        file_sinks = []
+
+    if ns.file is not None:
+        file_sinks.append(logger.FileSink(this_dir / ns.file))
+        logger.add_sink(file_sinks[-1])
+    if ns.json is not None:
+        file_sinks.append(logger.JSONSink(this_dir / ns.json))
+        logger.add_sink(file_sinks[-1])
+
+    names = [
+        f'"{sink.file_path}" ({type(sink).__name__})' for sink in file_sinks
+    ]
+    return (
+        f'Logging level: {logger.LEVEL_NAMES[logger.get_level()]}.'
+        f' Log files: {", ".join(names) if names else "none"}.'
+    )
+
+def build_index(ns: Namespace):
+    file_path = this_dir / ns.file_path
+    index = logger.log_task('Building timestamp index... ')\
+        (build_time_index)(file_path, ns.every)
+    logger.result(
+        f'Indexed {len(index.offsets)} rows (one every {index.every}) of'
+        f' "{file_path}" in "{index_path(file_path)}".'
+    )
+
+def build_meta(ns: Namespace):
+    for file_path in resolve_data_files(this_dir / ns.file_path):
+        metadata = logger.log_task(f'Scanning "{file_path}"... ')\
+            (build_metadata)(file_path)
+        logger.result(
+            f'Recorded {metadata.rows} rows, sensors'
+            f' {metadata.sensor_range[0]} to {metadata.sensor_range[1]}, from'
+            f' {metadata.time_range[0]} to {metadata.time_range[1]} in'
+            f' "{metadata_path(file_path)}".'
+        )
+
+def build_store(ns: Namespace):
+    file_path = this_dir / ns.file_path
+    directory = logger.log_task('Building block store... ')\
+        (build_block_store)(file_path, ns.block_size)
+    logger.result(f'Saved block store of "{file_path}" in "{directory}".')
+
+# Arguments shared by the analysis commands, named so that each command can
+# pick the ones it takes.
+ARG_FILE = (
+    ['-f', '--file-path'],
+    {
+        'action': 'store',
+        'help': 'The relative path of the file to analyse. Defaults'
+                    ' to the sensor time-series file.',
+        'default': './sensor_timeseries.csv',
+        'type': Path,
+    },
+)
+
+ARG_SENSOR_START = (
+    ['-ss', '--sensor-start'],
+    {
+        'action': 'store',
+        'help': 'The sensor number to start at. Defaults to the first'
+                    ' sensor in the data file\'s metadata manifest (see'
+                    ' `build-meta`), or 0.',
+        'default': None,
+        'type': int,
+    },
+)
+
+ARG_SENSOR_END = (
+    ['-se', '--sensor-end'],
+    {
+        'action': 'store',
+        'help': 'The sensor number to stop at. Defaults to the last'
+                    ' sensor in the data file\'s metadata manifest, or'
+                    ' 51.',
+        'default': None,
+        'type': int,
+    },
+)
+
+ARG_TIME_START = (
+    ['-ts', '--time-start'],
+    {
+        'action': 'store',
+        'help': 'The time to start at. Defaults to the first'
+                        ' timestamp in the data file\'s metadata'
+                        ' manifest, or "2018-04-01 00:00:00".',
+        'default': None,
+        'type': date_string,
+    },
+)
+
+ARG_TIME_END = (
+    ['-te', '--time-end'],
+    {
+        'action': 'store',
+        'help': 'The time to stop at. Defaults to the last'
+                        ' timestamp in the data file\'s metadata'
+                        ' manifest, or "2018-08-31 23:59:00".',
+        'default': None,
+        'type': date_string,
+    },
+)
+
+ARG_METHOD = (
+    ['-m', '--method'],
+    {
+        'action': 'store',
+        'help': 'The method to use when executing the'
+                        ' tasks. Can be either "process" or'
+                        ' "thread". Defaults to "process".',
+        'default': 'process',
+        'choices': [
+            'process',
+            'thread',
+            'sync',
+        ]
+    },
+)
+
+ARG_NO_CLEAN = (
+    ['-nc', '--no-clean'],
+    {
+        'action': 'store_true',
+        'help': 'Do not clean the dataframe of the inalid rows.',
+    },
+)
+
+ARG_PARALLEL_READ = (
+    ['-pr', '--parallel-read'],
+    {
+        'action': 'store_true',
+        'help': 'Split a single data file into byte ranges which are'
+                    ' read and summarised in parallel.',
+    },
+)
+
+ARG_QUIET = (
+    ['-qt', '--quiet'],
+    {
+        'action': 'store_true',
+        'help': 'Only log results, warnings and errors, so that no'
+                    ' progress output is written while work is timed.',
+    },
+)
+
+ARG_WORKERS = (
+    ['-wk', '--workers'],
+    {
+        'action': 'store',
+        'help': 'The number of workers to use. Defaults to an equal share'
+                    ' of the CPUs between running commands.',
+        'type': int,
+    },
+)
+
+ARG_AFFINITY = (
+    ['-af', '--affinity'],
+    {
+        'action': 'store',
+        'help': 'Pin workers to CPUs: `compact` (one core each, filling'
+                    ' each NUMA node in turn), `spread` (one core each,'
+                    ' alternating between nodes), `nodes` (one node'
+                    ' each), or a CPU list such as `0,2,4-7`. Defaults'
+                    ' to `none`.',
+        'type': affinity_string,
+    },
+)
+
+# The data file, and the sensor and time ranges to analyse.
+RANGE_ARGS = [
+    ARG_FILE,
+    ARG_SENSOR_START,
+    ARG_SENSOR_END,
+    ARG_TIME_START,
+    ARG_TIME_END,
+]
+
+# Arguments shared by all of the analysis commands.
+ANALYSIS_ARGS = RANGE_ARGS + [
+    ARG_METHOD,
+    ARG_NO_CLEAN,
+    ARG_PARALLEL_READ,
+    ARG_QUIET,
+    ARG_WORKERS,
+    ARG_AFFINITY,
+]
+
+# Streamed machine-readable output of the summary commands.
+ARG_OUTPUT = (
+    ['-o', '--output'],
+    {
+        'action': 'store',
+        'help': 'Write the results to PATH in a machine-readable'
+                    f' FORMAT ({", ".join(OUTPUT_FORMATS)}) as each'
+                    ' one completes, instead of displaying them.',
+        'nargs': 2,
+        'metavar': ('FORMAT', 'PATH'),
+        'default': None,
+    }
+)
+
 REG_generate_summary = (
     'summary',
     generate_summary,
     'Generate a summary of the data file specified.',
-    [
+    ANALYSIS_ARGS + [
+        ARG_OUTPUT,
         (
-            ['-f', '--file-path'],
+            ['-w', '--where'],
             {
-                'action': 'store',
-                'help': 'The relative path of the file to analyse. Defaults'
-                            ' to the sensor time-series file.',
-                'default': './sensor_timeseries.csv',
-                'type': Path,
-            },
+                'action': 'append',
+                'help': 'Only summarise rows matching a filter such as'
+                            ' "sensor_04 > 600". May be given more than once;'
+                            ' rows must match every filter. Faster with a'
+                            ' block store (see `build-store`).',
+                'type': parse_predicate,
+            }
         ),
         (
-            ['-ss', '--sensor-start'],
+            ['-gp', '--gaps'],
             {
-                'action': 'store',
-                'help': 'The sensor number to start at. Defaults to 0.',
-                'default': '0',
-                'type': int,
-            },
+                'action': 'store_true',
+                'help': 'Also profile each sensor\'s missing data: the'
+                            ' fraction of null readings, the number of gaps'
+                            ' (runs of nulls), the longest gap and when it'
+                            ' started, and the median interval between'
+                            ' readings. Durations are in seconds.',
+            }
         ),
         (
-            ['-se', '--sensor-end'],
+            ['-g', '--group-by-status'],
             {
-                'action': 'store',
-                'help': 'The sensor number to stop at. Defaults to 51.',
-                'default': '51',
-                'type': int,
-            },
+                'action': 'store_true',
+                'help': 'Summarise each sensor separately for every machine'
+                            ' status, side by side. Rows are not cleaned.',
+            }
         ),
         (
-            ['-ts', '--time-start'],
+            ['-ck', '--checkpoint'],
             {
-                'action': 'store',
-                'help': 'The time to start at. Defaults to'
-                                ' "2018-04-01 00:00:00".',
-                'default': '2018-04-01 00:00:00',
-                'type': date_string,
-            },
+                'action': 'store_true',
+                'help': 'Save progress as each file (or byte range of a'
+                            ' single file) is summarised, so that the'
+                            ' summary can be resumed with --resume if it is'
+                            ' interrupted. State is kept in'
+                            f' `{CHECKPOINT_DIR}`.',
+            }
         ),
         (
-            ['-te', '--time-end'],
+            ['-rs', '--resume'],
             {
-                'action': 'store',
-                'help': 'The time to stop at. Defaults to'
-                                ' "2018-08-31 23:59:00".',
-                'default': '2018-08-31 23:59:00',
-                'type': date_string,
-            },
+                'action': 'store_true',
+                'help': 'Continue an interrupted checkpointed summary from'
+                            ' its last checkpoint, and keep checkpointing.',
+            }
         ),
         (
-            ['-m', '--method'],
+            ['-sp', '--sample'],
             {
                 'action': 'store',
-                'help': 'The method to use when executing the'
-                                ' tasks. Can be either "process" or'
-                                ' "thread". Defaults to "process".',
-                'default': 'process',
-                'choices': [
-                    'process',
-                    'thread',
-                    'sync',
-                ]
-            },
+                'help': 'Estimate the summary, with 95%% confidence intervals,'
+                            ' from a time-stratified sample of this fraction'
+                            ' of the rows (e.g. `0.05`), instead of'
+                            ' summarising every row.',
+                'metavar': 'FRACTION',
+                'type': float,
+            }
         ),
         (
-            ['-nc', '--no-clean'],
+            ['-me', '--max-error'],
             {
-                'action': 'store_true',
-                'help': 'Do not clean the dataframe of the inalid rows.',
-            },
+                'action': 'store',
+                'help': 'Estimate the summary from a sample which is grown'
+                            ' until every confidence interval\'s half-width'
+                            ' is at most E times the sensor\'s standard'
+                            ' deviation (or, for counts, the count).',
+                'metavar': 'E',
+                'type': float,
+            }
         ),
     ],
 )
@@ -124,7 +887,7 @@ REG_bench_summary = (
     'summary-bench',
     benchmark_summary,
     'Benchmark the data analysis program and provide analysis of the results.',
-    REG_generate_summary[3] + [(
+    ANALYSIS_ARGS + [(
         ['-n', '--ntimes'],
         {
             'action': 'store',
@@ -132,10 +895,527 @@ REG_bench_summary = (
             'default': '10',
             'type': int,
         }
+    ), (
+        ['-ca', '--compare-affinity'],
+        {
+            'action': 'store_true',
+            'help': 'Run the benchmark with unpinned workers and with pinned'
+                        ' workers (as set by --affinity, or `spread`), and'
+                        ' compare their throughput and variance.',
+        }
+    ), (
+        ['-cp', '--compare-pipelines'],
+        {
+            'action': 'store_true',
+            'help': 'Also measure the bytes copied by each stage of'
+                        ' selecting the data from a single file, with and'
+                        ' without planning the selection.',
+        }
     )],
 )
 
+REG_bench_read = (
+    'read-bench',
+    benchmark_read,
+    'Benchmark CSV ingestion throughput of the serial and parallel readers.',
+    [
+        ARG_FILE,
+        ARG_METHOD,
+        ARG_QUIET,
+        (
+            ['-n', '--ntimes'],
+            {
+                'action': 'store',
+                'help': 'The number of times to read the file with each'
+                            ' reader. Defaults to `3`.',
+                'default': '3',
+                'type': int,
+            }
+        ),
+        (
+            ['-c', '--compressed'],
+            {
+                'action': 'store_true',
+                'help': 'Also compare summarising the file with summarising'
+                            ' gzip, BGZF and zstd compressed copies of it.',
+            }
+        ),
+    ],
+)
+
+REG_multi_summary = (
+    'summary-multi',
+    generate_multi_summary,
+    'Run many summary queries over one data file with a single shared scan.',
+    [
+        ARG_FILE,
+        (
+            ['-q', '--queries'],
+            {
+                'action': 'store',
+                'help': 'The relative path of a JSON or CSV file listing the'
+                            ' queries, each with a `time_start`, `time_end`,'
+                            ' `sensor_start` and `sensor_end`.',
+                'required': True,
+                'type': Path,
+            }
+        ),
+        ARG_METHOD,
+        ARG_NO_CLEAN,
+        ARG_QUIET,
+        ARG_OUTPUT,
+        (
+            ['-c', '--compare'],
+            {
+                'action': 'store_true',
+                'help': 'Also run each query separately, and compare the'
+                            ' time taken and results.',
+            }
+        ),
+    ],
+)
+
+REG_episodes = (
+    'episodes',
+    find_episodes,
+    'Find failure episodes (runs of BROKEN then RECOVERING rows) and'
+        ' summarise each sensor before, during and after the failures.',
+    RANGE_ARGS + [
+        ARG_METHOD,
+        ARG_QUIET,
+        (
+            ['-hb', '--hours-before'],
+            {
+                'action': 'store',
+                'help': 'The length of the pre-failure window, in hours.'
+                            f' Defaults to `{HOURS_BEFORE:g}`.',
+                'default': str(HOURS_BEFORE),
+                'type': float,
+            }
+        ),
+        (
+            ['-hf', '--hours-failure'],
+            {
+                'action': 'store',
+                'help': 'Only summarise the first HOURS of each failure as'
+                            ' the in-failure window. Defaults to the whole'
+                            ' run of BROKEN rows.',
+                'metavar': 'HOURS',
+                'default': None,
+                'type': float,
+            }
+        ),
+        (
+            ['-ha', '--hours-after'],
+            {
+                'action': 'store',
+                'help': 'Summarise the HOURS after each failure ends (up to'
+                            ' the next failure) as the recovery window.'
+                            ' Defaults to the run of RECOVERING rows.',
+                'metavar': 'HOURS',
+                'default': None,
+                'type': float,
+            }
+        ),
+        (
+            ['-o', '--output'],
+            {
+                'action': 'store',
+                'help': 'Write the summaries of each window of each episode'
+                            ' to PATH in a machine-readable FORMAT'
+                            f' ({", ".join(OUTPUT_FORMATS)}), instead of'
+                            ' displaying the combined summaries.',
+                'nargs': 2,
+                'metavar': ('FORMAT', 'PATH'),
+                'default': None,
+            }
+        ),
+    ],
+)
+
+REG_rolling = (
+    'rolling',
+    compute_rolling,
+    'Compute rolling mean, standard deviation, minimum and maximum of each'
+        ' sensor over time-based windows.',
+    RANGE_ARGS + [
+        ARG_METHOD,
+        ARG_NO_CLEAN,
+        ARG_QUIET,
+        (
+            ['-w', '--windows'],
+            {
+                'action': 'store',
+                'help': 'The window lengths, e.g. `10min 1h 1D`. Defaults'
+                            f' to `{" ".join(ROLLING_WINDOWS)}`.',
+                'nargs': '+',
+                'default': ROLLING_WINDOWS,
+                'type': duration_string,
+            }
+        ),
+        (
+            ['-e', '--every'],
+            {
+                'action': 'store',
+                'help': 'Only output the statistics at the last row of each'
+                            ' interval of this length, or at every row if'
+                            f' `0`. Defaults to `{ROLLING_EVERY}`.',
+                'default': ROLLING_EVERY,
+                'type': interval_string,
+            }
+        ),
+        (
+            ['-o', '--output'],
+            {
+                'action': 'store',
+                'help': 'Write the statistics to PATH in a machine-readable'
+                            f' FORMAT ({", ".join(OUTPUT_FORMATS)}) instead'
+                            ' of displaying them.',
+                'nargs': 2,
+                'metavar': ('FORMAT', 'PATH'),
+                'default': None,
+            }
+        ),
+    ],
+)
+
+REG_correlate = (
+    'correlate',
+    compute_correlation,
+    'Compute the pairwise-complete Pearson correlation matrix of the'
+        ' sensors.',
+    RANGE_ARGS + [
+        ARG_METHOD,
+        ARG_NO_CLEAN,
+        ARG_QUIET,
+        (
+            ['-o', '--output'],
+            {
+                'action': 'store',
+                'help': 'Write the matrix to PATH in a machine-readable'
+                            f' FORMAT ({", ".join(OUTPUT_FORMATS)}) instead'
+                            ' of displaying it.',
+                'nargs': 2,
+                'metavar': ('FORMAT', 'PATH'),
+                'default': None,
+            }
+        ),
+        (
+            ['-c', '--compare'],
+            {
+                'action': 'store_true',
+                'help': 'Also compute the matrix with `DataFrame.corr()`, and'
+                            ' compare the time taken and results.',
+            }
+        ),
+    ],
+)
+
+REG_spectrum = (
+    'spectrum',
+    compute_spectra,
+    'Estimate the power spectrum of each sensor with Welch\'s method, and'
+        ' find its dominant frequencies.',
+    RANGE_ARGS + [
+        ARG_METHOD,
+        ARG_NO_CLEAN,
+        ARG_QUIET,
+        (
+            ['-sg', '--segment'],
+            {
+                'action': 'store',
+                'help': 'The length of the segments averaged, e.g. `6h` or'
+                            ' `1D`. Longer segments resolve lower'
+                            f' frequencies. Defaults to `{SEGMENT_LENGTH}`.',
+                'default': SEGMENT_LENGTH,
+                'type': duration_string,
+            }
+        ),
+        (
+            ['-g', '--gaps'],
+            {
+                'action': 'store',
+                'help': 'How to handle missing readings: `interpolate` them'
+                            ' linearly, or `mask` them out. Defaults to'
+                            ' `interpolate`.',
+                'choices': GAP_METHODS,
+                'default': 'interpolate',
+            }
+        ),
+        (
+            ['-k', '--top'],
+            {
+                'action': 'store',
+                'help': 'The number of dominant frequencies to show per'
+                            f' sensor. Defaults to `{TOP_FREQUENCIES}`.',
+                'default': str(TOP_FREQUENCIES),
+                'type': int,
+            }
+        ),
+        (
+            ['-o', '--output'],
+            {
+                'action': 'store',
+                'help': 'Also write the full power spectra to PATH in a'
+                            ' machine-readable FORMAT'
+                            f' ({", ".join(OUTPUT_FORMATS)}).',
+                'nargs': 2,
+                'metavar': ('FORMAT', 'PATH'),
+                'default': None,
+            }
+        ),
+    ],
+)
+
+REG_extremes = (
+    'extremes',
+    compute_extremes,
+    'Find the largest and smallest readings of each sensor with their'
+        ' timestamps, and the excursions beyond thresholds.',
+    RANGE_ARGS + [
+        ARG_METHOD,
+        ARG_NO_CLEAN,
+        ARG_QUIET,
+        (
+            ['-k', '--top'],
+            {
+                'action': 'store',
+                'help': 'The number of largest and smallest readings to find'
+                            f' per sensor. Defaults to `{TOP_K}`.',
+                'default': str(TOP_K),
+                'type': int,
+            }
+        ),
+        (
+            ['-a', '--above'],
+            {
+                'action': 'append',
+                'help': 'Count excursions above a threshold, either for'
+                            ' every sensor (e.g. `600`) or for one sensor'
+                            ' (e.g. `sensor_04=600`). May be given more than'
+                            ' once.',
+                'metavar': 'THRESHOLD',
+                'type': threshold_string,
+            }
+        ),
+        (
+            ['-b', '--below'],
+            {
+                'action': 'append',
+                'help': 'Count excursions below a threshold, given as for'
+                            ' --above.',
+                'metavar': 'THRESHOLD',
+                'type': threshold_string,
+            }
+        ),
+        (
+            ['-o', '--output'],
+            {
+                'action': 'store',
+                'help': 'Write the extremes to PATH, and any excursions to'
+                            ' PATH with `-excursions` added to its name, in a'
+                            ' machine-readable FORMAT'
+                            f' ({", ".join(OUTPUT_FORMATS)}) instead of'
+                            ' displaying them.',
+                'nargs': 2,
+                'metavar': ('FORMAT', 'PATH'),
+                'default': None,
+            }
+        ),
+        (
+            ['-c', '--compare'],
+            {
+                'action': 'store_true',
+                'help': 'Also find the extremes by sorting each column, and'
+                            ' compare the time taken and results.',
+            }
+        ),
+    ],
+)
+
+REG_histogram = (
+    'histogram',
+    compute_histograms,
+    'Compute a histogram of the readings of each sensor, with equal-width'
+        ' bins over each sensor\'s range or a given range, or with given bin'
+        ' edges.',
+    RANGE_ARGS + [
+        ARG_METHOD,
+        ARG_NO_CLEAN,
+        ARG_QUIET,
+        (
+            ['-nb', '--bins'],
+            {
+                'action': 'store',
+                'help': 'The number of equal-width bins per sensor.'
+                            f' Defaults to `{NUM_BINS}`.',
+                'default': str(NUM_BINS),
+                'type': int,
+            }
+        ),
+        (
+            ['-r', '--range'],
+            {
+                'action': 'store',
+                'help': 'Space the bins between LOW and HIGH for every'
+                            ' sensor instead of over each sensor\'s range.'
+                            ' Readings outside the range are counted'
+                            ' separately.',
+                'nargs': 2,
+                'metavar': ('LOW', 'HIGH'),
+                'default': None,
+                'type': float,
+            }
+        ),
+        (
+            ['-e', '--edges'],
+            {
+                'action': 'store',
+                'help': 'The edges of the bins, in increasing order, for'
+                            ' every sensor. Overrides --bins and --range.',
+                'nargs': '+',
+                'metavar': 'EDGE',
+                'default': None,
+                'type': float,
+            }
+        ),
+        (
+            ['-o', '--output'],
+            {
+                'action': 'store',
+                'help': 'Also write every bin of every histogram to PATH in'
+                            f' FORMAT ({", ".join(HISTOGRAM_FORMATS)}): a'
+                            ' compressed NumPy archive, or a table with one'
+                            ' row per bin.',
+                'nargs': 2,
+                'metavar': ('FORMAT', 'PATH'),
+                'default': None,
+            }
+        ),
+        (
+            ['-c', '--compare'],
+            {
+                'action': 'store_true',
+                'help': 'Also compute the histograms with `np.histogram()`,'
+                            ' and compare the time taken and results.',
+            }
+        ),
+    ],
+)
+
+# Names of the levels which can be set with `logging`.
+LOG_LEVELS = {
+    'debug': logger.DEBUG,
+    'info': logger.INFO,
+    'result': logger.RESULT,
+    'warning': logger.WARNING,
+    'error': logger.ERROR,
+}
+
+REG_logging = (
+    'logging',
+    configure_logging,
+    'Show or change the logging level and log files.',
+    [
+        (
+            ['-l', '--level'],
+            {
+                'action': 'store',
+                'help': 'The minimum level of messages to log. `result`'
+                            ' only logs results, warnings and errors.',
+                'choices': list(LOG_LEVELS),
+            }
+        ),
+        (
+            ['--file'],
+            {
+                'action': 'store',
+                'help': 'Also write log messages to this plain text file,'
+                            ' replacing any current log files.',
+                'type': Path,
+            }
+        ),
+        (
+            ['--json'],
+            {
+                'action': 'store',
+                'help': 'Also write log messages to this JSON Lines file,'
+                            ' replacing any current log files.',
+                'type': Path,
+            }
+        ),
+        (
+            ['--close'],
+            {
+                'action': 'store_true',
+                'help': 'Stop writing to any log files.',
+            }
+        ),
+    ],
+)
+
+REG_build_index = (
+    'build-index',
+    build_index,
+    'Build a sparse timestamp index of a data file so that time-bounded'
+        ' analyses only read the rows they need.',
+    [
+        ARG_FILE,
+        (
+            ['-e', '--every'],
+            {
+                'action': 'store',
+                'help': 'The number of rows between index entries. Defaults'
+                            f' to `{INDEX_EVERY}`.',
+                'default': str(INDEX_EVERY),
+                'type': int,
+            }
+        ),
+    ],
+)
+
+REG_build_meta = (
+    'build-meta',
+    build_meta,
+    'Scan a data file (or each file of a dataset) and save a metadata'
+        ' manifest of its columns, types, bounds and missing values, used to'
+        ' parse and validate queries without type inference.',
+    [ARG_FILE],
+)
+
+REG_build_store = (
+    'build-store',
+    build_store,
+    'Build a zone-mapped columnar block store of a data file, used by'
+        ' filtered summaries.',
+    [
+        ARG_FILE,
+        (
+            ['-b', '--block-size'],
+            {
+                'action': 'store',
+                'help': 'The number of rows per block. Defaults to'
+                            f' `{BLOCK_SIZE}`.',
+                'default': str(BLOCK_SIZE),
+                'type': int,
+            }
+        ),
+    ],
+)
+
 commands = [
     REG_generate_summary,
     REG_bench_summary,
+    REG_bench_read,
+    REG_multi_summary,
+    REG_episodes,
+    REG_rolling,
+    REG_correlate,
+    REG_spectrum,
+    REG_extremes,
+    REG_histogram,
+    REG_build_index,
+    REG_build_store,
+    REG_build_meta,
+    REG_logging,
 ]
@@ -0,0 +1,530 @@
+'''
+Support for compressed data files (gzip and zstd). Files are decompressed
+incrementally rather than all at once, and files made up of independent
+frames (BGZF-style gzip, multi-frame zstd) can be decompressed in parallel.
+'''
+
+from dataclasses import dataclass
+from functools import partial
+from gzip import GzipFile, decompress as gzip_decompress, open as gzip_open
+from io import BytesIO
+from os import cpu_count
+from pathlib import Path
+from shutil import copyfileobj
+from struct import pack, unpack
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from zlib import DEFLATED, compressobj, crc32
+import tracemalloc
+
+from pandas import DataFrame, read_csv
+
+from aggregate import PartialSummary, merge_partials, summarise_rows
+from jobs import worker_share
+from metadata import dataset_bounds
+from util import (
+    create_executor,
+    get_executor_class,
+    shutdown_now,
+)
+
+
+# Leading bytes which identify each compression format.
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Number of rows parsed at a time when streaming a compressed file.
+CHUNK_ROWS = 50_000
+
+# Largest amount of data stored in a single BGZF block.
+BGZF_BLOCK_SIZE = 0xff00
+
+
+def _zstandard():
+    '''
+    Import the optional `zstandard` package, which is only needed for
+    zstd-compressed files.
+    '''
+    try:
+        import zstandard # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise ImportError(
+            'Reading zstd-compressed files requires the `zstandard` package.'
+        ) from exc
+    return zstandard
+
+def detect_compression(file_path: str | Path):
+    '''
+    Detect the compression format of a file from its leading bytes. Returns
+    `'gzip'`, `'zstd'` or `None` for uncompressed files.
+    '''
+    with open(file_path, 'rb') as file:
+        magic = file.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if magic == ZSTD_MAGIC:
+        return 'zstd'
+    return None
+
+def open_data_file(file_path: str | Path):
+    '''
+    Open a data file for reading in binary mode, decompressing it on the fly
+    if it is compressed.
+    '''
+    match detect_compression(file_path):
+        case 'gzip':
+            return GzipFile(file_path, 'rb')
+        case 'zstd':
+            return _zstandard().ZstdDecompressor().stream_reader(
+                open(file_path, 'rb'),
+                read_across_frames = True,
+                closefd = True,
+            )
+        case _:
+            return open(file_path, 'rb')
+
+
+@dataclass(frozen=True)
+class FrameRange:
+    '''
+    A run of whole, independently compressed frames within a compressed file,
+    from byte `start` up to (but not including) byte `end`.
+    '''
+    file_path: Path
+    codec: str
+    start: int
+    end: int
+
+
+def _gzip_member_sizes(file):
+    '''
+    Yield the size of each member of a BGZF-style gzip file, read from the
+    `BC` extra field of each member's header. Raises a `ValueError` at the
+    first member without one, since its size cannot be known without
+    decompressing it.
+    '''
+    while True:
+        header = file.read(12)
+        if len(header) == 0:
+            return
+        if len(header) < 12 or not header.startswith(GZIP_MAGIC)\
+                or not header[3] & 0x04:
+            raise ValueError('Not a BGZF member.')
+
+        # Search the extra subfields for the block size.
+        extra_length, = unpack('<H', header[10:12])
+        extra = file.read(extra_length)
+        size = None
+        position = 0
+        while position + 4 <= len(extra):
+            subfield_id = extra[position:position + 2]
+            subfield_length, = unpack('<H', extra[position + 2:position + 4])
+            if subfield_id == b'BC' and subfield_length == 2:
+                size, = unpack('<H', extra[position + 4:position + 6])
+                size += 1
+            position += 4 + subfield_length
+        if size is None:
+            raise ValueError('Not a BGZF member.')
+
+        file.seek(size - 12 - extra_length, 1)
+        yield size
+
+def _zstd_frame_sizes(file):
+    '''
+    Yield the size of each frame of a zstd file, by walking the frame and
+    block headers without decompressing anything.
+    '''
+    while True:
+        magic = file.read(4)
+        if len(magic) == 0:
+            return
+        magic_number, = unpack('<I', magic)
+
+        # Skippable frames state their own size.
+        if magic_number & 0xfffffff0 == 0x184d2a50:
+            frame_size, = unpack('<I', file.read(4))
+            file.seek(frame_size, 1)
+            yield 8 + frame_size
+            continue
+        if magic != ZSTD_MAGIC:
+            raise ValueError('Not a zstd frame.')
+
+        # Work out the size of the frame header from its
+        # descriptor byte.
+        descriptor = file.read(1)[0]
+        content_size_flag = descriptor >> 6
+        single_segment = (descriptor >> 5) & 1
+        has_checksum = (descriptor >> 2) & 1
+        dictionary_id_size = (0, 1, 2, 4)[descriptor & 3]
+        content_size_size = (single_segment, 2, 4, 8)[content_size_flag]
+        header_size = 1 + (not single_segment) + dictionary_id_size\
+            + content_size_size
+        file.seek(header_size - 1, 1)
+        frame_size = 4 + header_size
+
+        # Walk the blocks until the last one.
+        last_block = False
+        while not last_block:
+            block_header = int.from_bytes(file.read(3), 'little')
+            last_block = block_header & 1
+            block_type = (block_header >> 1) & 3
+            # RLE blocks store a single byte, whatever their size.
+            block_size = 1 if block_type == 1 else block_header >> 3
+            file.seek(block_size, 1)
+            frame_size += 3 + block_size
+
+        if has_checksum:
+            file.seek(4, 1)
+            frame_size += 4
+        yield frame_size
+
+def split_frame_ranges(file_path: str | Path, num_ranges: int):
+    '''
+    Split a compressed file into at most `num_ranges` runs of whole frames of
+    roughly equal compressed size, so that they can be decompressed in
+    parallel.
+
+    Returns `None` if the file cannot be split, i.e. if it is not compressed,
+    is a plain (non-BGZF) gzip file, or contains a single frame.
+    '''
+    file_path = Path(file_path)
+    codec = detect_compression(file_path)
+    if codec is None:
+        return None
+
+    frame_sizes = _gzip_member_sizes if codec == 'gzip' else _zstd_frame_sizes
+    try:
+        with open(file_path, 'rb') as file:
+            sizes = list(frame_sizes(file))
+    except (ValueError, IndexError):
+        return None
+    if len(sizes) < 2:
+        return None
+
+    # Group consecutive frames into ranges.
+    total = sum(sizes)
+    target = total / max(num_ranges, 1)
+    ranges = []
+    start = position = 0
+    for size in sizes:
+        position += size
+        if position - start >= target:
+            ranges.append(FrameRange(file_path, codec, start, position))
+            start = position
+    if position > start:
+        ranges.append(FrameRange(file_path, codec, start, position))
+
+    return ranges
+
+def decompress_frame_range(frame_range: FrameRange):
+    '''
+    Decompress a run of whole frames.
+    '''
+    with open(frame_range.file_path, 'rb') as file:
+        file.seek(frame_range.start)
+        data = file.read(frame_range.end - frame_range.start)
+
+    if frame_range.codec == 'gzip':
+        return gzip_decompress(data)
+
+    with _zstandard().ZstdDecompressor().stream_reader(
+            BytesIO(data), read_across_frames=True,
+        ) as reader:
+        return reader.read()
+
+def read_header(file_path: str | Path):
+    '''
+    Read the column names of a (possibly compressed) data file, decompressing
+    only as much as is needed.
+    '''
+    with open_data_file(file_path) as stream:
+        return tuple(read_csv(stream, nrows=0).columns)
+
+def summarise_lines(
+        data: bytes,
+        names: tuple[str, ...],
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+    ):
+    '''
+    Parse complete CSV lines (without a header) and summarise them, as
+    `aggregate.summarise_rows()` does.
+    '''
+    if data.strip() == b'':
+        num_sensors = sensor_range[1] - sensor_range[0] + 1
+        return [PartialSummary() for _ in range(num_sensors)], (0, 0)
+
+    df = read_csv(BytesIO(data), header=None, names=list(names))
+    return summarise_rows(df, time_range, sensor_range, no_clean)
+
+def summarise_frame_range(
+        frame_range: FrameRange,
+        names: tuple[str, ...],
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+    ):
+    '''
+    Decompress a run of frames and summarise the complete lines within it.
+
+    Frames do not respect line boundaries, so the bytes before the first line
+    break (`head`) and after the last one (`tail`) are returned for the caller
+    to stitch together with the neighbouring ranges. If the range contains no
+    line break at all, everything is returned as `head` and `tail` is `None`.
+
+    This is the function used by the subprocesses when decompressing frames
+    in parallel.
+    '''
+    data = decompress_frame_range(frame_range)
+
+    first_break = data.find(b'\n')
+    if first_break == -1:
+        return data, None, None
+    last_break = data.rfind(b'\n')
+
+    body = data[first_break + 1:last_break + 1]
+    summary = summarise_lines(body, names, time_range, sensor_range, no_clean)
+    return data[:first_break + 1], data[last_break + 1:], summary
+
+def stitch_frame_results(
+        results: list[tuple],
+        names: tuple[str, ...],
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+    ):
+    '''
+    Combine the results of `summarise_frame_range()` for consecutive ranges:
+    lines split across range boundaries are rebuilt and summarised, and all
+    partial summaries are merged.
+
+    Returns one merged `PartialSummary` per sensor and the number of broken
+    and recovering rows removed.
+    '''
+    summaries = []
+    boundary_lines = []
+    carry = b''
+    header_skipped = False
+    for head, tail, summary in results:
+        carry += head
+        if tail is None:
+            continue
+
+        # The first complete line of the file is the header.
+        if header_skipped:
+            boundary_lines.append(carry)
+        header_skipped = True
+        carry = tail
+        summaries.append(summary)
+
+    # The last line need not end with a line break.
+    boundary_lines.append(carry)
+    summaries.append(summarise_lines(
+        b''.join(boundary_lines), names, time_range, sensor_range, no_clean,
+    ))
+
+    merged = [
+        merge_partials([partials[index] for partials, _ in summaries])
+        for index in range(sensor_range[1] - sensor_range[0] + 1)
+    ]
+    removed = (
+        sum(removed[0] for _, removed in summaries),
+        sum(removed[1] for _, removed in summaries),
+    )
+    return merged, removed
+
+def summarise_stream(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+        chunk_rows: int = CHUNK_ROWS,
+    ):
+    '''
+    Summarise a (possibly compressed) data file by decompressing and parsing
+    it `chunk_rows` rows at a time, so the decompressed file is never held in
+    memory all at once.
+
+    Returns one merged `PartialSummary` per sensor and the number of broken
+    and recovering rows removed.
+    '''
+    num_sensors = sensor_range[1] - sensor_range[0] + 1
+    sensor_partials: list[list[PartialSummary]] = [
+        [] for _ in range(num_sensors)
+    ]
+    num_broken = num_recovering = 0
+
+    with open_data_file(file_path) as stream:
+        for chunk in read_csv(stream, chunksize=chunk_rows):
+            # Cleaning relies on rows being numbered from zero.
+            partials, (broken, recovering) = summarise_rows(
+                chunk.reset_index(drop=True),
+                time_range,
+                sensor_range,
+                no_clean,
+            )
+            for chunk_partials, partial in zip(sensor_partials, partials):
+                chunk_partials.append(partial)
+            num_broken += broken
+            num_recovering += recovering
+
+    # Each sensor's values are concatenated once, rather than
+    # at every chunk.
+    merged = [merge_partials(partials) for partials in sensor_partials]
+    return merged, (num_broken, num_recovering)
+
+def summarise_compressed(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+        method: str = 'process',
+        num_workers: int | None = None,
+    ):
+    '''
+    Summarise a compressed data file. Files made up of several independent
+    frames are split into frame ranges which are decompressed and summarised
+    in parallel using the method specified; other files are streamed.
+
+    Returns one merged `PartialSummary` per sensor, the number of broken and
+    recovering rows removed, and the number of frame ranges processed in
+    parallel (0 if the file was streamed).
+    '''
+    if num_workers is None:
+        num_workers = cpu_count() or 1
+
+    frame_ranges = split_frame_ranges(file_path, num_workers)
+    if frame_ranges is None:
+        merged, removed = summarise_stream(
+            file_path, time_range, sensor_range, no_clean,
+        )
+        return merged, removed, 0
+
+    names = read_header(file_path)
+    task = partial(
+        summarise_frame_range,
+        names = names,
+        time_range = time_range,
+        sensor_range = sensor_range,
+        no_clean = no_clean,
+    )
+
+    executor_class = get_executor_class(method)
+    if executor_class is None:
+        results = [task(frame_range) for frame_range in frame_ranges]
+    else:
+        # Use no more than this command's share of the
+        # session's workers, and stop them straight away on
+        # ^C.
+        executor = create_executor(method, min(num_workers, worker_share()))
+        try:
+            results = list(executor.map(task, frame_ranges))
+        except BaseException:
+            shutdown_now(executor)
+            raise
+        executor.shutdown()
+
+    merged, removed = stitch_frame_results(
+        results, names, time_range, sensor_range, no_clean,
+    )
+    return merged, removed, len(frame_ranges)
+
+def write_bgzf(source: str | Path, destination: str | Path):
+    '''
+    Compress a file as BGZF: a series of gzip members of at most
+    `BGZF_BLOCK_SIZE` bytes of input each, with each member's size recorded
+    in its header. The result is a valid gzip file which can also be split
+    into members without decompressing it.
+    '''
+    with open(source, 'rb') as source_file,\
+            open(destination, 'wb') as destination_file:
+        while block := source_file.read(BGZF_BLOCK_SIZE):
+            compressor = compressobj(9, DEFLATED, -15)
+            deflated = compressor.compress(block) + compressor.flush()
+
+            # Header (with a 6-byte extra field), data, trailer.
+            member_size = 18 + len(deflated) + 8
+            destination_file.write(
+                GZIP_MAGIC + b'\x08\x04' + b'\x00' * 4 + b'\x00\xff'
+                + pack('<H', 6) + b'BC' + pack('<HH', 2, member_size - 1)
+            )
+            destination_file.write(deflated)
+            destination_file.write(pack('<II', crc32(block), len(block)))
+
+def write_zstd_frames(
+        source: str | Path,
+        destination: str | Path,
+        frame_size: int = 1 << 20,
+    ):
+    '''
+    Compress a file as a series of independent zstd frames, each holding at
+    most `frame_size` bytes of input.
+    '''
+    compressor = _zstandard().ZstdCompressor()
+    with open(source, 'rb') as source_file,\
+            open(destination, 'wb') as destination_file:
+        while block := source_file.read(frame_size):
+            destination_file.write(compressor.compress(block))
+
+def compression_benchmark(
+        file_path: str | Path,
+        method: str = 'process',
+        times: int = 3,
+    ):
+    '''
+    Compare summarising a plain CSV data file with summarising compressed
+    copies of it: plain gzip (streamed), BGZF and, if `zstandard` is
+    installed, multi-frame zstd (both decompressed in parallel).
+
+    For each file, the fastest of `times` runs is recorded, along with the
+    throughput in uncompressed MB/s and the peak memory allocated in the main
+    process (measured in a separate run, since tracing slows allocation).
+    Every sensor is summarised over the whole time range, as given by the
+    file's metadata manifest (see `metadata.dataset_bounds()`).
+
+    Returns a `DataFrame` with one row per file.
+    '''
+    file_path = Path(file_path)
+    size_mb = file_path.stat().st_size / 1e6
+    arguments = (*dataset_bounds(file_path), False)
+
+    with TemporaryDirectory() as directory:
+        # Create the compressed copies.
+        copies = {'plain CSV': file_path}
+        copies['gzip'] = Path(directory) / f'{file_path.name}.gz'
+        with open(file_path, 'rb') as source,\
+                gzip_open(copies['gzip'], 'wb') as destination:
+            copyfileobj(source, destination)
+        copies['BGZF'] = Path(directory) / f'{file_path.name}.bgzf.gz'
+        write_bgzf(file_path, copies['BGZF'])
+        try:
+            copies['zstd (multi-frame)'] = Path(directory) / f'{file_path.name}.zst'
+            write_zstd_frames(file_path, copies['zstd (multi-frame)'])
+        except ImportError:
+            del copies['zstd (multi-frame)']
+
+        rows = []
+        for label, path in copies.items():
+            durations = []
+            for _ in range(times):
+                start = perf_counter()
+                *_, num_ranges = summarise_compressed(path, *arguments, method)
+                durations.append(perf_counter() - start)
+
+            tracemalloc.start()
+            summarise_compressed(path, *arguments, method)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            rows.append({
+                'input': label,
+                'size (MB)': path.stat().st_size / 1e6,
+                'parallel ranges': num_ranges,
+                'seconds': min(durations),
+                'MB/s': size_mb / min(durations),
+                'peak memory (MB)': peak_memory / 1e6,
+            })
+
+    return DataFrame(rows)
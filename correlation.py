@@ -0,0 +1,184 @@
+'''
+Pairwise-complete Pearson correlation between sensors. The sums needed for
+every pair of sensors are computed with matrix products over NaN-masked row
+tiles, which can be processed in parallel and merged by adding them up.
+'''
+
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from warnings import catch_warnings, simplefilter
+
+import numpy as np
+from pandas import DataFrame
+
+import logger
+from jobs import worker_share
+from planner import plan_selection, select_cells
+from proc import generate_descriptions, log_clean_counts
+from time_index import read_time_window
+from util import resolve_data_files, validate_analysis_inputs
+
+
+# Rows per tile. Larger datasets are split into more tiles than workers.
+TILE_ROWS = 65_536
+
+
+@dataclass
+class CorrelationMoments:
+    '''
+    Sums over a set of rows from which the pairwise-complete correlation of
+    every pair of columns can be found. Entry `[i, j]` of each matrix only
+    includes rows where both column `i` and column `j` are non-null:
+
+    - `n`: the number of such rows,
+    - `sx`: the sum of column `i`,
+    - `sxx`: the sum of squares of column `i`,
+    - `sxy`: the sum of products of columns `i` and `j`.
+
+    Values are shifted by a fixed amount per column before summing, to keep
+    precision; moments can only be merged if they use the same shift.
+    '''
+    n: np.ndarray
+    sx: np.ndarray
+    sxx: np.ndarray
+    sxy: np.ndarray
+
+    def merge(self, other: 'CorrelationMoments'):
+        '''
+        Combine these moments with those of another set of rows.
+        '''
+        return CorrelationMoments(
+            n = self.n + other.n,
+            sx = self.sx + other.sx,
+            sxx = self.sxx + other.sxx,
+            sxy = self.sxy + other.sxy,
+        )
+
+    def correlation(self):
+        '''
+        Get the matrix of Pearson correlation coefficients. Pairs with fewer
+        than two shared rows, or no variance, are NaN.
+        '''
+        n, sx, sxy = self.n, self.sx, self.sxy
+        sy, syy = sx.T, self.sxx.T
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = n * sxy - sx * sy
+            variance_x = n * self.sxx - sx * sx
+            variance_y = n * syy - sy * sy
+            result = covariance / np.sqrt(variance_x * variance_y)
+
+        result[(n < 2) | (variance_x <= 0) | (variance_y <= 0)] = np.nan
+        return np.clip(result, -1, 1)
+
+
+def correlation_moments(job: tuple[np.ndarray, np.ndarray]):
+    '''
+    Compute the `CorrelationMoments` of a tile of rows, using one matrix
+    product per sum.
+
+    `job` holds the tile (rows by columns, with NaN for nulls) and the shift
+    subtracted from each column.
+    '''
+    tile, shift = job
+    mask = ~np.isnan(tile)
+    values = np.where(mask, tile - shift, 0.0)
+    weights = mask.astype(float)
+
+    return CorrelationMoments(
+        n = weights.T @ weights,
+        sx = values.T @ weights,
+        sxx = (values * values).T @ weights,
+        sxy = values.T @ values,
+    )
+
+def merge_moments(moments: list[CorrelationMoments]):
+    '''
+    Merge the moments of several tiles, in order.
+    '''
+    merged = moments[0]
+    for tile_moments in moments[1:]:
+        merged = merged.merge(tile_moments)
+    return merged
+
+def correlate(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        no_clean: bool,
+        compare: bool = False,
+    ):
+    '''
+    Compute the pairwise-complete Pearson correlation matrix of the sensors
+    in the sensor range, over the time range. Rows are split into tiles whose
+    moments are computed in parallel and merged.
+
+    Returns the matrix as a `DataFrame`, the time taken, and (if `compare` is
+    true) the time taken by `DataFrame.corr()` on the same data and the
+    largest difference between the two results.
+    '''
+    validate_analysis_inputs(*time_range, *sensor_range)
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError(
+            'Correlations can only be computed for a single data file.'
+        )
+
+    df = logger.log_task('Reading CSV file data into DataFrame... ')\
+        (read_time_window)(files[0], *time_range)
+
+    # Select the rows and sensors for analysis, removing
+    # bad rows only from those selected.
+    rows, names, keep, removed = plan_selection(
+        df, *time_range, *sensor_range, no_clean,
+    )
+    if not no_clean:
+        log_clean_counts(*removed)
+    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
+        (select_cells)(df, rows, names, keep)
+
+    start_time = perf_counter()
+    matrix = np.column_stack(data_subset).astype(float)\
+        if len(data_subset) > 0 else np.empty((0, 0))
+
+    # Every tile is shifted by the same column means. Columns
+    # with only nulls give a warning which is not needed here.
+    with catch_warnings():
+        simplefilter('ignore', RuntimeWarning)
+        shift = np.nan_to_num(np.nanmean(matrix, axis=0))\
+            if len(matrix) > 0 else np.zeros(matrix.shape[1])
+    num_tiles = max(worker_share(), -(-len(matrix) // TILE_ROWS), 1)
+    jobs = [
+        (tile, shift) for tile in np.array_split(matrix, num_tiles)
+        if len(tile) > 0
+    ] or [(matrix, shift)]
+
+    moments, _, _ = logger.log_task(
+        f'Computing moments of {len(jobs)} row tiles (method: {method})... '
+    )(generate_descriptions)(correlation_moments, jobs, method)
+    result = DataFrame(
+        merge_moments(moments).correlation(), index=names, columns=names,
+    )
+    time_taken = perf_counter() - start_time
+
+    if not compare:
+        return result, time_taken, None, None
+
+    # Compare with pandas on exactly the same data.
+    frame = DataFrame(matrix, columns=names)
+    start_time = perf_counter()
+    expected = logger.log_task('Running DataFrame.corr() for comparison... ')\
+        (frame.corr)()
+    pandas_time = perf_counter() - start_time
+
+    result_values, expected_values = result.to_numpy(), expected.to_numpy()
+    if (np.isnan(result_values) != np.isnan(expected_values)).any():
+        max_difference = np.inf
+    else:
+        max_difference = float(np.nanmax(
+            np.abs(result_values - expected_values), initial=0.0,
+        ))
+
+    return result, time_taken, pandas_time, max_difference
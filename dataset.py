@@ -0,0 +1,311 @@
+'''
+Library API for querying sensor data from Python, without going through the
+CLI. Building on the old `CSVManager` idea, a `Dataset` is opened lazily and
+queries are built up by chaining calls, each of which returns a new
+`Dataset`. Nothing is read until `collect()` is called, at which point the
+query plan is run as a whole:
+
+```python
+from dataset import Dataset
+
+summary = Dataset('sensor.csv')\\
+    .time('2018-04-01 00:00:00', '2018-04-30 23:59:00')\\
+    .sensors(0, 3)\\
+    .clean()\\
+    .describe()\\
+    .collect()
+```
+
+The plan only reads what it needs. Only the selected columns are parsed
+(projection pushdown), files of a partitioned dataset outside the time range
+are skipped, and the rows in the time range are read through the file's
+block store or timestamp index if it has one (filter pushdown). Loaded data
+is cached, so queries over the same data do not read it again.
+'''
+
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from pandas import DataFrame, concat, read_csv, to_datetime
+
+from block_store import BAD_STATUSES, open_block_store
+from compression import detect_compression
+from metadata import csv_dtypes, dataset_bounds
+from proc import generate_descriptions, subprocess_task
+from reader import read_column_names
+from time_index import load_time_index
+from util import (
+    date_string,
+    files_in_time_range,
+    resolve_data_files,
+    sensor_name,
+    use_query_bounds,
+    validate_analysis_inputs,
+)
+
+
+# The number of loads kept by the load cache.
+LOAD_CACHE_SIZE = 8
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    '''
+    A query over a dataset: the time range and sensors selected, whether bad
+    rows are removed, and whether the selected data is summarised. A time or
+    sensor range of `None` selects every row or sensor.
+    '''
+    file_path: Path
+    time_range: tuple[str, str] | None = None
+    sensor_range: tuple[int, int] | None = None
+    clean: bool = False
+    describe: bool = False
+
+
+class Dataset:
+    '''
+    A lazily evaluated query over a data file (or a directory or glob pattern
+    of data files). See the module documentation for an example.
+
+    `method` selects the executor used to summarise the data (`process`,
+    `thread` or `sync`), and may be overridden in `collect()`.
+    '''
+
+    def __init__(
+            self,
+            file_path: str | Path,
+            method: str = 'process',
+            plan: QueryPlan | None = None,
+        ) -> None:
+        self.method = method
+        self.plan = plan if plan is not None else QueryPlan(Path(file_path))
+
+    def _with(self, **changes):
+        return Dataset(
+            self.plan.file_path, self.method, replace(self.plan, **changes),
+        )
+
+    def time(self, start: str, end: str):
+        '''
+        Select the rows from `start` to `end` (inclusive).
+        '''
+        return self._with(time_range=(date_string(start), date_string(end)))
+
+    def sensors(self, start: int, end: int):
+        '''
+        Select sensors `start` to `end` (inclusive), by number.
+        '''
+        return self._with(sensor_range=(start, end))
+
+    def clean(self):
+        '''
+        Remove rows where the machine is broken or recovering.
+        '''
+        return self._with(clean=True)
+
+    def describe(self):
+        '''
+        Summarise each selected sensor, as `Series.describe()` does.
+        '''
+        return self._with(describe=True)
+
+    def _time_range(self):
+        '''
+        The time range the plan reads: the range selected or, if none is,
+        the bounds of the dataset from its metadata manifest.
+        '''
+        if self.plan.time_range is not None:
+            return self.plan.time_range
+        return dataset_bounds(self.plan.file_path)[0]
+
+    def _files(self):
+        '''
+        The data files the plan reads, skipping any outside its time range.
+        '''
+        files = resolve_data_files(self.plan.file_path)
+        if len(files) > 1:
+            files = files_in_time_range(files, *self._time_range())
+        return files
+
+    def _columns(self, file_path: Path):
+        '''
+        The columns the plan reads from a file: the timestamps, the selected
+        sensors and, if cleaning, the machine status.
+        '''
+        names = read_column_names(file_path)
+        if self.plan.sensor_range is None:
+            sensors = [name for name in names if name.startswith('sensor_')]
+        else:
+            start, end = self.plan.sensor_range
+            sensors = [sensor_name(index) for index in range(start, end + 1)]
+            missing = [sensor for sensor in sensors if sensor not in names]
+            if missing:
+                raise ValueError(
+                    f'"{file_path}" has no column {", ".join(missing)}.'
+                )
+
+        status = ['machine_status'] if self.plan.clean else []
+        return ('timestamp', *sensors, *status)
+
+    def _access(self, file_path: Path):
+        '''
+        How the plan reads a file: from its block store, through its index,
+        or as a whole.
+        '''
+        if open_block_store(file_path) is not None:
+            return 'block store'
+        if detect_compression(file_path) is None:
+            index = load_time_index(file_path)
+            if index is not None and len(index.offsets) > 0:
+                return 'index'
+        return 'whole file'
+
+    def explain(self):
+        '''
+        Describe how the plan would be run, one step per line, without
+        running it.
+        '''
+        plan = self.plan
+        time_range = self._time_range()
+        steps = []
+        for file_path in self._files():
+            columns = self._columns(file_path)
+            steps.append(
+                f'read "{file_path}" ({self._access(file_path)}):'
+                f' {len(columns)} columns, {time_range[0]} to'
+                f' {time_range[1]}'
+            )
+        if plan.clean:
+            steps.append(
+                f'remove rows with status {" or ".join(BAD_STATUSES)}'
+            )
+        if plan.describe:
+            steps.append(f'describe each sensor (method: {self.method})')
+        return '\n'.join(steps)
+
+    def collect(self, method: str | None = None):
+        '''
+        Run the query plan.
+
+        Returns a `DataFrame` of the selected rows, indexed by timestamp with
+        one column per sensor or, if the plan describes the data, a
+        `DataFrame` with one `describe()` column per sensor.
+        '''
+        plan = self.plan
+        time_bounds, sensor_bounds = dataset_bounds(plan.file_path)
+        time_range = plan.time_range or time_bounds
+        with use_query_bounds(time_bounds, sensor_bounds):
+            validate_analysis_inputs(
+                *time_range, *(plan.sensor_range or sensor_bounds),
+            )
+
+        frames = []
+        for file_path in self._files():
+            df = _load(
+                file_path,
+                self._access(file_path),
+                self._columns(file_path),
+                time_range,
+            )
+            if plan.clean:
+                df = df[~df['machine_status'].isin(BAD_STATUSES)]\
+                    .drop(columns='machine_status')
+            frames.append(df)
+        if len(frames) == 0:
+            raise ValueError('No data files overlap the requested time range.')
+
+        rows = concat(frames) if len(frames) > 1 else frames[0]
+        rows = rows.set_index('timestamp')
+        if not plan.describe:
+            return rows
+
+        descriptions, _, _ = generate_descriptions(
+            subprocess_task,
+            [rows[sensor].to_numpy() for sensor in rows.columns],
+            method or self.method,
+        )
+        return DataFrame(
+            {
+                sensor: description
+                for sensor, description in zip(rows.columns, descriptions)
+            },
+        )
+
+    def __repr__(self):
+        plan = self.plan
+        return (
+            f'Dataset({str(plan.file_path)!r}, time={plan.time_range},'
+            f' sensors={plan.sensor_range}, clean={plan.clean},'
+            f' describe={plan.describe})'
+        )
+
+
+def _load(
+        file_path: Path,
+        access: str,
+        columns: tuple[str, ...],
+        time_range: tuple[str, str],
+    ):
+    '''
+    Load the rows of a file within a time range, keeping only the columns
+    given. Loads are cached until the file changes. The `DataFrame` returned
+    is shared with the cache, so it must not be modified.
+    '''
+    stat = file_path.stat()
+    return _load_cached(
+        file_path.resolve(), (stat.st_size, stat.st_mtime_ns),
+        access, columns, time_range,
+    )
+
+@lru_cache(maxsize=LOAD_CACHE_SIZE)
+def _load_cached(
+        file_path: Path,
+        _version: tuple[int, int],
+        access: str,
+        columns: tuple[str, ...],
+        time_range: tuple[str, str],
+    ):
+    '''
+    Load rows as for `_load()`. The file's size and modification time are
+    part of the cache key, so changed files are read again.
+    '''
+    start, end = (np.datetime64(time) for time in time_range)
+
+    if access == 'block store':
+        # Only the rows in the time range are read from the
+        # memory-mapped columns.
+        store = open_block_store(file_path)
+        timestamps = store.column('timestamp')
+        first = int(np.searchsorted(timestamps, start, 'left'))
+        last = int(np.searchsorted(timestamps, end, 'right'))
+        data = {'timestamp': np.asarray(timestamps[first:last])}
+        for column in columns[1:]:
+            values = np.asarray(store.column(column)[first:last])
+            if column == 'machine_status':
+                names = np.array(store.statuses + [None], dtype=object)
+                values = names[values]
+            data[column] = values
+        return DataFrame(data)
+
+    if access == 'index':
+        # Only the indexed window is parsed.
+        window = load_time_index(file_path).byte_range(*time_range)
+        with open(file_path, 'rb') as file:
+            file.seek(window.start)
+            data = file.read(window.end - window.start)
+        df = read_csv(
+            BytesIO(data), header=None, names=list(window.names),
+            usecols=list(columns), dtype=csv_dtypes(file_path),
+        )
+    else:
+        df = read_csv(
+            file_path, usecols=list(columns), dtype=csv_dtypes(file_path),
+        )
+
+    df = df[list(columns)]
+    df['timestamp'] = to_datetime(df['timestamp'])
+    return df[(df['timestamp'] >= start) & (df['timestamp'] <= end)]\
+        .reset_index(drop=True)
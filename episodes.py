@@ -0,0 +1,243 @@
+'''
+Failure episode extraction. Pump failures appear in the `machine_status`
+column as a run of BROKEN rows followed by a run of RECOVERING rows. Episodes
+are found by run-length encoding the status codes, and each sensor is then
+summarised over windows before, during and after every failure.
+
+The pre-failure window covers a set number of hours before each failure. By
+default the in-failure and recovery windows cover the BROKEN and RECOVERING
+runs, but either can instead be set to a number of hours from its start.
+'''
+
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from pandas import DataFrame
+
+import logger
+from aggregate import merge_partials, partial_summary
+from planner import select_cells, selected_timestamps, sensor_columns, time_slice
+from proc import generate_descriptions
+from time_index import read_time_window
+from util import resolve_data_files, validate_analysis_inputs
+
+
+# The windows summarised for each episode, in order.
+EPISODE_WINDOWS = ['pre-failure', 'in-failure', 'recovery']
+
+# Default length of the pre-failure window, in hours.
+HOURS_BEFORE = 24.0
+
+
+@dataclass(frozen=True)
+class Episode:
+    '''
+    A single failure episode, as row positions within the analysed data:
+    BROKEN rows run from `failure_start` up to `recovery_start`, and
+    RECOVERING rows from there up to `recovery_end`. `windows` holds the
+    `(start, end)` rows of each of the `EPISODE_WINDOWS`.
+    '''
+    failure_start: int
+    recovery_start: int
+    recovery_end: int
+    windows: tuple[tuple[int, int], ...]
+
+
+def find_status_runs(codes: np.ndarray):
+    '''
+    Run-length encode an array of status codes. Returns the start position,
+    end position (exclusive) and code of every run.
+    '''
+    if len(codes) == 0:
+        empty = np.empty(0, dtype=int)
+        return empty, empty, empty
+
+    starts = np.concatenate([[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1])
+    ends = np.concatenate([starts[1:], [len(codes)]])
+    return starts, ends, codes[starts]
+
+def hours(length: float):
+    '''Convert a length in hours to a `timedelta64`.'''
+    return np.timedelta64(int(length * 3600 * 1e9), 'ns')
+
+def find_episodes(
+        codes: np.ndarray,
+        timestamps: np.ndarray,
+        broken_code: int,
+        recovering_code: int,
+        hours_before: float = HOURS_BEFORE,
+        hours_failure: float | None = None,
+        hours_after: float | None = None,
+    ):
+    '''
+    Find the failure episodes in an array of status codes, i.e. each run of
+    the broken code and the run of the recovering code (if any) following it.
+
+    The pre-failure window of each episode covers the `hours_before` hours
+    before the failure, but never reaches back into the previous episode.
+    The in-failure window covers the broken run or, if `hours_failure` is
+    given, at most that many hours from its start. The recovery window covers
+    the recovering run or, if `hours_after` is given, that many hours from
+    the end of the broken run (whatever the status), up to the next failure.
+    '''
+    starts, ends, values = find_status_runs(codes)
+    failure_runs = np.flatnonzero(values == broken_code)
+
+    episodes = []
+    previous_end = 0
+    for index, run in enumerate(failure_runs):
+        failure_start, recovery_start = int(starts[run]), int(ends[run])
+        recovery_end = recovery_start
+        if run + 1 < len(values) and values[run + 1] == recovering_code:
+            recovery_end = int(ends[run + 1])
+
+        window_start = int(np.searchsorted(
+            timestamps, timestamps[failure_start] - hours(hours_before), 'left',
+        ))
+
+        failure_end = recovery_start
+        if hours_failure is not None:
+            failure_end = min(failure_end, int(np.searchsorted(
+                timestamps,
+                timestamps[failure_start] + hours(hours_failure),
+                'left',
+            )))
+
+        after_end = recovery_end
+        if hours_after is not None:
+            next_failure = int(starts[failure_runs[index + 1]])\
+                if index + 1 < len(failure_runs) else len(timestamps)
+            after_end = recovery_start
+            if recovery_start < len(timestamps):
+                after_end = min(next_failure, int(np.searchsorted(
+                    timestamps,
+                    timestamps[recovery_start] + hours(hours_after),
+                    'left',
+                )))
+
+        episodes.append(Episode(
+            failure_start = failure_start,
+            recovery_start = recovery_start,
+            recovery_end = recovery_end,
+            windows = (
+                (max(window_start, previous_end), failure_start),
+                (failure_start, failure_end),
+                (recovery_start, after_end),
+            ),
+        ))
+        previous_end = recovery_end
+
+    return episodes
+
+def summarise_episode_windows(
+        job: tuple[np.ndarray, list[tuple[tuple[int, int], ...]]],
+    ):
+    '''
+    Summarise one sensor column over every window of every episode.
+
+    `job` holds the column and the windows of each episode. Returns one list
+    of `describe()`-style `Series` per episode (one per window), and one
+    `Series` per window type covering that window of every episode.
+    '''
+    column, episode_windows = job
+
+    partials = [
+        [partial_summary(column[start:end]) for start, end in windows]
+        for windows in episode_windows
+    ]
+    per_episode = [
+        [partial.to_series() for partial in episode_partials]
+        for episode_partials in partials
+    ]
+    combined = [
+        merge_partials([
+            episode_partials[window] for episode_partials in partials
+        ]).to_series()
+        for window in range(len(EPISODE_WINDOWS))
+    ]
+    return per_episode, combined
+
+def summarise_episodes(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        hours_before: float = HOURS_BEFORE,
+        hours_failure: float | None = None,
+        hours_after: float | None = None,
+    ):
+    '''
+    Find the failure episodes in a data file and summarise each sensor over
+    the pre-failure, in-failure and recovery windows of every episode (see
+    `find_episodes()`). The data is read and subset once; each sensor's
+    column is then summarised over every window in one task.
+
+    Returns a `DataFrame` describing each episode, the per-episode and
+    combined results of each sensor (see `summarise_episode_windows()`) and
+    the time taken.
+    '''
+    start_time = perf_counter()
+
+    validate_analysis_inputs(*time_range, *sensor_range)
+    for length in (hours_before, hours_failure, hours_after):
+        if length is not None and length < 0:
+            raise ValueError('Window lengths cannot be negative.')
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError('Episodes can only be found in a single data file.')
+
+    # Rows are not cleaned, since the failures are what is
+    # being analysed.
+    df = logger.log_task('Reading CSV file data into DataFrame... ')\
+        (read_time_window)(files[0], *time_range)
+    rows = time_slice(df, *time_range)
+    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
+        (select_cells)(df, rows, sensor_columns(df, *sensor_range), None)
+
+    # Episodes are found from the status codes alone.
+    status = df['machine_status'].iloc[rows]
+    codes = np.select(
+        [(status == 'BROKEN').to_numpy(), (status == 'RECOVERING').to_numpy()],
+        [1, 2],
+        0,
+    )
+    timestamps = selected_timestamps(df, rows, None)
+    episodes = logger.log_task('Finding failure episodes... ')(find_episodes)(
+        codes, timestamps, 1, 2, hours_before, hours_failure, hours_after,
+    )
+    logger.log(f'Found {len(episodes)} failure episodes.\n')
+
+    # Every sensor is summarised over every window at once,
+    # so each column is only sent to a worker once.
+    episode_windows = [episode.windows for episode in episodes]
+    jobs = [(column, episode_windows) for column in data_subset]
+    results, _, _ = logger.log_task(
+        f'Summarising episode windows (method: {method})... '
+    )(generate_descriptions)(summarise_episode_windows, jobs, method)
+
+    # Describe each episode in a table for display.
+    times = select_cells(df, rows, ['timestamp'], None)[0]
+    table = DataFrame([
+        {
+            'failure start': times[episode.failure_start],
+            'recovery start': times[episode.recovery_start]
+                if episode.recovery_end > episode.recovery_start else None,
+            'recovery end': times[episode.recovery_end - 1]
+                if episode.recovery_end > episode.recovery_start else None,
+            **{
+                f'{window} rows': end - start
+                for window, (start, end)
+                in zip(EPISODE_WINDOWS, episode.windows)
+            },
+        }
+        for episode in episodes
+    ])
+
+    return (
+        table,
+        [per_episode for per_episode, _ in results],
+        [combined for _, combined in results],
+        perf_counter() - start_time,
+    )
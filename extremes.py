@@ -0,0 +1,401 @@
+'''
+Extreme readings and threshold excursions of each sensor, for alerting. The
+rows are split into tiles and the sensors into batches, and each task finds:
+
+- the k largest and smallest readings of each sensor in its tile, with
+  `np.partition()` instead of sorting the whole column, and
+- the runs of consecutive readings above or below each sensor's thresholds,
+  by detecting the edges where readings cross them.
+
+The candidates of every tile are then narrowed down to the overall top k,
+and runs which cross tile boundaries are stitched back together.
+'''
+
+from dataclasses import dataclass
+from pathlib import Path
+from re import fullmatch
+from time import perf_counter
+
+import numpy as np
+from pandas import DataFrame, NaT, Timedelta
+
+import logger
+from proc import generate_descriptions
+from tiles import select_block, split_tiles
+from util import resolve_data_files, sensor_name, validate_analysis_inputs
+
+
+# Default number of largest and smallest readings found per sensor.
+TOP_K = 5
+
+# Directions of threshold excursions.
+DIRECTIONS = ['above', 'below']
+
+
+@dataclass
+class TileExtremes:
+    '''
+    The extremes of a tile of rows for a batch of sensors. `largest` and
+    `smallest` hold up to k candidate readings of each sensor (sensors by
+    candidates, with NaN for places left over), and `largest_rows` and
+    `smallest_rows` their row numbers. `runs` holds the excursions of each
+    direction as arrays of sensor numbers (within the sensor range), first
+    rows and end rows (exclusive).
+    '''
+    sensor_offset: int
+    largest: np.ndarray
+    largest_rows: np.ndarray
+    smallest: np.ndarray
+    smallest_rows: np.ndarray
+    runs: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+
+def threshold_string(text: str):
+    '''
+    Validation function for use with `argparse`. Parses a threshold, which is
+    either a value for every sensor (e.g. `600`) or a value for one sensor
+    (e.g. `sensor_04=600` or `4=600`). Returns the sensor number (`None` for
+    every sensor) and the value. Invalid strings will raise a `ValueError`.
+    '''
+    match = fullmatch(r'(?:(?:sensor_)?(\d+)=)?(.+)', text.strip())
+    sensor, value = match.groups()
+    return (None if sensor is None else int(sensor)), float(value)
+
+def resolve_thresholds(
+        thresholds: list[tuple[int | None, float]] | None,
+        sensor_range: tuple[int, int],
+    ):
+    '''
+    Get the threshold of each sensor in the range, as an array with NaN for
+    sensors without one. Thresholds for one sensor override thresholds for
+    every sensor.
+    '''
+    values = np.full(sensor_range[1] - sensor_range[0] + 1, np.nan)
+    for sensor, value in sorted(
+            thresholds or [], key=lambda threshold: threshold[0] is not None,
+    ):
+        if sensor is None:
+            values[:] = value
+        elif sensor_range[0] <= sensor <= sensor_range[1]:
+            values[sensor - sensor_range[0]] = value
+        else:
+            raise ValueError(
+                f'Threshold for {sensor_name(sensor)} is outside the sensor'
+                ' range.'
+            )
+    return values
+
+def find_runs(exceeds: np.ndarray):
+    '''
+    Find the runs of `True` along each row of a boolean array (sensors by
+    readings), from the edges where it changes. Returns the row, first column
+    and end column (exclusive) of each run, ordered by row and then column.
+    '''
+    padding = np.zeros((len(exceeds), 1), dtype=np.int8)
+    edges = np.diff(
+        np.concatenate([padding, exceeds.astype(np.int8), padding], axis=1),
+        axis=1,
+    )
+    # Edges are found in order, so the starts and ends of each
+    # run pair up.
+    sensors, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return sensors, starts, ends
+
+def top_candidates(column: np.ndarray, k: int):
+    '''
+    Find the positions of the k smallest and k largest readings of a column,
+    in no particular order. `np.partition()` finds the kth smallest and kth
+    largest readings, and the readings beyond them are then picked out, so
+    the column is never sorted. Nulls are skipped: they are partitioned to
+    the end.
+    '''
+    present = len(column) - int(np.isnan(column).sum())
+    count = min(k, present)
+    if count == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    low = np.partition(column, count - 1)[count - 1]
+    high = np.partition(column, present - count)[present - count]
+
+    # Of readings tied with the kth, only enough to make k are
+    # kept.
+    positions = []
+    for beyond, bound in ((column < low, low), (column > high, high)):
+        strict = np.flatnonzero(beyond)
+        tied = np.flatnonzero(column == bound)[:count - len(strict)]
+        positions.append(np.concatenate([strict, tied]))
+    return positions[0], positions[1]
+
+def scan_extremes(
+        job: tuple[np.ndarray, int, int, np.ndarray, np.ndarray, int],
+    ):
+    '''
+    Find the extremes of a tile of rows for a batch of sensors.
+
+    `job` holds the tile (sensors by readings, with NaN for nulls), the row
+    number of its first reading, the number of its first sensor within the
+    sensor range, the upper and lower threshold of each sensor (NaN for
+    none), and k.
+    '''
+    tile, row_offset, sensor_offset, upper, lower, k = job
+
+    largest = np.full((len(tile), k), np.nan)
+    largest_rows = np.full((len(tile), k), -1)
+    smallest, smallest_rows = largest.copy(), largest_rows.copy()
+    for index, column in enumerate(tile):
+        low, high = top_candidates(column, k)
+        smallest[index, :len(low)] = column[low]
+        smallest_rows[index, :len(low)] = low + row_offset
+        largest[index, :len(high)] = column[high]
+        largest_rows[index, :len(high)] = high + row_offset
+
+    # Null readings are never beyond a threshold, so they end
+    # excursions.
+    runs = {}
+    for direction, exceeds in (
+            ('above', tile > upper[:, None]),
+            ('below', tile < lower[:, None]),
+    ):
+        sensors, starts, ends = find_runs(exceeds)
+        runs[direction] = (
+            sensors + sensor_offset, starts + row_offset, ends + row_offset,
+        )
+
+    return TileExtremes(
+        sensor_offset = sensor_offset,
+        largest = largest,
+        largest_rows = largest_rows,
+        smallest = smallest,
+        smallest_rows = smallest_rows,
+        runs = runs,
+    )
+
+def merge_top(values: np.ndarray, rows: np.ndarray, k: int, largest: bool):
+    '''
+    Narrow down the candidate readings of each sensor (sensors by candidates,
+    with NaN for places left over) to the k largest or smallest, in order.
+    Places left over (for sensors with fewer than k readings) are NaN, with
+    row -1.
+    '''
+    keys = np.where(np.isnan(values), np.inf, -values if largest else values)
+    order = np.argsort(keys, axis=1, kind='stable')[:, :k]
+
+    top_values = np.full((len(values), k), np.nan)
+    top_rows = np.full((len(values), k), -1)
+    top_values[:, :order.shape[1]] = np.take_along_axis(values, order, axis=1)
+    top_rows[:, :order.shape[1]] = np.where(
+        np.isnan(top_values[:, :order.shape[1]]), -1,
+        np.take_along_axis(rows, order, axis=1),
+    )
+    return top_values, top_rows
+
+def stitch_runs(runs: list[tuple[np.ndarray, np.ndarray, np.ndarray]]):
+    '''
+    Combine the runs found in each tile, joining runs of the same sensor
+    where one ends at the row the next starts (i.e. at a tile boundary).
+    '''
+    sensors = np.concatenate([run[0] for run in runs])
+    starts = np.concatenate([run[1] for run in runs])
+    ends = np.concatenate([run[2] for run in runs])
+
+    if len(sensors) == 0:
+        return sensors, starts, ends
+
+    order = np.lexsort((starts, sensors))
+    sensors, starts, ends = sensors[order], starts[order], ends[order]
+    joined = (sensors[1:] == sensors[:-1]) & (starts[1:] == ends[:-1])
+    first = np.flatnonzero(np.concatenate([[True], ~joined]))
+    last = np.concatenate([first[1:] - 1, [len(sensors) - 1]])
+    return sensors[first], starts[first], ends[last]
+
+def excursion_table(
+        runs: tuple[np.ndarray, np.ndarray, np.ndarray],
+        timestamps: np.ndarray,
+        direction: str,
+        thresholds: np.ndarray,
+        sensor_start: int,
+    ):
+    '''
+    Summarise the excursions of each sensor with a threshold: the number of
+    excursions, their total duration, and the longest one and when it
+    started. An excursion lasts from its first reading beyond the threshold
+    to the next reading which is not (or, at the end of the data, to its last
+    reading).
+    '''
+    sensors, starts, ends = runs
+    finish = np.where(
+        ends < len(timestamps), ends, np.maximum(ends - 1, starts),
+    )
+    durations = timestamps[finish] - timestamps[starts]
+
+    rows = []
+    for index in np.flatnonzero(~np.isnan(thresholds)):
+        mask = sensors == index
+        count = int(mask.sum())
+        longest = int(np.argmax(durations[mask])) if count > 0 else None
+        rows.append({
+            'sensor': sensor_name(sensor_start + index),
+            'direction': direction,
+            'threshold': thresholds[index],
+            'excursions': count,
+            'total duration': Timedelta(durations[mask].sum())
+                if count > 0 else Timedelta(0),
+            'longest': Timedelta(durations[mask][longest])
+                if count > 0 else NaT,
+            'longest start': timestamps[starts[mask][longest]]
+                if count > 0 else NaT,
+        })
+    return rows
+
+def sorted_extremes(block: np.ndarray, k: int):
+    '''
+    Find the k largest and smallest readings of each sensor (and their rows)
+    by sorting each sensor's readings, for comparison. Returns the readings
+    as `merge_top()` does.
+    '''
+    largest = np.full((len(block), k), np.nan)
+    smallest = largest.copy()
+    for index, column in enumerate(block):
+        order = np.argsort(column, kind='stable')
+        present = order[:len(column) - int(np.isnan(column).sum())]
+        largest[index, :min(k, len(present))] = column[present[::-1][:k]]
+        smallest[index, :min(k, len(present))] = column[present[:k]]
+    return largest, smallest
+
+def find_extremes(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        no_clean: bool,
+        k: int = TOP_K,
+        above: list[tuple[int | None, float]] | None = None,
+        below: list[tuple[int | None, float]] | None = None,
+        compare: bool = False,
+    ):
+    '''
+    Find the `k` largest and smallest readings of each sensor in the sensor
+    range over the time range, with their timestamps, and summarise the
+    excursions above the `above` thresholds and below the `below` thresholds
+    (see `threshold_string()`).
+
+    Returns a `DataFrame` of the extremes, a `DataFrame` of the excursions
+    (empty if there are no thresholds), the time taken and, if `compare` is
+    true, the time taken to find the extremes in a single task by
+    partitioning and by sorting each column, and whether the results match.
+    '''
+    validate_analysis_inputs(*time_range, *sensor_range)
+    if k < 1:
+        raise ValueError('At least one extreme must be found per sensor.')
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError('Extremes can only be found for a single data file.')
+
+    thresholds = {
+        'above': resolve_thresholds(above, sensor_range),
+        'below': resolve_thresholds(below, sensor_range),
+    }
+
+    # Keep the timestamps of the rows selected.
+    data_subset, names, timestamps = select_block(
+        files[0], time_range, sensor_range, no_clean, with_times=True,
+    )
+
+    start_time = perf_counter()
+    # Each sensor's readings are kept contiguous, so that they
+    # can be partitioned and scanned quickly.
+    block = np.vstack(data_subset).astype(float)
+    num_rows = block.shape[1]
+
+    jobs = [
+        (
+            block[sensors, rows],
+            int(rows.start), int(sensors.start),
+            thresholds['above'][sensors],
+            thresholds['below'][sensors],
+            k,
+        )
+        for rows, sensors in split_tiles(num_rows, len(names))
+    ]
+
+    results, _, _ = logger.log_task(
+        f'Scanning {len(jobs)} tiles (method: {method})... '
+    )(generate_descriptions)(scan_extremes, jobs, method)
+
+    # Merge the candidates of every tile, sensor batch by
+    # sensor batch.
+    largest = np.full((len(names), k), np.nan)
+    largest_rows = np.full((len(names), k), -1)
+    smallest, smallest_rows = largest.copy(), largest_rows.copy()
+    for offset in sorted({result.sensor_offset for result in results}):
+        batch = [result for result in results if result.sensor_offset == offset]
+        sensors = slice(offset, offset + len(batch[0].largest))
+        largest[sensors], largest_rows[sensors] = merge_top(
+            np.hstack([result.largest for result in batch]),
+            np.hstack([result.largest_rows for result in batch]),
+            k, True,
+        )
+        smallest[sensors], smallest_rows[sensors] = merge_top(
+            np.hstack([result.smallest for result in batch]),
+            np.hstack([result.smallest_rows for result in batch]),
+            k, False,
+        )
+
+    def time_of(row: int):
+        return timestamps[row] if row >= 0 else NaT
+
+    extremes = DataFrame([
+        {
+            'sensor': name,
+            'rank': rank + 1,
+            'largest': largest[index, rank],
+            'largest at': time_of(largest_rows[index, rank]),
+            'smallest': smallest[index, rank],
+            'smallest at': time_of(smallest_rows[index, rank]),
+        }
+        for index, name in enumerate(names)
+        for rank in range(k)
+    ])
+
+    excursions = []
+    for direction in DIRECTIONS:
+        runs = stitch_runs([result.runs[direction] for result in results])
+        excursions.extend(excursion_table(
+            runs, timestamps, direction, thresholds[direction],
+            sensor_range[0],
+        ))
+    excursions = DataFrame(excursions, columns=[
+        'sensor', 'direction', 'threshold', 'excursions', 'total duration',
+        'longest', 'longest start',
+    ])
+    time_taken = perf_counter() - start_time
+
+    if not compare:
+        return extremes, excursions, time_taken, None, None
+
+    # Compare with sorting each column of the same data, timing
+    # only the search for the extremes in both cases.
+    no_thresholds = np.full(len(names), np.nan)
+    start_time = perf_counter()
+    candidates = scan_extremes((block, 0, 0, no_thresholds, no_thresholds, k))
+    found = (
+        merge_top(candidates.largest, candidates.largest_rows, k, True)[0],
+        merge_top(candidates.smallest, candidates.smallest_rows, k, False)[0],
+    )
+    partition_time = perf_counter() - start_time
+
+    start_time = perf_counter()
+    expected = logger.log_task('Sorting each column for comparison... ')\
+        (sorted_extremes)(block, k)
+    sort_time = perf_counter() - start_time
+    matches = all(
+        np.array_equal(values, sorted_values, equal_nan=True)
+        for values, sorted_values in zip((largest, smallest), expected)
+    ) and all(
+        np.array_equal(values, sorted_values, equal_nan=True)
+        for values, sorted_values in zip(found, expected)
+    )
+
+    return extremes, excursions, time_taken, (partition_time, sort_time),\
+        matches
@@ -0,0 +1,314 @@
+'''
+Fixed-bin histograms of each sensor. Readings are binned a tile of rows and
+a batch of sensors at a time: each reading is given a code (its bin, or
+below the first edge, above the last edge or null), and a single
+`np.bincount()` over the codes of the whole tile counts every bin of every
+sensor at once. The counts of each tile are then added up.
+
+Bins are half-open, `[left, right)`, except the last, which includes its
+right edge, as for `np.histogram()`. Edges are either given, or spaced
+equally between the smallest and largest readings of each sensor, which are
+found with a cheap pre-pass over the data.
+'''
+
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from pandas import DataFrame
+
+import logger
+from output import OUTPUT_FORMATS, write_table
+from proc import generate_descriptions
+from tiles import select_block, split_tiles
+from util import resolve_data_files, validate_analysis_inputs
+
+
+# Default number of bins per sensor.
+NUM_BINS = 50
+
+# Readings binned at a time within a tile, so that the intermediate arrays
+# fit in the CPU's cache.
+CHUNK_CELLS = 1 << 18
+
+# Formats histograms can be written in: a compressed NumPy archive, or any of
+# the table formats (with one row per bin).
+HISTOGRAM_FORMATS = ['npz', *OUTPUT_FORMATS]
+
+
+@dataclass
+class Histograms:
+    '''
+    Histograms of a set of sensors. `edges` holds the bin edges of each
+    sensor (sensors by bins + 1) and `counts` the readings in each bin
+    (sensors by bins). Readings outside the edges are counted in `below` and
+    `above`, and null readings in `nulls`.
+    '''
+    sensors: list[str]
+    edges: np.ndarray
+    counts: np.ndarray
+    below: np.ndarray
+    above: np.ndarray
+    nulls: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+
+    def summary(self):
+        '''
+        Summarise the histogram of each sensor in a `DataFrame`: the number
+        of readings, their range, and the fullest bin.
+        '''
+        fullest = np.argmax(self.counts, axis=1)
+        rows = np.arange(len(self.sensors))
+        return DataFrame({
+            'sensor': self.sensors,
+            'count': self.counts.sum(axis=1),
+            'nulls': self.nulls,
+            'min': self.minimum,
+            'max': self.maximum,
+            'below': self.below,
+            'above': self.above,
+            'fullest bin': [
+                f'[{left:.6g}, {right:.6g})' for left, right in zip(
+                    self.edges[rows, fullest], self.edges[rows, fullest + 1],
+                )
+            ],
+            'fullest count': self.counts[rows, fullest],
+        })
+
+    def to_frame(self):
+        '''
+        Get every bin of every sensor as a `DataFrame`, one row per bin.
+        '''
+        num_bins = self.counts.shape[1]
+        return DataFrame({
+            'sensor': np.repeat(self.sensors, num_bins),
+            'bin': np.tile(np.arange(num_bins), len(self.sensors)),
+            'left': self.edges[:, :-1].ravel(),
+            'right': self.edges[:, 1:].ravel(),
+            'count': self.counts.ravel(),
+        })
+
+    def write(self, output_format: str, file_path: str | Path):
+        '''
+        Write the histograms to a file in one of the `HISTOGRAM_FORMATS`.
+        '''
+        if output_format != 'npz':
+            write_table(self.to_frame(), output_format, file_path)
+            return
+
+        # `np.savez_compressed()` adds the extension itself
+        # unless it is there already.
+        with open(file_path, 'wb') as file:
+            np.savez_compressed(
+                file,
+                sensors = np.array(self.sensors),
+                edges = self.edges,
+                counts = self.counts,
+                below = self.below,
+                above = self.above,
+                nulls = self.nulls,
+                minimum = self.minimum,
+                maximum = self.maximum,
+            )
+
+
+def equal_edges(minimum: np.ndarray, maximum: np.ndarray, num_bins: int):
+    '''
+    Space `num_bins` equal-width bins between the minimum and maximum of
+    each sensor, widening empty ranges as `np.histogram()` does.
+    '''
+    empty = np.isnan(minimum)
+    low = np.where(empty, 0.0, minimum)
+    high = np.where(empty, 1.0, maximum)
+    constant = low == high
+    low = np.where(constant, low - 0.5, low)
+    high = np.where(constant, high + 0.5, high)
+    return np.linspace(low, high, num_bins + 1, axis=1)
+
+def bin_bounds(edges: np.ndarray):
+    '''
+    Get the lower bound of each code of each sensor (sensors by bins + 4),
+    for the bin edges given (sensors by bins + 1). A reading has code `k` if
+    it is at least bound `k` and below bound `k + 1`: code 0 is below the
+    first edge, codes 1 to the number of bins are the bins, the next code is
+    above the last edge, and the last but one is for nulls (the last bound
+    is padding). NaN bounds compare false with every reading.
+    '''
+    num_sensors = len(edges)
+    return np.hstack([
+        np.full((num_sensors, 1), -np.inf),
+        edges[:, :-1],
+        # The last bin includes its right edge.
+        np.nextafter(edges[:, -1:], np.inf),
+        np.full((num_sensors, 2), np.nan),
+    ])
+
+def bin_counts(job: tuple[np.ndarray, np.ndarray, bool]):
+    '''
+    Count the readings of a tile in each bin, with a single `np.bincount()`.
+
+    `job` holds the tile (sensors by readings, with NaN for nulls), the
+    `bin_bounds()` of each sensor, and whether each sensor's bins are of
+    equal width (so that bins can be found arithmetically instead of by
+    search).
+
+    Returns the counts of each sensor (sensors by bins + 3): readings below
+    the first edge, each bin, readings above the last edge, and nulls.
+    '''
+    tile, bounds, equal_width = job
+    num_sensors, width = bounds.shape
+    num_bins = width - 4
+    # Each sensor's codes are offset so that they index its
+    # bounds, and so that one count covers every sensor.
+    offsets = width * np.arange(num_sensors)[:, None]
+    lower = bounds.ravel()
+    upper = np.append(lower[1:], np.nan)
+    low, high = bounds[:, 1:2], bounds[:, -3:-2]
+    scale = num_bins / (high - low)
+
+    # Codes are found a few columns at a time, so that the
+    # intermediate arrays stay in the CPU's cache.
+    codes = np.empty(tile.shape, dtype=np.intp)
+    nulls = np.zeros(num_sensors, dtype=np.intp)
+    step = max(CHUNK_CELLS // max(num_sensors, 1), 1)
+    for start in range(0, tile.shape[1], step):
+        chunk = tile[:, start:start + step]
+        chunk_codes = codes[:, start:start + step]
+
+        if not equal_width:
+            # Every sensor has the same edges.
+            chunk_codes[:] = np.searchsorted(lower[:width - 1], chunk, 'right')
+            chunk_codes += offsets - 1
+            continue
+
+        # Estimate each code from the reading's distance from
+        # the first edge, then correct it by comparing with the
+        # bounds of the code, as `np.histogram()` does for
+        # rounding. Null readings are estimated (and left) below
+        # the first edge, and moved to their own code after
+        # counting.
+        estimate = chunk - low
+        estimate *= scale
+        np.fmax(estimate, -1, out=estimate)
+        np.minimum(estimate, num_bins, out=estimate)
+        chunk_codes[:] = estimate
+        chunk_codes += offsets + 1
+        with np.errstate(invalid='ignore'):
+            chunk_codes -= chunk < np.take(lower, chunk_codes)
+            chunk_codes += chunk >= np.take(upper, chunk_codes)
+        nulls += np.count_nonzero(np.isnan(chunk), axis=1)
+
+    counts = np.bincount(codes.ravel(), minlength=num_sensors * width)\
+        .reshape(num_sensors, width)[:, :-1]
+    if equal_width:
+        counts[:, 0] -= nulls
+        counts[:, -1] = nulls
+    return counts
+
+def build_histograms(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        no_clean: bool,
+        num_bins: int = NUM_BINS,
+        value_range: tuple[float, float] | None = None,
+        edges: list[float] | None = None,
+        compare: bool = False,
+    ):
+    '''
+    Compute a histogram of each sensor in the sensor range over the time
+    range. The bins are given by `edges` (shared by every sensor), or are
+    `num_bins` equal-width bins over `value_range` or, if neither is given,
+    over each sensor's own range.
+
+    Returns the `Histograms`, the time taken and, if `compare` is true, the
+    time taken by `np.histogram()` on each sensor and whether the results
+    match.
+    '''
+    validate_analysis_inputs(*time_range, *sensor_range)
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError(
+            'Histograms can only be computed for a single data file.'
+        )
+    if edges is not None:
+        if len(edges) < 2 or np.any(np.diff(edges) <= 0):
+            raise ValueError('Bin edges must be at least two increasing values.')
+        num_bins = len(edges) - 1
+    elif num_bins < 1:
+        raise ValueError('There must be at least one bin.')
+    if value_range is not None and not value_range[0] < value_range[1]:
+        raise ValueError('The range\'s lower bound must be below its upper bound.')
+
+    data_subset, names, _ = select_block(
+        files[0], time_range, sensor_range, no_clean,
+    )
+
+    start_time = perf_counter()
+    # Each sensor's readings are kept contiguous.
+    block = np.vstack(data_subset).astype(float)
+    num_rows = block.shape[1]
+
+    # The pre-pass: the range of each sensor, ignoring nulls.
+    minimum = np.fmin.reduce(block, axis=1, initial=np.inf)
+    maximum = np.fmax.reduce(block, axis=1, initial=-np.inf)
+    minimum[np.isinf(minimum)] = np.nan
+    maximum[np.isinf(maximum)] = np.nan
+
+    if edges is not None:
+        sensor_edges = np.tile(np.asarray(edges, dtype=float), (len(names), 1))
+    elif value_range is not None:
+        sensor_edges = equal_edges(
+            np.full(len(names), value_range[0]),
+            np.full(len(names), value_range[1]),
+            num_bins,
+        )
+    else:
+        sensor_edges = equal_edges(minimum, maximum, num_bins)
+
+    bounds = bin_bounds(sensor_edges)
+
+    tasks = split_tiles(num_rows, len(names))
+    jobs = [
+        (block[sensors, rows], bounds[sensors], edges is None)
+        for rows, sensors in tasks
+    ]
+
+    results, _, _ = logger.log_task(
+        f'Binning {len(jobs)} tiles (method: {method})... '
+    )(generate_descriptions)(bin_counts, jobs, method)
+
+    # Add up the counts of each tile, sensor batch by sensor
+    # batch.
+    totals = np.zeros((len(names), num_bins + 3), dtype=np.int64)
+    for (_, sensors), counts in zip(tasks, results):
+        totals[sensors] += counts
+
+    histograms = Histograms(
+        sensors = names,
+        edges = sensor_edges,
+        counts = totals[:, 1:-2],
+        below = totals[:, 0],
+        above = totals[:, -2],
+        nulls = totals[:, -1],
+        minimum = minimum,
+        maximum = maximum,
+    )
+    time_taken = perf_counter() - start_time
+
+    if not compare:
+        return histograms, time_taken, None, None
+
+    # Compare with `np.histogram()` on the same data.
+    start_time = perf_counter()
+    expected = [
+        np.histogram(column[~np.isnan(column)], bins)[0]
+        for column, bins in zip(block, sensor_edges)
+    ]
+    numpy_time = perf_counter() - start_time
+    matches = np.array_equal(histograms.counts, np.array(expected))
+
+    return histograms, time_taken, numpy_time, matches
@@ -0,0 +1,195 @@
+'''
+Background jobs for the CLI. Commands can be run as jobs on a small pool of
+threads, with the log output of each job captured so that it can be shown
+once the job has finished instead of interleaving with the prompt.
+
+Every command which is running (in the foreground or as a job) takes an equal
+share of the session's workers; see `worker_share()`.
+'''
+
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from os import cpu_count
+from threading import Event, Lock, local
+from time import perf_counter
+from typing import Callable
+
+import logger
+import placement
+
+
+# The number of workers shared between every command running in the session.
+SESSION_WORKERS = cpu_count() or 1
+
+# The maximum number of jobs which run at once. Further jobs wait for one of
+# these to finish before starting.
+MAX_JOBS = 8
+
+# Commands running at the moment, and the job (if any) each thread is
+# running.
+_active_lock = Lock()
+_num_active = 0
+_context = local()
+
+
+def worker_share():
+    '''
+    Get the number of workers the calling command may use: an equal share of
+    the session's workers between every command currently running, and at
+    least one. The share is taken each time an executor is created, so a
+    long-running command gets more workers as others finish.
+
+    Commands whose placement sets the number of workers get that number
+    instead.
+    '''
+    workers = placement.current().workers
+    if workers is not None:
+        return workers
+    with _active_lock:
+        return max(1, SESSION_WORKERS // max(_num_active, 1))
+
+@contextmanager
+def active_command(job: 'Job | None' = None):
+    '''
+    Mark a command as running for the duration of the `with` block, so that
+    it is counted by `worker_share()`. If the command is running as a job,
+    pass the job so that it can be cancelled.
+    '''
+    global _num_active
+    with _active_lock:
+        _num_active += 1
+    _context.job = job
+    try:
+        yield
+    finally:
+        _context.job = None
+        with _active_lock:
+            _num_active -= 1
+
+def check_cancelled():
+    '''
+    Raise a `CancelledError` if the job running in the calling thread has been
+    cancelled. Long-running tasks call this between units of work.
+    '''
+    job: Job | None = getattr(_context, 'job', None)
+    if job is not None and job.cancel_event.is_set():
+        raise CancelledError(f'Job {job.id} was cancelled.')
+
+
+@dataclass
+class Job:
+    '''
+    A command running (or waiting to run) in the background.
+    '''
+    id: int
+    command_text: str
+    future: Future | None = None
+    cancel_event: Event = field(default_factory=Event)
+    # Log output of the command, captured while it runs.
+    output: list[str] = field(default_factory=list)
+    started: float | None = None
+    finished: float | None = None
+    # Whether the user has been told that the job has finished.
+    reported: bool = False
+
+    @property
+    def status(self):
+        '''
+        One of `'pending'`, `'running'`, `'cancelled'`, `'failed'` or
+        `'done'`.
+        '''
+        if self.future.cancelled() or (
+                self.future.done() and self.cancel_event.is_set()):
+            return 'cancelled'
+        if not self.future.done():
+            return 'running' if self.started is not None else 'pending'
+        if self.future.exception() is not None:
+            return 'failed'
+        return 'done'
+
+    @property
+    def elapsed(self):
+        '''The time the job has been running for, or ran for, in seconds.'''
+        if self.started is None:
+            return 0.0
+        end = self.finished if self.finished is not None else perf_counter()
+        return end - self.started
+
+    def result_text(self):
+        '''
+        Get the captured output and result of a finished job.
+        '''
+        text = ''.join(self.output)
+        if self.future.cancelled():
+            return text
+        exception = self.future.exception()
+        if exception is not None:
+            return f'{text}Job failed: {exception!r}\n'
+        return text + self.future.result()
+
+
+class JobScheduler:
+    '''
+    Runs commands as background jobs, and keeps track of them by ID.
+    '''
+    def __init__(self, max_jobs: int = MAX_JOBS):
+        self._executor = ThreadPoolExecutor(
+            max_workers = max_jobs,
+            thread_name_prefix = 'job',
+        )
+        self.jobs: dict[int, Job] = {}
+
+    def submit(self, command_text: str, task: Callable[[], str]):
+        '''
+        Run `task` as a background job, returning the `Job`.
+        '''
+        job = Job(len(self.jobs) + 1, command_text)
+
+        def run_job():
+            job.started = perf_counter()
+            try:
+                with active_command(job), logger.capture(job.output):
+                    return task()
+            finally:
+                job.finished = perf_counter()
+
+        job.future = self._executor.submit(run_job)
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: int):
+        '''
+        Get a job by ID, raising a `ValueError` if there is no such job.
+        '''
+        if job_id not in self.jobs:
+            raise ValueError(f'No job with ID {job_id}.')
+        return self.jobs[job_id]
+
+    def cancel(self, job_id: int):
+        '''
+        Cancel a job. Jobs which have not started are never run; running jobs
+        stop at their next `check_cancelled()` call.
+        '''
+        job = self.get(job_id)
+        job.cancel_event.set()
+        job.future.cancel()
+        return job
+
+    def cancel_all(self):
+        '''Cancel every job which has not finished.'''
+        for job in self.jobs.values():
+            if not job.future.done():
+                self.cancel(job.id)
+
+    def newly_finished(self):
+        '''
+        Get the jobs which have finished since this was last called.
+        '''
+        finished = [
+            job for job in self.jobs.values()
+            if job.future.done() and not job.reported
+        ]
+        for job in finished:
+            job.reported = True
+        return finished
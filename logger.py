@@ -1,39 +1,347 @@
-from time import perf_counter
-from typing import Any, Callable
-from util import CLEAR_SCREEN, TEXT_YELLOW, TEXT_RED, TEXT_RESET
+import sys
+from abc import ABC, abstractmethod
+from atexit import register as at_exit
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from json import dumps
+from pathlib import Path
+from queue import Queue
+from re import sub
+from threading import Event, Lock, Thread, local
+from time import perf_counter, time
+from typing import Any, Callable, TextIO
+from util import CLEAR_LINE, CLEAR_SCREEN, TEXT_YELLOW, TEXT_RED, TEXT_RESET
 
 
 '''
 Logging utilities. Used throughout code instead of builtins so that
 logging can be controlled as needed, and to make the rest of the code
 cleaner.
+
+Messages are filtered by level and queued, then written to each sink (the
+terminal, and optionally log files) by a background thread, so logging does
+not block the code doing it. Call `flush()` to wait for queued messages to
+be written.
 '''
 
-def _log(message: str, flush: bool):
-    print(message, flush=flush, end='')
+# Message levels. Results are what a command was asked to produce, so they
+# are still shown in quiet mode, which hides `INFO` messages.
+DEBUG = 10
+INFO = 20
+RESULT = 30
+WARNING = 40
+ERROR = 50
+
+LEVEL_NAMES = {
+    DEBUG: 'debug',
+    INFO: 'info',
+    RESULT: 'result',
+    WARNING: 'warning',
+    ERROR: 'error',
+}
+
+# Time between redraws of progress indicators, in seconds.
+PROGRESS_INTERVAL = 0.25
+
+
+@dataclass
+class Record:
+    '''
+    A single logged message.
+    '''
+    level: int
+    message: str
+    time: float = field(default_factory=time)
+    # Terminal control output, such as progress redraws, which is not
+    # written to log files.
+    terminal_only: bool = False
+
+
+class Sink(ABC):
+    '''
+    Somewhere log records are written. Sinks are only used by the writer
+    thread, so they do not need to be thread-safe.
+    '''
+    def __init__(self, level: int = DEBUG):
+        self.level = level
+
+    @abstractmethod
+    def write(self, record: Record):
+        '''Write a record.'''
+
+    def flush(self):
+        '''Flush any buffered output.'''
+
+    def close(self):
+        '''Flush and release the sink.'''
+        self.flush()
+
+
+class TerminalSink(Sink):
+    '''
+    Writes records to the terminal, with warnings and errors coloured.
+    '''
+    def __init__(self, stream: TextIO = sys.stdout, level: int = DEBUG):
+        super().__init__(level)
+        self.stream = stream
+
+    def write(self, record: Record):
+        match record.level:
+            case level if level >= ERROR:
+                self.stream.write(f'{TEXT_RED}{record.message}{TEXT_RESET}')
+            case level if level >= WARNING:
+                self.stream.write(f'{TEXT_YELLOW}{record.message}{TEXT_RESET}')
+            case _:
+                self.stream.write(record.message)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class FileSink(Sink):
+    '''
+    Appends records to a plain text log file, without terminal escape codes.
+    '''
+    def __init__(self, file_path: str | Path, level: int = DEBUG):
+        super().__init__(level)
+        self.file_path = Path(file_path)
+        self._file = open(self.file_path, 'a', encoding='utf-8')
+
+    def write(self, record: Record):
+        if not record.terminal_only:
+            self._file.write(strip_escapes(record.message))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JSONSink(FileSink):
+    '''
+    Appends records to a JSON Lines log file, one object per record with its
+    time, level and message.
+    '''
+    def write(self, record: Record):
+        if record.terminal_only:
+            return
+        self._file.write(dumps({
+            'time': datetime.fromtimestamp(record.time).isoformat(),
+            'level': LEVEL_NAMES.get(record.level, str(record.level)),
+            'message': strip_escapes(record.message).strip(),
+        }) + '\n')
+
+
+def strip_escapes(message: str):
+    '''Remove terminal escape codes (and carriage returns) from a message.'''
+    return sub(r'\x1b\[[0-9;]*[A-Za-z]|\r', '', message)
+
+
+# Sinks, the minimum level written, and the queue of records waiting to be
+# written by the writer thread.
+_sinks: list[Sink] = [TerminalSink()]
+_level = INFO
+_queue: Queue[Record | Callable[[], None]] = Queue()
+_writer: Thread | None = None
+_writer_lock = Lock()
+
+# Output captured by `capture()`, and levels set by `quiet()`, per thread.
+_context = local()
+
+
+def _report_failure(action: str, error: Exception):
+    '''
+    Report an error raised by a sink (or queued call) on `stderr`, so that
+    it does not stop the writer thread.
+    '''
+    try:
+        sys.stderr.write(
+            f'Logging error while {action}: {type(error).__name__}: {error}\n'
+        )
+    except Exception:
+        pass
+
+def _write_records():
+    '''
+    Writer thread: write queued records to every sink, flushing the sinks
+    whenever the queue runs dry so that output is written in batches.
+
+    Errors from a sink only affect that sink (and that record), and every
+    item is marked done even if it fails, so `flush()` never waits forever.
+    '''
+    while True:
+        item = _queue.get()
+        try:
+            if isinstance(item, Record):
+                for sink in list(_sinks):
+                    if item.level >= sink.level:
+                        try:
+                            sink.write(item)
+                        except Exception as error:
+                            _report_failure(
+                                f'writing to {type(sink).__name__}', error,
+                            )
+            else:
+                try:
+                    item()
+                except Exception as error:
+                    _report_failure('updating the sinks', error)
+
+            if _queue.empty():
+                for sink in list(_sinks):
+                    try:
+                        sink.flush()
+                    except Exception as error:
+                        _report_failure(
+                            f'flushing {type(sink).__name__}', error,
+                        )
+        finally:
+            _queue.task_done()
+
+def _enqueue(item: Record | Callable[[], None]):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = Thread(target=_write_records, daemon=True)
+                _writer.start()
+    _queue.put(item)
+
+def _enabled(level: int):
+    return level >= getattr(_context, 'level', _level)
 
-def log(message: str, flush: bool = True) -> None:
+def _log(message: str, flush: bool, level: int = INFO):
+    if not _enabled(level):
+        return
+
+    buffer = getattr(_context, 'buffer', None)
+    if buffer is not None:
+        if level >= ERROR:
+            message = f'{TEXT_RED}{message}{TEXT_RESET}'
+        elif level >= WARNING:
+            message = f'{TEXT_YELLOW}{message}{TEXT_RESET}'
+        buffer.append(message)
+        return
+
+    _enqueue(Record(level, message))
+    if flush:
+        _queue.join()
+
+def flush():
+    '''
+    Wait until every message logged so far has been written.
+    '''
+    if _writer is not None:
+        _queue.join()
+
+at_exit(flush)
+
+def set_level(level: int):
+    '''
+    Set the minimum level of the messages which are logged.
+    '''
+    global _level
+    _level = level
+
+def get_level():
+    '''Get the minimum level of the messages which are logged.'''
+    return _level
+
+def add_sink(sink: Sink):
+    '''
+    Write log messages to another sink, as well as the existing ones.
     '''
-    Basic alternative to `print()`.
+    _enqueue(lambda: _sinks.append(sink))
+    flush()
+
+def remove_sink(sink: Sink):
+    '''
+    Stop writing log messages to a sink, closing it.
+    '''
+    def remove():
+        _sinks.remove(sink)
+        sink.close()
+    _enqueue(remove)
+    flush()
+
+def get_sinks():
+    '''Get the sinks log messages are written to.'''
+    return list(_sinks)
+
+@contextmanager
+def capture(buffer: list[str]):
+    '''
+    Append everything logged by the current thread to `buffer` instead of
+    printing it, for the duration of the `with` block. Used to keep the output
+    of background jobs away from the terminal.
     '''
-    _log(message, flush)
+    previous = getattr(_context, 'buffer', None)
+    _context.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        _context.buffer = previous
 
-def warn(message: str, flush: bool = True):#
+@contextmanager
+def quiet(enabled: bool = True):
+    '''
+    Hide `INFO` and `DEBUG` messages (including progress indicators) logged by
+    the current thread for the duration of the `with` block, so that no
+    output is produced while work is being timed. Results, warnings and errors
+    are still logged.
+    '''
+    if not enabled:
+        yield
+        return
+
+    previous = getattr(_context, 'level', None)
+    _context.level = max(RESULT, previous or _level)
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _context.level
+        else:
+            _context.level = previous
+
+def debug(message: str, flush: bool = False):
+    '''
+    Similar to `log()`, but for detail which is hidden by default.
+    '''
+    _log(message, flush, DEBUG)
+
+def log(message: str, flush: bool = False) -> None:
+    '''
+    Basic alternative to `print()`. If `flush` is true, wait for the message
+    to be written before returning.
+    '''
+    _log(message, flush, INFO)
+
+def result(message: str, flush: bool = False):
+    '''
+    Similar to `log()`, but for the results of a command, which are shown
+    even in quiet mode.
+    '''
+    _log(message, flush, RESULT)
+
+def warn(message: str, flush: bool = False):#
     '''
     Similar to `log()`, but prints a warning message (in yeloow text).
     '''
-    _log(f'{TEXT_YELLOW}{message}{TEXT_RESET}', flush)
+    _log(message, flush, WARNING)
 
-def error(message: str, flush: bool = True):
+def error(message: str, flush: bool = False):
     '''
     Similar to `log()`, but prints an error message (in red text).
     '''
-    _log(f'{TEXT_RED}{message}{TEXT_RESET}', flush)
+    _log(message, flush, ERROR)
 
 def log_task(
         message: str,
         task_completed_message: str = 'Complete',
-        flush = True,
+        flush = False,
     ):
     '''
     Wraps a function so that a message is printed before the function is
@@ -45,11 +353,11 @@ def log_task(
     ```python
     def my_task(text: str):
         return f'you passed "{text}"!'
-    
+
     logger = Logger()
     task_result = logger.log_task('Starting task... ')(my_task)('Hello')
     logger.log(task_result)
-    
+
     >>> Starting task... Complete
     >>> You passed "Hello"!
     ```
@@ -63,15 +371,67 @@ def log_task(
             result = task(*args, **kwargs)
             duration = perf_counter() - start_time
 
-            _log(f'{task_completed_message} ({duration}).\n', True)
+            _log(f'{task_completed_message} ({duration}).\n', flush)
 
             return result
         return inner
     return wrapper
 
+
+class Progress:
+    '''
+    A progress indicator, redrawn on its line of the terminal every
+    `PROGRESS_INTERVAL` seconds by a background thread rather than on every
+    update, so updating it inside a timed loop costs no I/O.
+
+    Usage example:
+    ```python
+    with logger.Progress('Working', 100) as progress:
+        for index in range(100):
+            do_work()
+            progress.update(index + 1)
+    ```
+    '''
+    def __init__(self, message: str, total: int):
+        self.message = message
+        self.total = total
+        self.done = 0
+
+        # Progress is only redrawn on the terminal; captured
+        # or quiet output just gets the final state.
+        self._redraw = _enabled(INFO)\
+            and getattr(_context, 'buffer', None) is None
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def _line(self):
+        return f'{CLEAR_LINE}{self.message}... ({self.done} of {self.total})'
+
+    def _run(self):
+        while not self._stop.wait(PROGRESS_INTERVAL):
+            _enqueue(Record(INFO, self._line(), terminal_only=True))
+
+    def update(self, done: int):
+        '''Record how many of the steps are done.'''
+        self.done = done
+
+    def __enter__(self):
+        if self._redraw:
+            _enqueue(Record(INFO, self._line(), terminal_only=True))
+            self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        if self._redraw:
+            self._stop.set()
+            self._thread.join()
+        _log(self._line(), False)
+
 def clear_terminal(flush = True):
     '''
     Clear all text on the terminal window and reset the cursor position to
     the top left of the terminal window.
     '''
-    _log(CLEAR_SCREEN, flush)
+    _enqueue(Record(INFO, CLEAR_SCREEN, terminal_only=True))
+    if flush:
+        _queue.join()
@@ -0,0 +1,212 @@
+'''
+Metadata manifest sidecars. A manifest records what a data file holds: its
+columns and their types, the range of sensor numbers, the first and last
+timestamps, the number of rows and the number of missing values in each
+column. It is built with a single scan of the file.
+
+With a manifest, CSV files are parsed with the recorded types instead of
+inferring them, and queries are validated against the bounds of the file
+being analysed instead of the defaults in `util`, without reading any data.
+'''
+
+from dataclasses import dataclass
+from json import dump, load
+from pathlib import Path
+from re import fullmatch
+
+import numpy as np
+from pandas import read_csv
+from pandas.api.types import pandas_dtype
+
+import logger
+from util import (
+    SENSOR_INDEX_MAX,
+    SENSOR_INDEX_MIN,
+    TIME_MAX,
+    TIME_MIN,
+    resolve_data_files,
+)
+
+
+# Extension added to a data file's name to give the name of its manifest.
+METADATA_SUFFIX = '.meta.json'
+
+# Number of rows parsed at a time while scanning a file.
+SCAN_CHUNK_ROWS = 100_000
+
+
+@dataclass
+class DatasetMetadata:
+    '''
+    The manifest of a data file. `dtypes` maps each column to the name of
+    the type `read_csv()` infers for it over the whole file.
+    '''
+    file_path: Path
+    columns: tuple[str, ...]
+    dtypes: dict[str, str]
+    sensor_range: tuple[int, int]
+    time_range: tuple[str, str]
+    rows: int
+    null_counts: dict[str, int]
+    # Size and modification time of the data file when it was scanned, used
+    # to detect stale manifests.
+    source_size: int
+    source_mtime: int
+
+
+def metadata_path(file_path: str | Path):
+    '''
+    Get the path of the manifest sidecar of a data file.
+    '''
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + METADATA_SUFFIX)
+
+def _common_dtype(dtypes: set[str]):
+    '''
+    Find the type `read_csv()` gives a column which it parsed in chunks with
+    the types given: numeric types are widened, and anything else is read as
+    strings.
+    '''
+    if len(dtypes) == 1:
+        return next(iter(dtypes))
+    if all(pandas_dtype(dtype).kind in 'biuf' for dtype in dtypes):
+        return str(np.result_type(*dtypes))
+    return 'str'
+
+def build_metadata(file_path: str | Path):
+    '''
+    Scan a data file and write its manifest sidecar.
+    '''
+    file_path = Path(file_path)
+    stat = file_path.stat()
+
+    dtypes: dict[str, set[str]] = {}
+    null_counts: dict[str, int] = {}
+    rows = 0
+    time_range = None
+    for chunk in read_csv(file_path, chunksize=SCAN_CHUNK_ROWS):
+        for column, dtype in chunk.dtypes.items():
+            dtypes.setdefault(column, set()).add(str(dtype))
+        for column, count in chunk.isna().sum().items():
+            null_counts[column] = null_counts.get(column, 0) + int(count)
+        rows += len(chunk)
+
+        # Timestamps are ISO 8601 strings, so they sort as text.
+        timestamps = chunk['timestamp'].dropna()
+        if len(timestamps) > 0:
+            first, last = timestamps.min(), timestamps.max()
+            if time_range is not None:
+                first = min(first, time_range[0])
+                last = max(last, time_range[1])
+            time_range = (first, last)
+
+    if time_range is None:
+        raise ValueError(f'"{file_path}" has no timestamped rows.')
+
+    sensors = [
+        int(match.group(1)) for match in (
+            fullmatch(r'sensor_(\d+)', column) for column in dtypes
+        ) if match is not None
+    ]
+    if len(sensors) == 0:
+        raise ValueError(f'"{file_path}" has no sensor columns.')
+
+    metadata = DatasetMetadata(
+        file_path = file_path,
+        columns = tuple(dtypes),
+        dtypes = {
+            column: _common_dtype(column_dtypes)
+            for column, column_dtypes in dtypes.items()
+        },
+        sensor_range = (min(sensors), max(sensors)),
+        time_range = time_range,
+        rows = rows,
+        null_counts = null_counts,
+        source_size = stat.st_size,
+        source_mtime = stat.st_mtime_ns,
+    )
+
+    with open(metadata_path(file_path), 'w', encoding='utf-8') as file:
+        dump({
+            'columns': list(metadata.columns),
+            'dtypes': metadata.dtypes,
+            'sensor_range': list(metadata.sensor_range),
+            'time_range': list(metadata.time_range),
+            'rows': metadata.rows,
+            'null_counts': metadata.null_counts,
+            'source_size': metadata.source_size,
+            'source_mtime': metadata.source_mtime,
+        }, file, indent=2)
+
+    return metadata
+
+def load_metadata(file_path: str | Path):
+    '''
+    Load the manifest sidecar of the data file specified. Returns `None` if
+    there is no manifest, or if the data file has changed since it was
+    scanned.
+    '''
+    file_path = Path(file_path)
+    sidecar = metadata_path(file_path)
+    if not sidecar.exists():
+        return None
+
+    with open(sidecar, encoding='utf-8') as file:
+        data = load(file)
+
+    stat = file_path.stat()
+    if (data['source_size'], data['source_mtime'])\
+            != (stat.st_size, stat.st_mtime_ns):
+        logger.warn(
+            f'Ignoring stale manifest "{sidecar}"; rebuild it with'
+            ' `build-meta`.\n'
+        )
+        return None
+
+    return DatasetMetadata(
+        file_path = file_path,
+        columns = tuple(data['columns']),
+        dtypes = data['dtypes'],
+        sensor_range = tuple(data['sensor_range']),
+        time_range = tuple(data['time_range']),
+        rows = data['rows'],
+        null_counts = data['null_counts'],
+        source_size = data['source_size'],
+        source_mtime = data['source_mtime'],
+    )
+
+def csv_dtypes(file_path: str | Path):
+    '''
+    Get the column types to parse a data file with, for the `dtype` argument
+    of `read_csv()`. Returns `None` (so that types are inferred) if the file
+    has no manifest.
+    '''
+    metadata = load_metadata(file_path)
+    return None if metadata is None else metadata.dtypes
+
+def dataset_bounds(file_path: str | Path):
+    '''
+    Get the time and sensor bounds of a data file (or a directory or glob
+    pattern of data files) from their manifests, as arguments for
+    `util.use_query_bounds()`. If any file has no manifest, the default
+    bounds in `util` are returned.
+    '''
+    defaults = ((TIME_MIN, TIME_MAX), (SENSOR_INDEX_MIN, SENSOR_INDEX_MAX))
+    try:
+        files = resolve_data_files(file_path)
+        manifests = [load_metadata(path) for path in files]
+    except OSError:
+        return defaults
+    if any(metadata is None for metadata in manifests):
+        return defaults
+
+    return (
+        (
+            min(metadata.time_range[0] for metadata in manifests),
+            max(metadata.time_range[1] for metadata in manifests),
+        ),
+        (
+            min(metadata.sensor_range[0] for metadata in manifests),
+            max(metadata.sensor_range[1] for metadata in manifests),
+        ),
+    )
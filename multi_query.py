@@ -0,0 +1,245 @@
+'''
+Shared-scan execution of many summary queries over one dataset. Rather than
+reading, cleaning and subsetting the data once per query, the union of every
+query's window is read and cleaned once, and each sensor column is swept once
+for all of the queries which select it.
+'''
+
+from bisect import bisect_left
+from csv import DictReader
+from dataclasses import dataclass
+from json import load
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from pandas import Series
+
+import logger
+from aggregate import merge_partials, partial_summary
+from planner import (
+    plan_selection,
+    select_cells,
+    selected_timestamps,
+    status_mask,
+    time_slice,
+)
+from proc import generate_descriptions, log_clean_counts, subprocess_task
+from time_index import read_time_window
+from util import date_string, sensor_name, validate_analysis_inputs
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    '''
+    A single summary query: a time range and a sensor range, both inclusive.
+    '''
+    time_start: str
+    time_end: str
+    sensor_start: int
+    sensor_end: int
+
+    @property
+    def sensors(self):
+        '''The indices of the sensors selected by the query.'''
+        return range(self.sensor_start, self.sensor_end + 1)
+
+
+def load_query_specs(file_path: str | Path):
+    '''
+    Load a list of `QuerySpec`s from a JSON file (a list of objects) or a CSV
+    file, both with the fields `time_start`, `time_end`, `sensor_start` and
+    `sensor_end`. Every spec is validated, raising a `ValueError` if any is
+    invalid.
+    '''
+    file_path = Path(file_path)
+    with open(file_path, encoding='utf-8', newline='') as file:
+        if file_path.suffix == '.json':
+            entries = load(file)
+        else:
+            entries = list(DictReader(file))
+
+    specs = []
+    for number, entry in enumerate(entries, 1):
+        try:
+            spec = QuerySpec(
+                time_start = date_string(entry['time_start']),
+                time_end = date_string(entry['time_end']),
+                sensor_start = int(entry['sensor_start']),
+                sensor_end = int(entry['sensor_end']),
+            )
+            validate_analysis_inputs(
+                spec.time_start, spec.time_end,
+                spec.sensor_start, spec.sensor_end,
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'Invalid query {number} in "{file_path}": {e}')
+        specs.append(spec)
+
+    if len(specs) == 0:
+        raise ValueError(f'No queries found in "{file_path}".')
+
+    return specs
+
+def sweep_column(job: tuple[np.ndarray, list[tuple[int, int] | None]]):
+    '''
+    Summarise one sensor column for every query which selects it, in a single
+    pass over the column.
+
+    `job` holds the column and, for each query, its `[start, end)` row window
+    within the column (or `None` if the query does not select the sensor).
+    The windows' boundaries, sorted by time, split the column into elementary
+    segments, each of which is summarised once. Each query then merges the
+    summaries of the segments it covers, with its quantiles found from the
+    values of just those segments.
+
+    Returns one `describe()`-style `Series` per query, or `None` for queries
+    which do not select the sensor.
+    '''
+    column, windows = job
+
+    boundaries = sorted({
+        bound for window in windows if window is not None for bound in window
+    })
+    segments = [
+        partial_summary(column[start:end])
+        for start, end in zip(boundaries, boundaries[1:])
+    ]
+
+    results: list[Series | None] = []
+    for window in windows:
+        if window is None:
+            results.append(None)
+            continue
+
+        first = bisect_left(boundaries, window[0])
+        last = bisect_left(boundaries, window[1])
+        results.append(merge_partials(segments[first:last]).to_series())
+
+    return results
+
+def summarise_queries(
+        file_path: str | Path,
+        specs: list[QuerySpec],
+        method: str = 'process',
+        no_clean: bool = False,
+    ):
+    '''
+    Run many summary queries over one data file with a single shared scan.
+
+    Returns one list of `describe()`-style `Series` per query (one `Series`
+    per sensor in the query's sensor range), in the order the queries were
+    given, and the time taken.
+    '''
+    start_time = perf_counter()
+
+    # Read the union of the queries' windows once, and find
+    # the rows in it which are kept when cleaning.
+    time_start = min(spec.time_start for spec in specs)
+    time_end = max(spec.time_end for spec in specs)
+    df = logger.log_task('Reading CSV file data into DataFrame... ')\
+        (read_time_window)(file_path, time_start, time_end)
+    rows = time_slice(df, time_start, time_end)
+    keep = None
+    if not no_clean:
+        keep, removed = status_mask(df, rows)
+        log_clean_counts(*removed)
+
+    # Find each query's row window by binary search of the
+    # (sorted) timestamps.
+    timestamps = selected_timestamps(df, rows, keep)
+    order = None
+    if not np.all(timestamps[1:] >= timestamps[:-1]):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+
+    windows = [
+        (
+            int(np.searchsorted(
+                timestamps, np.datetime64(spec.time_start), 'left',
+            )),
+            int(np.searchsorted(
+                timestamps, np.datetime64(spec.time_end), 'right',
+            )),
+        )
+        for spec in specs
+    ]
+
+    # One job per sensor selected by any query, holding the
+    # column and the window of every query which selects it.
+    sensors = sorted({index for spec in specs for index in spec.sensors})
+    names = [sensor_name(sensor) for sensor in sensors]
+    columns = logger.log_task('Selecting sensor columns for the queries... ')\
+        (select_cells)(df, rows, names, keep)
+    if order is not None:
+        columns = [column[order] for column in columns]
+    jobs = [
+        (
+            np.asarray(column, dtype=float),
+            [
+                windows[index] if sensor in specs[index].sensors else None
+                for index in range(len(specs))
+            ],
+        )
+        for sensor, column in zip(sensors, columns)
+    ]
+
+    sensor_results, _, _ = logger.log_task(
+        f'Sweeping {len(sensors)} sensors for {len(specs)} queries'
+        f' (method: {method})... '
+    )(generate_descriptions)(sweep_column, jobs, method)
+
+    results = [
+        [
+            sensor_results[sensors.index(sensor)][index]
+            for sensor in spec.sensors
+        ]
+        for index, spec in enumerate(specs)
+    ]
+    return results, perf_counter() - start_time
+
+def summarise_queries_separately(
+        file_path: str | Path,
+        specs: list[QuerySpec],
+        method: str = 'process',
+        no_clean: bool = False,
+    ):
+    '''
+    Run each summary query on its own, reading, cleaning and subsetting the
+    data file once per query as `summary` does. Used as a baseline for
+    `summarise_queries()`.
+
+    Returns results in the same form as `summarise_queries()`.
+    '''
+    start_time = perf_counter()
+
+    results = []
+    for spec in specs:
+        df = read_time_window(file_path, spec.time_start, spec.time_end)
+        rows, names, keep, _ = plan_selection(
+            df, spec.time_start, spec.time_end,
+            spec.sensor_start, spec.sensor_end, no_clean,
+        )
+        columns = select_cells(df, rows, names, keep)
+        descriptions, _, _ = generate_descriptions(
+            subprocess_task, columns, method,
+        )
+        results.append(descriptions)
+
+    return results, perf_counter() - start_time
+
+def max_difference(results: list[list[Series]], other: list[list[Series]]):
+    '''
+    Find the largest absolute difference between two sets of query results.
+    Statistics which are NaN in both are treated as equal.
+    '''
+    difference = 0.0
+    for query_results, other_query_results in zip(results, other):
+        for series, other_series in zip(query_results, other_query_results):
+            diff = (series - other_series).abs()
+            both_nan = series.isna() & other_series.isna()
+            if (diff.isna() & ~both_nan).any():
+                return np.inf
+            difference = max(difference, diff.fillna(0).max())
+
+    return difference
@@ -0,0 +1,226 @@
+'''
+Machine-readable result writers. Each writer receives one sensor summary at a
+time and writes it out straight away, so results can be consumed while the
+analysis is still running.
+'''
+
+from abc import ABC, abstractmethod
+from csv import writer as csv_writer
+from json import dumps
+from math import isnan
+from pathlib import Path
+
+from pandas import DataFrame, Series
+
+
+# Formats which can be passed to `get_result_writer()`.
+OUTPUT_FORMATS = ['json', 'csv', 'arrow']
+
+
+class ResultWriter(ABC):
+    '''
+    Base class for the result writers. Subclasses implement `_open()`,
+    `_write()` and `_close()`.
+
+    Writers can be used as context managers:
+    ```py
+    with get_result_writer('json', 'out.jsonl') as writer:
+        writer.write('sensor_00', description)
+    ```
+    '''
+    def __init__(self, file_path: str | Path) -> None:
+        self.file_path = Path(file_path)
+        self.num_written = 0
+        self._open()
+
+    def write(self, sensor: str, description: Series):
+        '''
+        Write the summary of a single sensor.
+        '''
+        self._write(sensor, description)
+        self.num_written += 1
+
+    def close(self):
+        '''
+        Flush and close the underlying file.
+        '''
+        self._close()
+
+    @abstractmethod
+    def _open(self):
+        pass
+
+    @abstractmethod
+    def _write(self, sensor: str, description: Series):
+        pass
+
+    @abstractmethod
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _as_float(value):
+    '''
+    Convert a summary value to a plain `float`, or `None` if it is NaN.
+    '''
+    value = float(value)
+    return None if isnan(value) else value
+
+def _is_text(value):
+    '''
+    Check whether a summary value is text (e.g. a timestamp) rather than a
+    number. Text values may be missing (`None`).
+    '''
+    return value is None or isinstance(value, str)
+
+
+class JSONResultWriter(ResultWriter):
+    '''
+    Writes results as JSON Lines: one JSON object per sensor, per line.
+    '''
+    def _open(self):
+        self._file = open(self.file_path, 'w', encoding='utf-8')
+
+    def _write(self, sensor: str, description: Series):
+        record = {'sensor': sensor}
+        record.update(
+            (str(key), value if _is_text(value) else _as_float(value))
+            for key, value in description.items()
+        )
+        self._file.write(dumps(record) + '\n')
+        # Flush so that readers tailing the file see each
+        # result as soon as it is available.
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class CSVResultWriter(ResultWriter):
+    '''
+    Writes results as CSV: one row per sensor, one column per statistic.
+    '''
+    def _open(self):
+        self._file = open(self.file_path, 'w', encoding='utf-8', newline='')
+        self._writer = csv_writer(self._file)
+        self._header_written = False
+
+    def _write(self, sensor: str, description: Series):
+        # The header can only be written once the names of
+        # the statistics are known.
+        if not self._header_written:
+            self._writer.writerow(['sensor', *map(str, description.index)])
+            self._header_written = True
+
+        self._writer.writerow([sensor, *description.tolist()])
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ArrowResultWriter(ResultWriter):
+    '''
+    Writes results as an Arrow IPC stream, with one record batch per sensor.
+    Requires `pyarrow`.
+    '''
+    def _open(self):
+        # Imported here so that pyarrow is only needed if
+        # this format is actually used.
+        try:
+            import pyarrow # pylint: disable=import-outside-toplevel
+        except ImportError as exc:
+            raise ImportError(
+                'The "arrow" output format requires the `pyarrow` package.'
+            ) from exc
+
+        self._pa = pyarrow
+        self._sink = pyarrow.OSFile(str(self.file_path), 'wb')
+        self._writer = None
+
+    def _write(self, sensor: str, description: Series):
+        pa = self._pa
+
+        # The schema can only be created once the names of
+        # the statistics are known.
+        if self._writer is None:
+            schema = pa.schema(
+                [('sensor', pa.string())]
+                + [
+                    (str(key), pa.string() if _is_text(value) else pa.float64())
+                    for key, value in description.items()
+                ]
+            )
+            self._schema = schema
+            self._writer = pa.ipc.new_stream(self._sink, schema)
+
+        batch = pa.record_batch(
+            [pa.array([sensor])]
+            + [
+                pa.array([value], type=pa.string()) if _is_text(value)
+                    else pa.array([_as_float(value)], type=pa.float64())
+                for value in description.tolist()
+            ],
+            schema = self._schema,
+        )
+        self._writer.write_batch(batch)
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._sink.close()
+
+
+def write_table(df: DataFrame, output_format: str, file_path: str | Path):
+    '''
+    Write a whole table of results (e.g. a time series) to a file in one of
+    the `OUTPUT_FORMATS`. JSON output has one object per row, per line.
+    '''
+    match output_format:
+        case 'json':
+            df.to_json(file_path, orient='records', lines=True)
+        case 'csv':
+            df.to_csv(file_path, index=False)
+        case 'arrow':
+            try:
+                import pyarrow # pylint: disable=import-outside-toplevel
+            except ImportError as exc:
+                raise ImportError(
+                    'The "arrow" output format requires the `pyarrow`'
+                    ' package.'
+                ) from exc
+
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            with pyarrow.OSFile(str(file_path), 'wb') as sink:
+                with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+        case _:
+            raise ValueError(
+                'Output format must be one of: '
+                f'{", ".join(OUTPUT_FORMATS)}.'
+            )
+
+def get_result_writer(output_format: str, file_path: str | Path) -> ResultWriter:
+    '''
+    Create a result writer for the format specified.
+    '''
+    match output_format:
+        case 'json':
+            writer_class = JSONResultWriter
+        case 'csv':
+            writer_class = CSVResultWriter
+        case 'arrow':
+            writer_class = ArrowResultWriter
+        case _:
+            raise ValueError(
+                'Output format must be one of: '
+                f'{", ".join(OUTPUT_FORMATS)}.'
+            )
+
+    return writer_class(file_path)
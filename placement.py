@@ -0,0 +1,204 @@
+'''
+Worker placement. By default, worker processes float freely across every
+core, so benchmark timings vary with where the scheduler happens to put
+them. A placement fixes the number of workers and pins each one to a core
+(or a NUMA node) with `os.sched_setaffinity()` as it starts.
+
+Placements apply to the commands run by the calling thread, for the duration
+of a `use()` block, and are read by `util.create_executor()` and
+`jobs.worker_share()`.
+'''
+
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from threading import local
+
+
+# Where Linux lists the CPUs of each NUMA node.
+NODE_DIR = Path('/sys/devices/system/node')
+
+# Ways of placing workers:
+# - `none`: workers are not pinned.
+# - `compact`: one core per worker, filling each NUMA node in turn.
+# - `spread`: one core per worker, taking cores from each NUMA node in turn.
+# - `nodes`: each worker is bound to every core of one NUMA node, taking
+#   nodes in turn, and the scheduler chooses the core within the node.
+# A list of CPUs such as `0,2,4-7` may also be given, to pin one worker to
+# each CPU in the list in turn.
+AFFINITY_MODES = ['none', 'compact', 'spread', 'nodes']
+
+# Placement of the commands run by each thread.
+_context = local()
+
+
+@dataclass(frozen=True)
+class Placement:
+    '''
+    How the workers of a command are placed: the number of workers (`None`
+    for the command's usual share), and the CPUs each worker is pinned to, in
+    the order workers start (`None` if they are not pinned). Workers beyond
+    the end of `cpu_sets` wrap around to the start.
+    '''
+    workers: int | None = None
+    mode: str = 'none'
+    cpu_sets: tuple[frozenset[int], ...] | None = None
+
+    def describe(self):
+        '''
+        Describe the placement in a line of text, for benchmark output.
+        '''
+        workers = 'default' if self.workers is None else str(self.workers)
+        if self.cpu_sets is None:
+            return f'{workers} workers, not pinned.'
+
+        nodes = numa_nodes()
+        def node_of(cpu: int):
+            return next(
+                (node for node, cpus in nodes.items() if cpu in cpus), '?',
+            )
+
+        sets = ', '.join(
+            f'{index}: CPU {format_cpu_list(cpus)}'
+            f' (node {"/".join(sorted({str(node_of(cpu)) for cpu in cpus}))})'
+            for index, cpus in enumerate(self.cpu_sets)
+        )
+        return f'{workers} workers, pinned ({self.mode}) to {sets}.'
+
+
+def parse_cpu_list(text: str):
+    '''
+    Parse a Linux CPU list such as `0-3,8,10-11` into a sorted list of CPU
+    numbers.
+    '''
+    cpus = []
+    for part in text.strip().split(','):
+        if part == '':
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(cpus))
+
+def format_cpu_list(cpus: frozenset[int] | list[int]):
+    '''
+    Format CPU numbers as a Linux CPU list, e.g. `0-3,8`.
+    '''
+    cpus = sorted(cpus)
+    ranges = []
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(
+        str(first) if first == last else f'{first}-{last}'
+        for first, last in ranges
+    )
+
+def available_cpus():
+    '''
+    Get the CPUs this process may run on.
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def numa_nodes():
+    '''
+    Get the CPUs this process may run on, grouped by NUMA node. Systems which
+    do not list their nodes are treated as a single node.
+    '''
+    cpus = set(available_cpus())
+    nodes = {}
+    for node_dir in sorted(NODE_DIR.glob('node[0-9]*')):
+        try:
+            node_cpus = parse_cpu_list((node_dir / 'cpulist').read_text())
+        except (OSError, ValueError):
+            continue
+        node_cpus = [cpu for cpu in node_cpus if cpu in cpus]
+        if node_cpus:
+            nodes[int(node_dir.name[len('node'):])] = node_cpus
+
+    return nodes or {0: sorted(cpus)}
+
+def affinity_string(text: str):
+    '''
+    Validation function for use with `argparse`. Checks that the string is
+    one of the `AFFINITY_MODES` or a CPU list, and returns it unchanged.
+    Invalid strings will raise a `ValueError`.
+    '''
+    if text not in AFFINITY_MODES:
+        cpus = set(parse_cpu_list(text))
+        if not cpus:
+            raise ValueError('The CPU list is empty.')
+        if not cpus <= set(available_cpus()):
+            raise ValueError('The CPU list includes unavailable CPUs.')
+    return text
+
+def make_placement(workers: int | None, affinity: str | None):
+    '''
+    Work out the placement of a command's workers from the `--workers` and
+    `--affinity` options.
+    '''
+    if workers is not None and workers < 1:
+        raise ValueError('There must be at least one worker.')
+    if affinity is None or affinity == 'none':
+        return Placement(workers)
+    if not hasattr(os, 'sched_setaffinity'):
+        raise ValueError('Worker affinity is not supported on this platform.')
+
+    nodes = list(numa_nodes().values())
+    match affinity:
+        case 'compact':
+            cpu_sets = [{cpu} for cpus in nodes for cpu in cpus]
+        case 'spread':
+            # Take the next core of each node in turn.
+            cpu_sets = [
+                {cpus[index]}
+                for index in range(max(len(cpus) for cpus in nodes))
+                for cpus in nodes if index < len(cpus)
+            ]
+        case 'nodes':
+            cpu_sets = [set(cpus) for cpus in nodes]
+        case _:
+            cpu_sets = [{cpu} for cpu in parse_cpu_list(affinity)]
+
+    # Only the CPU sets used by the workers are kept.
+    if workers is not None:
+        cpu_sets = [cpu_sets[index % len(cpu_sets)] for index in range(workers)]
+    return Placement(
+        workers,
+        affinity if affinity in AFFINITY_MODES else 'cpus',
+        tuple(frozenset(cpus) for cpus in cpu_sets),
+    )
+
+def current():
+    '''
+    Get the placement of the command running in the calling thread.
+    '''
+    return getattr(_context, 'placement', None) or Placement()
+
+@contextmanager
+def use(placement: Placement):
+    '''
+    Place the workers of every executor created by the calling thread as
+    specified, for the duration of the `with` block.
+    '''
+    previous = getattr(_context, 'placement', None)
+    _context.placement = placement
+    try:
+        yield placement
+    finally:
+        _context.placement = previous
+
+def pin_worker(counter, cpu_sets: tuple[frozenset[int], ...]):
+    '''
+    Pin the calling worker to the next CPU set. `counter` is a shared
+    `multiprocessing.Value` counting the workers started so far, so each
+    worker takes a different set.
+    '''
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    os.sched_setaffinity(0, cpu_sets[index % len(cpu_sets)])
@@ -0,0 +1,232 @@
+'''
+Planned selection of the data to summarise. Cleaning the whole `DataFrame`
+and then subsetting it copies every column twice, even when only a few
+sensors over a short time are needed. Instead, the selection is planned:
+
+1. the time filter finds the slice of rows in the time range,
+2. the sensor filter finds the selected columns,
+3. the status mask is computed over the selected rows only, and
+4. both are applied at once, as views of the selected columns where no rows
+   need removing, or with a single copy of just the selected cells where
+   they do.
+
+`compare_pipelines()` measures the bytes allocated by each stage of the
+planned and the original (clean, then subset) pipelines.
+'''
+
+from time import perf_counter
+from tracemalloc import (
+    get_traced_memory,
+    is_tracing,
+    reset_peak,
+    start as start_tracing,
+    stop as stop_tracing,
+)
+from typing import Any, Callable
+
+import numpy as np
+from pandas import DataFrame, to_datetime
+
+from util import clean_df, date_string, sensor_name, subset_df
+
+
+def time_slice(df: DataFrame, time_start: str, time_end: str):
+    '''
+    Find the rows of a `DataFrame` (with a `timestamp` column of time strings)
+    from `time_start` to `time_end`, inclusive. The timestamps are compared
+    as strings, without converting them to Python objects, so the bounds are
+    first put in the same format (see `util.date_string()`). The rows of a
+    time-sorted file are contiguous, so a slice is returned; otherwise, an
+    array of row positions is returned.
+    '''
+    time_start, time_end = date_string(time_start), date_string(time_end)
+    timestamps = df['timestamp']
+    in_range = ((timestamps >= time_start) & (timestamps <= time_end))\
+        .to_numpy(dtype=bool)
+    if not in_range.any():
+        return slice(0, 0)
+
+    first = int(np.argmax(in_range))
+    last = len(in_range) - int(np.argmax(in_range[::-1]))
+    if in_range[first:last].all():
+        return slice(first, last)
+    return np.flatnonzero(in_range)
+
+def sensor_columns(df: DataFrame, sensor_start: int, sensor_end: int):
+    '''
+    Find the names of the columns from sensor `sensor_start` to sensor
+    `sensor_end`, in the order of the `DataFrame`'s columns.
+    '''
+    names = list(df.columns)
+    first = names.index(sensor_name(sensor_start))
+    last = names.index(sensor_name(sensor_end))
+    return names[first:last + 1]
+
+def status_mask(df: DataFrame, rows: slice | np.ndarray):
+    '''
+    Find which of the selected rows are kept when cleaning: those where the
+    machine is neither broken nor recovering. Only the selected rows'
+    statuses are read.
+
+    Returns the mask (`None` if every row is kept) and the number of broken
+    and recovering rows removed.
+    '''
+    statuses = df['machine_status'].iloc[rows]
+    broken = (statuses == 'BROKEN').to_numpy(dtype=bool)
+    recovering = (statuses == 'RECOVERING').to_numpy(dtype=bool)
+    removed = (int(broken.sum()), int(recovering.sum()))
+
+    if removed == (0, 0):
+        return None, removed
+    return ~(broken | recovering), removed
+
+def select_cells(
+        df: DataFrame,
+        rows: slice | np.ndarray,
+        names: list[str],
+        keep: np.ndarray | None,
+    ):
+    '''
+    Select the cells of the chosen rows and columns, as one array per column
+    (as for `util.subset_df()`). Columns are views of the `DataFrame`'s data
+    where possible; if rows are removed, only the selected cells are copied.
+    '''
+    if keep is not None:
+        if isinstance(rows, slice):
+            positions = np.flatnonzero(keep) + rows.start
+        else:
+            positions = rows[keep]
+        return [df[name].to_numpy()[positions] for name in names]
+    return [df[name].to_numpy()[rows] for name in names]
+
+def selected_timestamps(
+        df: DataFrame,
+        rows: slice | np.ndarray,
+        keep: np.ndarray | None,
+    ):
+    '''
+    Get the time of each selected row, as an array of `datetime64[ns]`.
+    '''
+    return to_datetime(select_cells(df, rows, ['timestamp'], keep)[0])\
+        .to_numpy(dtype='datetime64[ns]')
+
+def plan_selection(
+        df: DataFrame,
+        time_start: str,
+        time_end: str,
+        sensor_start: int,
+        sensor_end: int,
+        no_clean: bool = False,
+    ):
+    '''
+    Plan the selection of the data to summarise, without selecting it: find
+    the rows in the time range, the sensor columns and which of the rows are
+    kept when cleaning.
+
+    Returns the rows, the column names and the mask (as for
+    `select_cells()`), and the number of broken and recovering rows removed.
+    '''
+    rows = time_slice(df, time_start, time_end)
+    names = sensor_columns(df, sensor_start, sensor_end)
+    keep, removed = (None, (0, 0)) if no_clean else status_mask(df, rows)
+    return rows, names, keep, removed
+
+def planned_subset(
+        df: DataFrame,
+        time_start: str,
+        time_end: str,
+        sensor_start: int,
+        sensor_end: int,
+        no_clean: bool = False,
+    ):
+    '''
+    Select the data to summarise from a `DataFrame` as read from a data file,
+    filtering by time and sensor before cleaning. Unlike `util.clean_df()`
+    and `util.subset_df()`, the `DataFrame` is not modified, and the ranges
+    are not validated: callers validate them once, before reading any data,
+    since partitions may be selected in worker processes.
+
+    Returns the list of columns and the number of broken and recovering rows
+    removed from the time range.
+    '''
+    rows, names, keep, removed = plan_selection(
+        df, time_start, time_end, sensor_start, sensor_end, no_clean,
+    )
+    return select_cells(df, rows, names, keep), removed
+
+def _measure(task: Callable, *args: Any):
+    '''
+    Run a pipeline stage twice: once timed, and once with memory tracing to
+    find the peak number of bytes it allocates. Returns the result of the
+    timed run, the bytes allocated and the time taken.
+    '''
+    start_time = perf_counter()
+    result = task(*args)
+    duration = perf_counter() - start_time
+
+    reset_peak()
+    baseline = get_traced_memory()[0]
+    task(*args)
+    allocated = get_traced_memory()[1] - baseline
+
+    return result, allocated, duration
+
+def compare_pipelines(
+        df: DataFrame,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+    ):
+    '''
+    Run the original and planned selection pipelines on a `DataFrame`,
+    recording the peak bytes allocated (i.e. copied) and the time taken by
+    each stage. The `DataFrame` is not modified.
+
+    Returns a `DataFrame` with one row per stage.
+    '''
+    tracing = is_tracing()
+    if not tracing:
+        start_tracing()
+
+    rows = []
+    try:
+        # The original pipeline modifies the DataFrame it
+        # subsets, so it is given a shallow copy each time.
+        if not no_clean:
+            cleaned, allocated, duration = _measure(
+                lambda: clean_df(df)[0],
+            )
+            rows.append(('original', 'clean', allocated, duration))
+        else:
+            cleaned = df
+        _, allocated, duration = _measure(
+            lambda: subset_df(
+                cleaned.copy(deep=False), *time_range, *sensor_range,
+            ),
+        )
+        rows.append(('original', 'subset', allocated, duration))
+
+        selected, allocated, duration = _measure(time_slice, df, *time_range)
+        rows.append(('planned', 'time filter', allocated, duration))
+        names, allocated, duration = _measure(
+            sensor_columns, df, *sensor_range,
+        )
+        rows.append(('planned', 'sensor filter', allocated, duration))
+        keep = None
+        if not no_clean:
+            (keep, _), allocated, duration = _measure(
+                status_mask, df, selected,
+            )
+            rows.append(('planned', 'status mask', allocated, duration))
+        _, allocated, duration = _measure(
+            select_cells, df, selected, names, keep,
+        )
+        rows.append(('planned', 'select', allocated, duration))
+    finally:
+        if not tracing:
+            stop_tracing()
+
+    table = DataFrame(
+        rows, columns=['pipeline', 'stage', 'bytes copied', 'seconds'],
+    )
+    return table
@@ -2,17 +2,43 @@
 Main processing functionality.
 '''
 
+from concurrent.futures import CancelledError, FIRST_COMPLETED, wait
+from functools import partial
+from os import cpu_count
 from pathlib import Path
+from pickle import dumps, loads
 from time import perf_counter
 from typing import Callable
 
-from pandas import DataFrame, Series, read_csv
+import numpy as np
+from pandas import DataFrame, Series
 
 import logger
+from aggregate import (
+    PartialSummary,
+    describe_groups,
+    describe_with_gaps,
+    merge_partials,
+    summarise_rows,
+)
+from block_store import Predicate, open_block_store, select_columns
+from checkpoint import CHECKPOINT_RANGE_BYTES, Checkpoint, open_checkpoint
+from compression import detect_compression, summarise_compressed
+from jobs import check_cancelled, worker_share
+from planner import (
+    compare_pipelines,
+    plan_selection,
+    planned_subset,
+    select_cells,
+    selected_timestamps,
+)
+from reader import ByteRange, read_partition, split_byte_ranges
+from time_index import load_time_index, read_time_window
+from timing import PhaseTimings, TaskTiming, summarise_phase_timings
 from util import (
-    CLEAR_LINE,
-
+    create_executor,
     get_executor_class,
+    shutdown_now,
 
     TIME_MIN,
     TIME_MAX,
@@ -21,11 +47,17 @@ from util import (
     COLUMN_WIDTH,
     get_summaries_per_df,
     sensor_name,
-    subset_df,
-    clean_df,
+    resolve_data_files,
+    files_in_time_range,
+    validate_analysis_inputs,
 )
 
 
+# Longest time, in seconds, to wait for a task to complete before checking
+# whether the command has been cancelled.
+CANCEL_POLL_INTERVAL = 0.1
+
+
 def subprocess_task(data: list):
     '''
     Provide a data summary of the `Series` or `DataFrame` data provided.
@@ -39,36 +71,199 @@ def subprocess_task(data: list):
 
     return desc
 
+def summarise_partition(
+        partition: str | Path | ByteRange,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+        gaps: bool = False,
+    ):
+    '''
+    Read, clean and subset a single partition of a dataset (either a whole
+    file or a byte range within one), and provide a mergeable summary of each
+    selected sensor, profiling its gaps if `gaps` is true.
+
+    This is the function used by the subprocesses when a dataset is split
+    across several files, or a single file is read in parallel. Returns the
+    list of `PartialSummary` objects (one per sensor) and the number of broken
+    and recovering rows removed.
+    '''
+    # Whole files are read through their index, if they
+    # have one, so only the time window is parsed.
+    if isinstance(partition, ByteRange):
+        df = read_partition(partition)
+    else:
+        df = read_time_window(partition, *time_range)
+
+    return summarise_rows(df, time_range, sensor_range, no_clean, gaps)
+
+def timed_task(
+        task: Callable[[list], Series],
+        data: list | bytes,
+        serialised: bool,
+    ):
+    '''
+    Run `task` on `data`, recording when each stage of the task happened.
+
+    If `serialised` is true, `data` is a pickled column, and the result is
+    pickled before being returned, so that the time spent (un)pickling on
+    either side of the process boundary can be measured explicitly.
+    '''
+    started = perf_counter()
+    if serialised:
+        data = loads(data)
+
+    # Run the task itself.
+    compute_start = perf_counter()
+    result = task(data)
+    compute_end = perf_counter()
+
+    if serialised:
+        result = dumps(result)
+    finished = perf_counter()
+
+    return result, (started, compute_start, compute_end, finished)
+
 def generate_descriptions(
         subproc_task: Callable[[list], Series],
         columns: list[list],
         method: str,
+        on_result: Callable[[int, Series], None] | None = None,
     ):
     '''
     Maps tasks over the passed DataFrame data (“columns” variable), using the
     method and subprocess function specified.
+
+    If `on_result` is passed, it is called with the column index and result of
+    each task as soon as that task completes, which may not be in column order.
+
+    Returns the results (in column order), the total duration and a
+    `PhaseTimings` breakdown of that duration.
     '''
     executor_class = get_executor_class(method)
 
+    # Only data sent to other processes needs to be pickled.
+    serialised = method == 'process'
+
+    # Timings of each phase, recorded in the main process.
+    pool_start = serialise = submit = shutdown = 0.0
+    task_timings: list[TaskTiming] = []
+    descriptions: list[Series] = [None] * len(columns)
+
     # Record start time.
     start_time = perf_counter()
     if executor_class is None:
         # Perform task synchronously.
-        descriptions = [subprocess_task(column) for column in columns]
+        for index, column in enumerate(columns):
+            check_cancelled()
+            submitted = perf_counter()
+            description, stamps = timed_task(subproc_task, column, False)
+            descriptions[index] = description
+            task_timings.append(TaskTiming(submitted, *stamps))
+            if on_result is not None:
+                on_result(index, description)
     else:
-        # Perform task using multiprocessing or multithreading.
-        with executor_class() as executor:
-
-            # Send individual columns to subprocesses.
-            descriptions = list(executor.map(subproc_task, columns))
+        # Perform task using multiprocessing or multithreading,
+        # with this command's share of the session's workers.
+        phase_start = perf_counter()
+        num_workers = worker_share()
+        executor = create_executor(method, num_workers)
+        pool_start = perf_counter() - phase_start
+
+        futures = {}
+        try:
+            # Send individual columns to subprocesses, pickling
+            # them beforehand if needed so that the time taken
+            # to do so can be recorded. Only a couple of tasks
+            # per worker are queued at once, so that cancelled
+            # commands have little queued work to drop.
+            pending = iter(enumerate(columns))
+
+            def submit_next():
+                nonlocal serialise, submit
+                index, column = next(pending, (None, None))
+                if index is None:
+                    return False
+
+                phase_start = perf_counter()
+                payload = dumps(column) if serialised else column
+                submitted = perf_counter()
+                serialise += submitted - phase_start
+
+                future = executor.submit(
+                    timed_task, subproc_task, payload, serialised,
+                )
+                futures[future] = (index, submitted)
+                submit += perf_counter() - submitted
+                return True
+
+            while len(futures) < 2 * num_workers and submit_next():
+                pass
+
+            # Gather results as they complete, unpickling them
+            # if they were pickled by the worker, and queue a
+            # new task in place of each one. Waits time out so
+            # that cancellation is noticed while tasks run.
+            while len(futures) > 0:
+                done, _ = wait(
+                    futures,
+                    timeout = CANCEL_POLL_INTERVAL,
+                    return_when = FIRST_COMPLETED,
+                )
+                for future in done:
+                    index, submitted = futures.pop(future)
+                    result, stamps = future.result()
+
+                    phase_start = perf_counter()
+                    description = loads(result) if serialised else result
+                    unpickle = perf_counter() - phase_start
+
+                    descriptions[index] = description
+                    task_timings.append(
+                        TaskTiming(submitted, *stamps, unpickle)
+                    )
+                    if on_result is not None:
+                        on_result(index, description)
+
+                # Stop early if the job running this was
+                # cancelled.
+                check_cancelled()
+
+                while len(futures) < 2 * num_workers and submit_next():
+                    pass
 
             # **Wait for tasks** and shut down. From StackOverflow.
+            phase_start = perf_counter()
             executor.shutdown(wait=True)
+            shutdown = perf_counter() - phase_start
+        except BaseException as exc:
+            # On ^C, cancellation or an error, stop straight
+            # away instead of waiting for every queued task to
+            # run, as leaving an executor's `with` block would.
+            cancel_start = perf_counter()
+            num_unfinished = sum(not future.done() for future in futures)
+            num_stopped = shutdown_now(executor)
+            if isinstance(exc, (KeyboardInterrupt, CancelledError)):
+                logger.warn(
+                    f'\nDropped {num_unfinished} unfinished tasks and stopped'
+                    f' {num_stopped} worker processes in'
+                    f' {(perf_counter() - cancel_start) * 1000:.0f} ms.\n'
+                )
+            raise
 
     # Record execution duration.
     duration = perf_counter() - start_time
 
-    return descriptions, duration
+    timings = PhaseTimings.from_tasks(
+        task_timings,
+        pool_start = pool_start,
+        serialise = serialise,
+        submit = submit,
+        shutdown = shutdown,
+        total = duration,
+    )
+
+    return descriptions, duration, timings
 
 def collate_results(
         results: list[Series],
@@ -107,6 +302,253 @@ def collate_results(
     # Return the DataFrame.
     return dataframes
 
+def log_clean_counts(num_broken: int, num_recovering: int):
+    '''
+    Log how many rows were removed when cleaning the data.
+    '''
+    logger.log(
+        f'DF Clean: Found  and remove {num_broken} broken rows and'
+        f' {num_recovering} recovering rows ({num_broken + num_recovering}'
+        ' total).\n'
+    )
+
+def select_partitions(files: list[Path], time_range: tuple[str, str]):
+    '''
+    Select the files of a partitioned dataset which overlap the time range,
+    raising a `ValueError` if there are none.
+    '''
+    selected = logger.log_task('Probing data file time ranges... ')\
+        (files_in_time_range)(files, *time_range)
+    logger.log(
+        f'Partitioned dataset: {len(selected)} of {len(files)} files overlap'
+        ' the time range.\n'
+    )
+
+    if len(selected) == 0:
+        raise ValueError('No data files overlap the requested time range.')
+
+    return selected
+
+def get_partitions(
+        file_path: str | Path,
+        parallel_read: bool,
+        time_range: tuple[str, str],
+        range_bytes: int | None = None,
+    ):
+    '''
+    Split a dataset into partitions which can be read and summarised
+    independently: one per file for datasets split across several files, or
+    one byte range per CPU for a single file read in parallel. If a single
+    file has an index, only the byte range containing the time window is
+    split.
+
+    If `range_bytes` is passed, a single file is always split, into byte
+    ranges of about that size (and at least one per CPU).
+
+    If the dataset should be read as a whole, the path of its only data file
+    is returned instead of a list.
+    '''
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        return files
+    # Compressed files are split into frames instead.
+    split = parallel_read or range_bytes is not None
+    if split and detect_compression(files[0]) is None:
+        index = load_time_index(files[0])
+        window = None if index is None else index.byte_range(*time_range)
+        num_ranges = cpu_count() or 1
+        if range_bytes is not None:
+            size = files[0].stat().st_size if window is None\
+                else window.end - window.start
+            num_ranges = max(num_ranges, -(-size // range_bytes))
+        return logger.log_task('Splitting file into byte ranges... ')\
+            (split_byte_ranges)(files[0], num_ranges, window)
+    return files[0]
+
+def summarise_partitions(
+        partitions: list[Path | ByteRange],
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        no_clean: bool,
+        checkpoint: Checkpoint | None = None,
+        gaps: bool = False,
+    ):
+    '''
+    Provide a data summary of a dataset split into partitions.
+
+    Each partition is read, cleaned and summarised in its own task, and the
+    per-partition partial summaries are merged afterwards. Returns one
+    `describe()`-style `Series` per sensor and the time taken. If `gaps` is
+    true, gaps are profiled too; partitions are assumed to be in time order,
+    so that gaps can be joined across them.
+
+    If `checkpoint` is passed, partitions it already holds are loaded instead
+    of being summarised again, and each partition summarised is saved to it
+    as soon as it completes.
+    '''
+    file_results = [None] * len(partitions)
+    remaining = list(range(len(partitions)))
+    on_result = None
+
+    if checkpoint is not None:
+        if len(checkpoint.done) > 0:
+            for index in checkpoint.done:
+                file_results[index] = checkpoint.load(index)
+            logger.log(
+                f'Resuming: loaded {len(checkpoint.done)} of'
+                f' {len(partitions)} partitions from "{checkpoint.directory}".\n'
+            )
+        remaining = [
+            index for index in remaining if index not in checkpoint.done
+        ]
+
+        def on_result(position: int, result: tuple):
+            checkpoint.save(remaining[position], *result)
+
+    # Read and summarise each remaining partition in parallel.
+    task = partial(
+        summarise_partition,
+        time_range = time_range,
+        sensor_range = sensor_range,
+        no_clean = no_clean,
+        gaps = gaps,
+    )
+    new_results, time_taken, _ = logger.log_task(
+        f'Reading and summarising {len(remaining)} partitions'
+        f' (method: {method})... '
+    )(generate_descriptions)(
+        task, [partitions[index] for index in remaining], method, on_result,
+    )
+    for index, result in zip(remaining, new_results):
+        file_results[index] = result
+
+    if checkpoint is not None and len(remaining) > 0:
+        logger.log(
+            f'Checkpoints: saved {len(remaining)} partitions'
+            f' ({checkpoint.bytes_saved / 1024**2:.1f} MiB) in'
+            f' {checkpoint.save_time:.3f} seconds'
+            f' ({checkpoint.save_time / time_taken:.1%} of the processing'
+            ' time).\n'
+        )
+
+    if not no_clean:
+        log_clean_counts(
+            sum(removed[0] for _, removed in file_results),
+            sum(removed[1] for _, removed in file_results),
+        )
+
+    # Merge the partial summaries of each sensor. This is
+    # done in partition order so that results are repeatable.
+    def merge_sensor(index: int):
+        partials: list[PartialSummary] = [
+            sensor_partials[index] for sensor_partials, _ in file_results
+        ]
+        return merge_partials(partials).to_series()
+
+    num_sensors = sensor_range[1] - sensor_range[0] + 1
+    series_data = logger.log_task('Merging partition summaries... ')\
+        (lambda: [merge_sensor(index) for index in range(num_sensors)])()
+
+    return series_data, time_taken
+
+def summarise_compressed_file(
+        file_path: Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        no_clean: bool,
+    ):
+    '''
+    Provide a data summary of a compressed data file, which is decompressed
+    incrementally (in parallel, if it is made up of independent frames).
+    Returns one `describe()`-style `Series` per sensor and the time taken.
+    '''
+    start_time = perf_counter()
+    merged, removed, num_ranges = logger.log_task(
+        f'Decompressing and summarising compressed file (method: {method})... '
+    )(summarise_compressed)(
+        file_path, time_range, sensor_range, no_clean, method,
+    )
+    time_taken = perf_counter() - start_time
+
+    if num_ranges > 0:
+        logger.log(f'Decompressed {num_ranges} frame ranges in parallel.\n')
+    else:
+        logger.log('File has no independent frames; it was streamed.\n')
+    if not no_clean:
+        log_clean_counts(*removed)
+
+    return [summary.to_series() for summary in merged], time_taken
+
+def filter_frame(
+        df: DataFrame,
+        predicates: list[Predicate],
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+    ):
+    '''
+    Select the values of each sensor in the sensor range from the rows of a
+    `DataFrame` in the time range which match every predicate, as
+    `select_columns()` does from a block store.
+    '''
+    for predicate in predicates:
+        if predicate.column not in df.columns:
+            raise ValueError(f'Unknown filter column "{predicate.column}".')
+
+    rows, names, keep, _ = plan_selection(
+        df, *time_range, *sensor_range, no_clean,
+    )
+    filter_columns = select_cells(
+        df, rows, [predicate.column for predicate in predicates], keep,
+    )
+    mask = np.ones(len(filter_columns[0]), dtype=bool)
+    for predicate, values in zip(predicates, filter_columns):
+        mask &= predicate.mask(np.asarray(values, dtype=float))
+
+    return [column[mask] for column in select_cells(df, rows, names, keep)]
+
+def subset_from_store(
+        file_path: str | Path,
+        predicates: list[Predicate],
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+    ):
+    '''
+    Create the subset of a data file to analyse from its block store, keeping
+    only the rows which match every predicate. Blocks which cannot contain a
+    match are skipped using the store's zone maps. If the file has no current
+    block store, the rows are filtered from the whole file instead.
+    '''
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError('Filters are only supported for single data files.')
+
+    validate_analysis_inputs(*time_range, *sensor_range)
+    store = open_block_store(files[0])
+    if store is None:
+        logger.warn(
+            'Filtering the whole file, since it has no current block store;'
+            ' build one with `build-store` to skip blocks.\n'
+        )
+        df = logger.log_task('Reading CSV file data into DataFrame... ')\
+            (read_time_window)(files[0], *time_range)
+        return logger.log_task('Selecting matching rows from DataFrame... ')\
+            (filter_frame)(df, predicates, time_range, sensor_range, no_clean)
+
+    data_subset, num_blocks, num_skipped = logger.log_task(
+        'Selecting matching rows from block store... '
+    )(select_columns)(store, predicates, *time_range, *sensor_range, no_clean)
+
+    skipped_share = num_skipped / num_blocks if num_blocks > 0 else 0
+    logger.log(
+        f'Zone maps: skipped {num_skipped} of {num_blocks} blocks'
+        f' ({skipped_share:.1%}) in the time range.\n'
+    )
+    return data_subset
+
 def summarise_file(
         file_path: str | Path,
         time_range: tuple[str, str] = (TIME_MIN, TIME_MAX),
@@ -114,37 +556,147 @@ def summarise_file(
         method: str = 'process',
         no_clean: bool = False,
         entries_per_df: int = get_summaries_per_df(),
+        on_result: Callable[[str, Series], None] | None = None,
+        parallel_read: bool = False,
+        where: list[Predicate] | None = None,
+        checkpoint_dir: str | Path | None = None,
+        resume: bool = False,
+        gaps: bool = False,
     ):
     '''
     Provide a data summary of the specified
     file, within the specified time and sensor
     range.
-    '''
 
-    # Read the CSV file and store the contents in a Pandas DataFrame.
-    df = logger.log_task('Reading CSV file data into DataFrame... ')\
-        (read_csv)(file_path)
+    `file_path` may also be a directory or glob pattern, in which case the
+    data files it matches are summarised as a single dataset. If
+    `parallel_read` is true, a single file is split into byte ranges which are
+    read and summarised in parallel.
 
-    # If the DF is to be cleaned...
-    if not no_clean:
-        data_to_process, (num_broken, num_recovering) = logger.log_task\
-            ('Removing bad rows from DataFrame... ')\
-            (clean_df)(df)
-        logger.log(
-            f'DF Clean: Found  and remove {num_broken} broken rows and'
-            f' {num_recovering} recovering rows ({num_broken + num_recovering}'
-            ' total).\n'
+    If `where` is passed, only rows matching every predicate in it are
+    summarised. These are selected from the file's block store.
+
+    If `on_result` is passed, it is called with the sensor name and summary
+    of each sensor as soon as that summary is available, and the results are
+    not collated into `DataFrame`s for display (an empty list is returned in
+    their place).
+
+    If `checkpoint_dir` is passed, the dataset is summarised partition by
+    partition (splitting a single file into byte ranges), and progress is
+    checkpointed in that directory. If `resume` is also true, the summary
+    continues from its last checkpoint, giving the same results as an
+    uninterrupted run. The checkpoint is removed once the summary completes.
+
+    If `gaps` is true, each sensor's missing data is profiled in the same
+    pass as its statistics (see `aggregate.PartialGaps`), and the statistics
+    in `aggregate.GAPS_INDEX` are added to its summary.
+    '''
+    checkpointed = checkpoint_dir is not None
+    if checkpointed and where:
+        raise ValueError('Filtered summaries cannot be checkpointed.')
+    if gaps and where:
+        raise ValueError('Gaps cannot be profiled in filtered summaries.')
+
+    # Queries are checked before any data is read.
+    validate_analysis_inputs(*time_range, *sensor_range)
+
+    # Partitioned datasets are read and summarised
+    # partition by partition.
+    partitions = get_partitions(
+        file_path, parallel_read, time_range,
+        CHECKPOINT_RANGE_BYTES if checkpointed else None,
+    )
+    compressed = not isinstance(partitions, list)\
+        and detect_compression(partitions) is not None
+    if (isinstance(partitions, list) or compressed) and not where:
+        if compressed:
+            if checkpointed:
+                raise ValueError('Compressed files cannot be checkpointed.')
+            if gaps:
+                raise ValueError(
+                    'Gaps cannot be profiled in compressed files.'
+                )
+            series_data, time_taken = summarise_compressed_file(
+                partitions, time_range, sensor_range, method, no_clean,
+            )
+        else:
+            if not isinstance(partitions[0], ByteRange):
+                partitions = select_partitions(partitions, time_range)
+
+            checkpoint = None
+            if checkpointed:
+                checkpoint = open_checkpoint(
+                    checkpoint_dir, partitions, time_range, sensor_range,
+                    no_clean, resume, gaps,
+                )
+                if resume and len(checkpoint.done) == 0:
+                    logger.log(
+                        'No checkpoint to resume from; starting from the'
+                        ' beginning.\n'
+                    )
+
+            series_data, time_taken = summarise_partitions(
+                partitions, time_range, sensor_range, method, no_clean,
+                checkpoint, gaps,
+            )
+            if checkpoint is not None:
+                checkpoint.remove()
+
+        if on_result is not None:
+            for index, description in enumerate(series_data):
+                on_result(sensor_name(sensor_range[0] + index), description)
+            return [], time_taken
+
+        results = logger.log_task('Collating results... ')\
+            (collate_results)(series_data, *sensor_range, entries_per_df)
+        return results, time_taken
+
+    # Filtered summaries are selected from the block store.
+    if where:
+        data_subset = subset_from_store(
+            file_path, where, time_range, sensor_range, no_clean,
         )
     else:
-        data_to_process = df
-
-    # Create a subset of the dataset based on inputs.
-    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
-        (subset_df)(data_to_process, *time_range, *sensor_range)
+        # Read the CSV file and store the contents in a Pandas DataFrame.
+        df = logger.log_task('Reading CSV file data into DataFrame... ')\
+            (read_time_window)(partitions, *time_range)
+
+        # Select the rows and sensors for analysis, removing
+        # bad rows only from those selected.
+        rows, names, keep, removed = plan_selection(
+            df, *time_range, *sensor_range, no_clean,
+        )
+        data_subset = logger.log_task\
+            ('Selecting DataFrame subset for analysis... ')\
+            (select_cells)(df, rows, names, keep)
+        if not no_clean:
+            log_clean_counts(*removed)
+
+        # Each column's task profiles its gaps with its
+        # statistics, so it needs the time of each row.
+        if gaps:
+            timestamps = logger.log_task('Parsing timestamps... ')\
+                (selected_timestamps)(df, rows, keep)
+            data_subset = [(column, timestamps) for column in data_subset]
+
+    # Pass each result on, named after its sensor, as soon
+    # as it is available.
+    on_column_result = None
+    if on_result is not None:
+        def on_column_result(index: int, description: Series):
+            on_result(sensor_name(sensor_range[0] + index), description)
 
     # Get a summary of all the data.
-    series_data, time_taken = logger.log_task(f'Running analysis tasks (method: {method})... ')\
-        (generate_descriptions)(subprocess_task, data_subset, method)
+    series_data, time_taken, _ = logger.log_task(f'Running analysis tasks (method: {method})... ')\
+        (generate_descriptions)(
+            describe_with_gaps if gaps else subprocess_task,
+            data_subset, method, on_column_result,
+        )
+
+    # Results which have been passed on do not need to be
+    # formatted for display.
+    if on_result is not None:
+        return [], time_taken
 
     # Collate all results
     results = logger.log_task('Collating results... ')\
@@ -152,6 +704,95 @@ def summarise_file(
 
     return results, time_taken
 
+def summarise_by_status(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+    ):
+    '''
+    Provide a data summary of each sensor for each machine status, in a single
+    pass over the data. Rows are not cleaned, since every status is
+    summarised.
+
+    The rows are ordered by status code once, which puts every status in a
+    contiguous slice of each column, and then each column is described for
+    every status in one task.
+
+    Returns the status names (NORMAL first), one list of `describe()`-style
+    `Series` per sensor (one per status, in the same order) and the time
+    taken.
+    '''
+    files = resolve_data_files(file_path)
+    if len(files) > 1 or detect_compression(files[0]) is not None:
+        raise ValueError(
+            'Grouping by status is only supported for single uncompressed'
+            ' data files.'
+        )
+
+    validate_analysis_inputs(*time_range, *sensor_range)
+    df = logger.log_task('Reading CSV file data into DataFrame... ')\
+        (read_time_window)(files[0], *time_range)
+    rows, sensors, _, _ = plan_selection(
+        df, *time_range, *sensor_range, no_clean=True,
+    )
+    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
+        (select_cells)(df, rows, sensors, None)
+    status_values = df['machine_status'].iloc[rows]
+
+    # Order the statuses with NORMAL first, since the other
+    # statuses are compared with it. Rows with no status
+    # get the code -1 and are left out.
+    names = sorted(
+        status_values.dropna().unique(),
+        key = lambda name: (name != 'NORMAL', name),
+    )
+    codes = np.full(len(status_values), -1)
+    for code, name in enumerate(names):
+        codes[(status_values == name).to_numpy()] = code
+
+    # One stable sort of the codes is shared by every column.
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    bounds = list(zip(
+        np.searchsorted(sorted_codes, range(len(names)), 'left').tolist(),
+        np.searchsorted(sorted_codes, range(len(names)), 'right').tolist(),
+    ))
+    jobs = [(column[order], bounds) for column in data_subset]
+
+    series_data, time_taken, _ = logger.log_task(
+        f'Running analysis tasks for {len(names)} statuses'
+        f' (method: {method})... '
+    )(generate_descriptions)(describe_groups, jobs, method)
+
+    return names, series_data, time_taken
+
+def collate_grouped_results(
+        groups: list[str],
+        results: list[list[Series]],
+        sensor_start: int,
+        entries_per_df: int,
+    ):
+    '''
+    Generate `DataFrame`s of summaries of groups of rows (e.g. one group per
+    status), with the summaries of each sensor for every group next to each
+    other so they can be compared.
+    '''
+    sensors_per_df = max(entries_per_df // max(len(groups), 1), 1)
+
+    dataframes = []
+    for group_start in range(0, len(results), sensors_per_df):
+        columns = {
+            (sensor_name(sensor_start + index), group): description
+            for index in range(
+                group_start, min(group_start + sensors_per_df, len(results)),
+            )
+            for group, description in zip(groups, results[index])
+        }
+        dataframes.append(DataFrame(columns))
+
+    return dataframes
+
 def benchmark(
         file_path: str | Path,
         time_range: tuple[str, str] = (TIME_MIN, TIME_MAX),
@@ -159,73 +800,79 @@ def benchmark(
         method: str = 'process',
         no_clean: bool = False,
         times: int = 10,
+        parallel_read: bool = False,
+        measure_pipelines: bool = False,
     ):
     '''
     Provide a data summary of the specified file a specified number of times,
     within the specified time and sensor range.
 
     This function is designed for benchmarking purposes and does not return
-    results. If this is desired, use summarise_file() instead.
+    results. If this is desired, use summarise_file() instead. If
+    `measure_pipelines` is true and a single file is benchmarked, the bytes
+    copied by each stage of selecting the data are also measured (see
+    `planner.compare_pipelines()`).
     '''
-
-    # Read the CSV file and store the contents in a Pandas DataFrame.
-    df = logger.log_task('Reading CSV file data into DataFrame... ')\
-        (read_csv)(file_path)
-
-    # If the DF is to be cleaned...
-    if not no_clean:
-        data_to_process, (num_broken, num_recovering) = logger.log_task\
-            ('Removing bad rows from DataFrame... ')\
-            (clean_df)(df)
-        logger.log(
-            f'DF Clean: Found  and remove {num_broken} broken rows and'
-            f' {num_recovering} recovering rows ({num_broken + num_recovering}'
-            ' total).\n'
+    validate_analysis_inputs(*time_range, *sensor_range)
+
+    # For partitioned datasets, reading and summarising each
+    # partition is the parallel work, so that is what gets
+    # benchmarked.
+    partitions = get_partitions(file_path, parallel_read, time_range)
+    if isinstance(partitions, list):
+        if not isinstance(partitions[0], ByteRange):
+            partitions = select_partitions(partitions, time_range)
+
+        task = partial(
+            summarise_partition,
+            time_range = time_range,
+            sensor_range = sensor_range,
+            no_clean = no_clean,
         )
+        data_subset = partitions
+        pipeline_copies = None
     else:
-        data_to_process = df
-
-    # Create a subset of the dataset based on inputs.
-    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
-        (subset_df)(data_to_process, *time_range, *sensor_range)
-
-    # Add another timing counter so that the delays from
-    # printing can be minimsed. Initialise the timer
-    # variable and set the minimum print threshold in
-    # seconds.
-    printing_timer = -1
-    threshold = 0.25
+        # Read the CSV file and store the contents in a Pandas DataFrame.
+        df = logger.log_task('Reading CSV file data into DataFrame... ')\
+            (read_time_window)(partitions, *time_range)
+
+        # Measure the bytes copied by each stage of selecting
+        # the data, with and without planning, if asked to.
+        pipeline_copies = None
+        if measure_pipelines:
+            pipeline_copies = logger.log_task\
+                ('Measuring selection pipelines... ')\
+                (compare_pipelines)(df, time_range, sensor_range, no_clean)
+
+        # Select the rows and sensors for analysis.
+        data_subset, removed = logger.log_task\
+            ('Selecting DataFrame subset for analysis... ')\
+            (planned_subset)(df, *time_range, *sensor_range, no_clean)
+        if not no_clean:
+            log_clean_counts(*removed)
+        task = subprocess_task
 
     # Run analysis a set number of times, as specified by `times`.
     # Record start time externally, and create list for internal times.
+    # Progress is redrawn at a fixed rate by another thread,
+    # so no printing happens inside the loop.
     start_time = perf_counter()
     internal_times: list[float] = []
-
-    for index in range(times):
-        # If any of the following is true...
-        if any([
-            printing_timer > threshold,
-            printing_timer == -1,
-            times == index + 1,
-        ]):
-            # Overwrite previous message on this line, and
-            # print the progress.
-            logger.log(
-                f'{CLEAR_LINE}Benchmarking analysis program (method: {method})'
-                f'... (run {index + 1} of {times})'
+    phase_timings: list[PhaseTimings] = []
+
+    with logger.Progress(
+            f'Benchmarking analysis program (method: {method})', times,
+    ) as progress:
+        for index in range(times):
+            # Record each internal time.
+            _, time_taken, timings = generate_descriptions(
+                task,
+                data_subset,
+                method,
             )
-            printing_timer = 0
-
-        # Record each internal time.
-        _, time_taken = generate_descriptions(
-            subprocess_task,
-            data_subset,
-            method,
-        )
-        internal_times.append(time_taken)
-
-        # Add to printing timer...
-        printing_timer += time_taken
+            internal_times.append(time_taken)
+            phase_timings.append(timings)
+            progress.update(index + 1)
 
     # Store duration of entire execution.
     total_external_duration = perf_counter() - start_time
@@ -235,6 +882,13 @@ def benchmark(
     # of these.
     bench_results = logger.log_task('\nGathering benchmarking results... ')\
         (Series(internal_times).describe)()
+    phase_results = summarise_phase_timings(phase_timings)
 
     # Return all results.
-    return bench_results, total_internal_duration, total_external_duration
+    return (
+        bench_results,
+        phase_results,
+        total_internal_duration,
+        total_external_duration,
+        pipeline_copies,
+    )
@@ -0,0 +1,225 @@
+'''
+CSV reading utilities, including parallel parsing of a single large file by
+splitting it into byte ranges.
+'''
+
+from dataclasses import dataclass
+from functools import partial
+from io import BytesIO
+from os import cpu_count
+from pathlib import Path
+from time import perf_counter
+
+from pandas import DataFrame, concat, read_csv
+from pandas.api.types import is_numeric_dtype
+
+from jobs import worker_share
+from metadata import csv_dtypes
+from util import create_executor, get_executor_class, shutdown_now
+
+
+@dataclass(frozen=True)
+class ByteRange:
+    '''
+    A range of complete lines within a CSV file, from byte `start` up to (but
+    not including) byte `end`. `names` holds the column names parsed from the
+    header, which the range itself does not contain.
+    '''
+    file_path: Path
+    start: int
+    end: int
+    names: tuple[str, ...]
+
+
+def read_column_names(file_path: str | Path):
+    '''
+    Parse the header of a CSV file, returning the column names exactly as
+    `read_csv()` would name them.
+    '''
+    return tuple(read_csv(file_path, nrows=0).columns)
+
+def split_byte_ranges(
+        file_path: str | Path,
+        num_ranges: int,
+        within: ByteRange | None = None,
+    ):
+    '''
+    Split the data rows of a CSV file into at most `num_ranges` byte ranges of
+    roughly equal size. Range boundaries are moved forward to the next line
+    break so that every range contains whole lines only. If `within` is
+    passed, only the rows within that byte range are split.
+
+    The header is parsed once, here, and shared by every range. Fields are
+    assumed not to contain quoted line breaks, which holds for the sensor
+    data files.
+    '''
+    file_path = Path(file_path)
+    names = read_column_names(file_path)
+
+    with open(file_path, 'rb') as file:
+        # Skip the header line.
+        file.readline()
+        data_start = file.tell()
+        size = file.seek(0, 2)
+
+        if within is not None:
+            data_start, size = within.start, within.end
+
+        # Find each boundary by seeking to an evenly spaced
+        # position and then reading to the end of that line.
+        boundaries = [data_start]
+        step = (size - data_start) / max(num_ranges, 1)
+        for index in range(1, num_ranges):
+            position = int(data_start + step * index)
+            if position <= boundaries[-1]:
+                continue
+            file.seek(position - 1)
+            file.readline()
+            boundary = file.tell()
+            if boundary < size:
+                boundaries.append(boundary)
+        boundaries.append(size)
+
+    return [
+        ByteRange(file_path, start, end, names)
+        for start, end in zip(boundaries, boundaries[1:])
+        if end > start
+    ]
+
+def read_byte_range(byte_range: ByteRange):
+    '''
+    Parse the rows within a byte range of a CSV file into a `DataFrame`.
+    '''
+    with open(byte_range.file_path, 'rb') as file:
+        file.seek(byte_range.start)
+        data = file.read(byte_range.end - byte_range.start)
+
+    return read_csv(
+        BytesIO(data), header=None, names=list(byte_range.names),
+        dtype=csv_dtypes(byte_range.file_path),
+    )
+
+def read_partition(partition: str | Path | ByteRange):
+    '''
+    Read a partition of a dataset, which is either a whole file or a byte
+    range within one.
+    '''
+    if isinstance(partition, ByteRange):
+        return read_byte_range(partition)
+    return read_csv(partition, dtype=csv_dtypes(partition))
+
+def _combine_ranges(file_path: Path, frames: list[DataFrame]):
+    '''
+    Combine the `DataFrame`s parsed from consecutive byte ranges.
+
+    Each range infers its own column types. Where ranges disagree only in
+    numeric precision (e.g. a column is integral in one range but contains
+    NaN in another), concatenation upcasts to the type the serial reader would
+    have inferred. Any other disagreement is resolved by re-reading those
+    columns serially, so that the result always matches `read_csv()`.
+    '''
+    df = concat(frames, ignore_index=True)
+
+    mismatched = [
+        column for column in df.columns
+        if len({frame[column].dtype for frame in frames}) > 1
+        and not all(is_numeric_dtype(frame[column]) for frame in frames)
+    ]
+    if len(mismatched) > 0:
+        df[mismatched] = read_csv(file_path, usecols=mismatched)[mismatched]
+
+    return df
+
+def read_csv_parallel(
+        file_path: str | Path,
+        method: str = 'process',
+        num_workers: int | None = None,
+    ):
+    '''
+    Read a CSV file into a `DataFrame`, parsing byte ranges of the file in
+    parallel using the method specified. The result is identical to that of
+    `read_csv(file_path)`.
+    '''
+    file_path = Path(file_path)
+    if num_workers is None:
+        num_workers = cpu_count() or 1
+
+    byte_ranges = split_byte_ranges(file_path, num_workers)
+
+    executor_class = get_executor_class(method)
+    if executor_class is None or len(byte_ranges) == 1:
+        frames = [read_byte_range(byte_range) for byte_range in byte_ranges]
+    else:
+        # Use no more than this command's share of the
+        # session's workers, and stop them straight away on
+        # ^C.
+        executor = create_executor(method, min(num_workers, worker_share()))
+        try:
+            frames = list(executor.map(read_byte_range, byte_ranges))
+        except BaseException:
+            shutdown_now(executor)
+            raise
+        executor.shutdown()
+
+    # A file with no rows still needs its columns.
+    if len(frames) == 0:
+        return read_csv(file_path)
+
+    return _combine_ranges(file_path, frames)
+
+def read_benchmark(
+        file_path: str | Path,
+        method: str = 'process',
+        worker_counts: list[int] | None = None,
+        times: int = 3,
+    ):
+    '''
+    Measure CSV ingestion throughput of the serial reader and of the parallel
+    reader with different numbers of workers. Each parallel result is checked
+    against the serial one. The fastest of `times` runs is recorded for each
+    configuration.
+
+    Returns a `DataFrame` with one row per reader configuration.
+    '''
+    file_path = Path(file_path)
+    size_mb = file_path.stat().st_size / 1e6
+
+    if worker_counts is None:
+        max_workers = cpu_count() or 1
+        worker_counts = sorted({
+            *(2 ** power for power in range(max_workers.bit_length())),
+            max_workers,
+        })
+
+    def best_time(read: partial):
+        durations = []
+        for _ in range(times):
+            start = perf_counter()
+            result = read()
+            durations.append(perf_counter() - start)
+        return min(durations), result
+
+    serial_time, serial_df = best_time(partial(read_csv, file_path))
+    rows = [{
+        'reader': 'serial',
+        'workers': 1,
+        'seconds': serial_time,
+        'MB/s': size_mb / serial_time,
+        'speedup': 1.0,
+        'matches serial': True,
+    }]
+
+    for num_workers in worker_counts:
+        parallel_time, parallel_df = best_time(partial(
+            read_csv_parallel, file_path, method, num_workers,
+        ))
+        rows.append({
+            'reader': f'parallel ({method})',
+            'workers': num_workers,
+            'seconds': parallel_time,
+            'MB/s': size_mb / parallel_time,
+            'speedup': serial_time / parallel_time,
+            'matches serial': parallel_df.equals(serial_df),
+        })
+
+    return DataFrame(rows)
@@ -0,0 +1,255 @@
+'''
+Rolling-window statistics. The mean, standard deviation, minimum and maximum
+of each sensor are computed over time-based windows (e.g. the last hour)
+with vectorised NumPy operations: the mean and standard deviation from prefix
+sums, and the minimum and maximum from sparse tables of the extremes of
+power-of-two-long runs of rows.
+'''
+
+from pathlib import Path
+
+import numpy as np
+from pandas import DataFrame, Timedelta, concat, to_datetime
+
+import logger
+from jobs import worker_share
+from planner import plan_selection, select_cells
+from proc import generate_descriptions, log_clean_counts
+from time_index import read_time_window
+from util import resolve_data_files, sensor_name, validate_analysis_inputs
+
+
+# Default window lengths, and default interval between output rows.
+ROLLING_WINDOWS = ['10min', '1h', '1D']
+ROLLING_EVERY = '1h'
+
+# The statistics computed for each window.
+ROLLING_STATISTICS = ['count', 'mean', 'std', 'min', 'max']
+
+
+def duration_string(text: str):
+    '''
+    Validation function for use with `argparse`. Checks that the string is a
+    positive duration such as `10min`, `1h` or `1D`, and returns it
+    unchanged. Invalid strings will raise a `ValueError`.
+    '''
+    if Timedelta(text) <= Timedelta(0):
+        raise ValueError('Durations must be positive.')
+    return text
+
+def interval_string(text: str):
+    '''
+    Validation function for use with `argparse`. As for `duration_string()`,
+    but also accepts `0` (e.g. for output at every row).
+    '''
+    if Timedelta(text) < Timedelta(0):
+        raise ValueError('Intervals cannot be negative.')
+    return text
+
+def rolling_extremes(
+        column: np.ndarray,
+        starts: list[np.ndarray],
+        outputs: np.ndarray,
+    ):
+    '''
+    Find the minimum and maximum of a column over several windows at once.
+    Window `k` of row `i` covers rows `starts[k][i]` to `i` (inclusive), and
+    results are only found for the rows in `outputs`. NaN values are
+    ignored.
+
+    Level `j` of a sparse table holds the extreme of the `2**j` rows from each
+    row, and is built from level `j - 1` in one vectorised step. Any window
+    is covered by two (overlapping) runs from the level below its length, so
+    every window's extreme takes two lookups. Only the levels needed by the
+    longest window are built.
+
+    Returns arrays of minimums and maximums, of shape `(windows, outputs)`.
+    '''
+    num_windows = len(starts)
+    if len(outputs) == 0:
+        empty = np.full((num_windows, 0), np.nan)
+        return empty, empty.copy()
+
+    window_starts = np.stack([window[outputs] for window in starts])
+    lengths = outputs + 1 - window_starts
+    levels = np.log2(lengths).astype(np.intp)
+    # The second run of each window ends at its last row.
+    second_starts = outputs + 1 - (1 << levels)
+
+    minimums = np.empty(lengths.shape)
+    maximums = np.empty(lengths.shape)
+    level_min = level_max = np.asarray(column, dtype=float)
+    for level in range(int(levels.max()) + 1):
+        if level > 0:
+            # `np.fmin()` and `np.fmax()` ignore NaN.
+            half = 1 << (level - 1)
+            level_min = np.fmin(level_min[:-half], level_min[half:])
+            level_max = np.fmax(level_max[:-half], level_max[half:])
+
+        at_level = levels == level
+        first, second = window_starts[at_level], second_starts[at_level]
+        minimums[at_level] = np.fmin(level_min[first], level_min[second])
+        maximums[at_level] = np.fmax(level_max[first], level_max[second])
+
+    return minimums, maximums
+
+def rolling_moments(
+        column: np.ndarray,
+        starts: list[np.ndarray],
+        outputs: np.ndarray,
+    ):
+    '''
+    Find the count, mean and sample standard deviation of a column over
+    several windows (as for `rolling_extremes()`) from prefix sums, so each
+    result takes O(1) time. Values are shifted by their mean first to avoid
+    losing precision when sums of squares are subtracted.
+
+    Returns arrays of counts, means and standard deviations, of shape
+    `(windows, outputs)`.
+    '''
+    valid = ~np.isnan(column)
+    shift = column[valid].mean() if valid.any() else 0.0
+    shifted = np.where(valid, column - shift, 0.0)
+
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    sums = np.concatenate([[0.0], np.cumsum(shifted)])
+    squares = np.concatenate([[0.0], np.cumsum(shifted * shifted)])
+
+    ends = outputs + 1
+    window_starts = np.stack([window[outputs] for window in starts])
+    count = counts[ends] - counts[window_starts]
+    total = sums[ends] - sums[window_starts]
+    total_squares = squares[ends] - squares[window_starts]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, shift + total / count, np.nan)
+        variance = (total_squares - total * total / count) / (count - 1)
+        std = np.where(count > 1, np.sqrt(np.maximum(variance, 0)), np.nan)
+
+    return count, mean, std
+
+def rolling_columns(job: tuple[list[np.ndarray], list[np.ndarray], np.ndarray]):
+    '''
+    Compute the rolling statistics of a group of sensor columns.
+
+    `job` holds the columns, the first row of each window for every row, and
+    the rows to output. Returns, for each column, an array of shape
+    `(statistics, windows, outputs)`.
+    '''
+    columns, starts, outputs = job
+
+    results = []
+    for column in columns:
+        count, mean, std = rolling_moments(column, starts, outputs)
+        minimum, maximum = rolling_extremes(column, starts, outputs)
+        results.append(np.stack([count, mean, std, minimum, maximum]))
+
+    return results
+
+def output_rows(timestamps: np.ndarray, every: Timedelta):
+    '''
+    Choose the rows to output: the last row of each `every`-long interval,
+    or every row if `every` is zero.
+    '''
+    if len(timestamps) == 0 or every == Timedelta(0):
+        return np.arange(len(timestamps))
+
+    buckets = (timestamps - timestamps[0]) // every.to_timedelta64()
+    return np.concatenate([
+        np.flatnonzero(buckets[1:] != buckets[:-1]),
+        [len(timestamps) - 1],
+    ])
+
+def rolling_statistics(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        no_clean: bool,
+        windows: list[str] = ROLLING_WINDOWS,
+        every: str = ROLLING_EVERY,
+    ):
+    '''
+    Compute rolling statistics of each sensor over time-based windows, such
+    as `1h`. The window of each row covers the rows less than the window
+    length before it, up to and including the row itself (like
+    `DataFrame.rolling('1h')`).
+
+    Sensors are split into one group per worker. Results are only kept for
+    the last row of every `every`-long interval (or every row, if `every` is
+    `0`).
+
+    Returns a `DataFrame` with one row per output timestamp, window and
+    sensor, and the time taken.
+    '''
+    validate_analysis_inputs(*time_range, *sensor_range)
+    for window in windows:
+        duration_string(window)
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError(
+            'Rolling statistics can only be computed for a single data file.'
+        )
+
+    df = logger.log_task('Reading CSV file data into DataFrame... ')\
+        (read_time_window)(files[0], *time_range)
+
+    # Select the rows and sensors for analysis, removing
+    # bad rows only from those selected.
+    rows, names, keep, removed = plan_selection(
+        df, *time_range, *sensor_range, no_clean,
+    )
+    if not no_clean:
+        log_clean_counts(*removed)
+    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
+        (select_cells)(df, rows, names, keep)
+
+    # The windows and output rows only depend on the
+    # timestamps, so they are found once for every sensor.
+    times = select_cells(df, rows, ['timestamp'], keep)[0]
+    timestamps = to_datetime(times).to_numpy(dtype='datetime64[ns]')
+    starts = [
+        np.searchsorted(
+            timestamps, timestamps - Timedelta(window).to_timedelta64(),
+            'right',
+        )
+        for window in windows
+    ]
+    outputs = output_rows(timestamps, Timedelta(every))
+
+    # Split the sensors into one group per worker.
+    groups = [
+        group for group in np.array_split(
+            np.arange(len(data_subset)), worker_share(),
+        )
+        if len(group) > 0
+    ]
+    jobs = [
+        ([data_subset[index] for index in group], starts, outputs)
+        for group in groups
+    ]
+    group_results, time_taken, _ = logger.log_task(
+        f'Computing rolling statistics for {len(data_subset)} sensors in'
+        f' {len(jobs)} groups (method: {method})... '
+    )(generate_descriptions)(rolling_columns, jobs, method)
+
+    # Build a long table with one row per output timestamp,
+    # window and sensor.
+    results = [result for group in group_results for result in group]
+    tables = [
+        DataFrame({
+            'timestamp': times[outputs],
+            'window': window,
+            'sensor': sensor_name(sensor_range[0] + index),
+            **{
+                statistic: result[stat_index, window_index]
+                for stat_index, statistic in enumerate(ROLLING_STATISTICS)
+            },
+        })
+        for window_index, window in enumerate(windows)
+        for index, result in enumerate(results)
+    ]
+    table = concat(tables, ignore_index=True) if tables\
+        else DataFrame(columns=['timestamp', 'window', 'sensor'])
+
+    return table, time_taken
@@ -0,0 +1,491 @@
+'''
+Approximate summaries from time-stratified samples. The rows in the time
+range are split into strata of consecutive rows (and so of consecutive
+times), and a random sample is drawn from every stratum in proportion to its
+size, so that the sample covers the whole range evenly. The `describe()`
+fields are estimated from the sample with 95% confidence intervals, and the
+sample can be grown until the intervals are narrow enough.
+
+Rows are drawn from the data file's block store if it has one, otherwise
+from its timestamp index (reading and parsing only the sampled lines), and
+otherwise from the whole file read into memory.
+'''
+
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from pandas import Series, read_csv, to_datetime
+
+import logger
+from aggregate import DESCRIBE_INDEX
+from block_store import BAD_STATUSES, BlockStore, open_block_store
+from metadata import csv_dtypes
+from time_index import TimeIndex, load_time_index, read_time_window
+from util import resolve_data_files, sensor_name, validate_analysis_inputs
+
+
+# Normal quantile for two-sided 95% confidence intervals.
+CONFIDENCE_Z = 1.959964
+
+# Rows per stratum when the strata are not given by a block store or index.
+STRATUM_ROWS = 1000
+
+# The fraction sampled first when growing a sample to meet an error bound,
+# and the least number of rows sampled from each stratum.
+INITIAL_FRACTION = 0.01
+MIN_STRATUM_SAMPLE = 2
+
+# The quartiles estimated, which follow the minimum in `DESCRIBE_INDEX`.
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+class StoreSampler:
+    '''
+    Draws rows from a block store. Each block in the time range is a stratum,
+    and sampled rows are read straight from the memory-mapped columns.
+    '''
+    def __init__(
+            self,
+            store: BlockStore,
+            time_range: tuple[str, str],
+            sensors: list[str],
+        ):
+        timestamps = store.column('timestamp')
+        self.row_start = int(np.searchsorted(
+            timestamps, np.datetime64(time_range[0]), 'left',
+        ))
+        row_end = int(np.searchsorted(
+            timestamps, np.datetime64(time_range[1]), 'right',
+        ))
+
+        # Strata follow the block boundaries, so the zone maps
+        # of the blocks bound each sensor's extremes.
+        boundaries = np.unique(np.clip(
+            np.arange(0, row_end + store.block_size, store.block_size),
+            self.row_start, row_end,
+        ))
+        self.starts = boundaries[:-1]
+        self.sizes = np.diff(boundaries)
+
+        blocks = range(
+            self.row_start // store.block_size,
+            -(-row_end // store.block_size) if row_end > self.row_start else 0,
+        )
+        self.bounds = []
+        for sensor in sensors:
+            zones = [store.zone(sensor, block)[:2] for block in blocks]
+            minimums = [zone[0] for zone in zones if zone[0] is not None]
+            maximums = [zone[1] for zone in zones if zone[1] is not None]
+            self.bounds.append((
+                min(minimums, default=np.nan), max(maximums, default=np.nan),
+            ))
+
+        self.columns = [store.column(sensor) for sensor in sensors]
+        self.statuses = store.column('machine_status')
+        self.bad_codes = [
+            store.statuses.index(status)
+            for status in BAD_STATUSES if status in store.statuses
+        ]
+
+    def fetch(self, requests: list[tuple[int, np.ndarray]]):
+        '''
+        Read rows, given as a list of strata and positions within them.
+        Returns the sensor values of the rows (rows by sensors) and whether
+        each row has a bad status, in the order requested.
+        '''
+        rows = np.concatenate([
+            self.starts[stratum] + positions for stratum, positions in requests
+        ])
+        values = np.column_stack([column[rows] for column in self.columns])
+        return values, np.isin(self.statuses[rows], self.bad_codes)
+
+
+class IndexSampler:
+    '''
+    Draws rows from a CSV file with a timestamp index. The rows between each
+    pair of index entries are a stratum; its lines are read and split, but
+    only the sampled lines are parsed.
+    '''
+    def __init__(
+            self,
+            index: TimeIndex,
+            time_range: tuple[str, str],
+            sensors: list[str],
+        ):
+        self.index = index
+        self.sensors = sensors
+        self.bounds = [(np.nan, np.nan)] * len(sensors)
+        self.time_range = tuple(
+            datetime.fromisoformat(time) for time in time_range
+        )
+        self.timestamp_column = index.names.index('timestamp')
+        self.dtypes = csv_dtypes(index.file_path)
+
+        byte_range = index.byte_range(*time_range)
+        self.entries = [
+            entry for entry, offset in enumerate(index.offsets)
+            if byte_range.start <= offset < byte_range.end
+        ]
+        self.ends = [
+            index.offsets[entry + 1] if entry + 1 < len(index.offsets)
+                else index.source_size
+            for entry in self.entries
+        ]
+
+        # Only the first and last strata may have rows outside the
+        # time range, or fewer rows than the index spacing.
+        self.sizes = np.full(len(self.entries), index.every)
+        for stratum in sorted({0, len(self.entries) - 1}):
+            if stratum < len(self.entries):
+                self.sizes[stratum] = len(self._lines(stratum))
+
+    def _lines(self, stratum: int):
+        '''
+        Read the lines of a stratum which are within the time range.
+        '''
+        with open(self.index.file_path, 'rb') as file:
+            file.seek(self.index.offsets[self.entries[stratum]])
+            data = file.read(
+                self.ends[stratum] - self.index.offsets[self.entries[stratum]]
+            )
+        lines = data.splitlines()
+
+        if 0 < stratum < len(self.entries) - 1:
+            return lines
+        start, end = self.time_range
+        return [
+            line for line in lines
+            if start <= datetime.fromisoformat(
+                line.split(b',')[self.timestamp_column].decode().strip('"')
+            ) <= end
+        ]
+
+    def fetch(self, requests: list[tuple[int, np.ndarray]]):
+        '''
+        As for `StoreSampler.fetch()`. The sampled lines of every stratum are
+        parsed together.
+        '''
+        sampled = []
+        for stratum, positions in requests:
+            lines = self._lines(stratum)
+            sampled.extend(lines[position] for position in positions)
+
+        df = read_csv(
+            BytesIO(b'\n'.join(sampled)),
+            header=None,
+            names=list(self.index.names),
+            dtype=self.dtypes,
+        )
+        values = df[self.sensors].to_numpy(dtype=float)
+        return values, df['machine_status'].isin(BAD_STATUSES).to_numpy()
+
+
+class FrameSampler:
+    '''
+    Draws rows from a whole CSV file read into memory, split into strata of
+    `STRATUM_ROWS` rows. Used when there is no block store or index, so only
+    the summary itself is faster than an exact one.
+    '''
+    def __init__(
+            self,
+            file_path: Path,
+            time_range: tuple[str, str],
+            sensors: list[str],
+        ):
+        df = read_time_window(file_path, *time_range)
+        times = to_datetime(df['timestamp'])
+        rows = df[(times >= time_range[0]) & (times <= time_range[1])]
+
+        self.values = rows[sensors].to_numpy(dtype=float)
+        self.bad = rows['machine_status'].isin(BAD_STATUSES).to_numpy()
+        self.bounds = [(np.nan, np.nan)] * len(sensors)
+        boundaries = np.unique(np.append(
+            np.arange(0, len(rows), STRATUM_ROWS), len(rows),
+        ))
+        self.starts = boundaries[:-1]
+        self.sizes = np.diff(boundaries)
+
+    def fetch(self, requests: list[tuple[int, np.ndarray]]):
+        '''
+        As for `StoreSampler.fetch()`.
+        '''
+        rows = np.concatenate([
+            self.starts[stratum] + positions for stratum, positions in requests
+        ])
+        return self.values[rows], self.bad[rows]
+
+
+def open_sampler(
+        file_path: Path,
+        time_range: tuple[str, str],
+        sensors: list[str],
+    ):
+    '''
+    Open the fastest sampler available for a data file.
+    '''
+    store = open_block_store(file_path)
+    if store is not None:
+        return StoreSampler(store, time_range, sensors)
+
+    index = load_time_index(file_path)
+    if index is not None and len(index.offsets) > 0:
+        return IndexSampler(index, time_range, sensors)
+
+    logger.warn(
+        'Sampling from the whole file, since it has no block store or index;'
+        ' build one with `build-store` or `build-index` to sample faster.\n'
+    )
+    return FrameSampler(file_path, time_range, sensors)
+
+def stratified_variance(
+        values: np.ndarray,
+        boundaries: np.ndarray,
+        sizes: np.ndarray,
+    ):
+    '''
+    Estimate the variance of the population total of each column of `values`
+    from a stratified random sample. The sample rows are ordered by stratum,
+    with stratum `h` running from `boundaries[h]` to `boundaries[h + 1]`, and
+    `sizes` holds the number of rows in each stratum.
+    '''
+    counts = np.diff(boundaries)[:, np.newaxis]
+    sizes = sizes[:, np.newaxis]
+    sums = np.add.reduceat(values, boundaries[:-1], axis=0)
+    squares = np.add.reduceat(values * values, boundaries[:-1], axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (squares - sums * sums / counts) / (counts - 1)
+    variance = np.where(counts > 1, np.maximum(variance, 0), 0.0)
+    return (sizes * sizes * (1 - counts / sizes) * variance / counts)\
+        .sum(axis=0)
+
+def weighted_quantiles(
+        values: np.ndarray,
+        weights: np.ndarray,
+        quantiles: np.ndarray,
+    ):
+    '''
+    Find quantiles of weighted values: the smallest value whose cumulative
+    share of the total weight reaches each quantile.
+    '''
+    if len(values) == 0:
+        return np.full(len(quantiles), np.nan)
+
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    positions = np.searchsorted(
+        cumulative, np.clip(quantiles, 0, 1) * cumulative[-1], 'left',
+    )
+    return values[order][np.minimum(positions, len(values) - 1)]
+
+def estimate_column(
+        values: np.ndarray,
+        keep: np.ndarray,
+        boundaries: np.ndarray,
+        sizes: np.ndarray,
+        weights: np.ndarray,
+        bounds: tuple[float, float],
+    ):
+    '''
+    Estimate the `describe()` fields of one sensor from a stratified sample,
+    with the lower and upper ends of their 95% confidence intervals.
+
+    The mean, standard deviation and CDF are ratios of population totals,
+    whose variances are found by linearisation; quantile intervals are found
+    by inverting the CDF's interval (Woodruff's method). The minimum and
+    maximum are the sample extremes, which bound the true extremes on one
+    side; `bounds` (possibly NaN) bounds them on the other.
+
+    Returns three arrays, in the order of `DESCRIBE_INDEX`.
+    '''
+    valid = keep & ~np.isnan(values)
+    indicator = valid.astype(float)
+    count = (weights * indicator).sum()
+    y = np.where(valid, values, 0.0)
+
+    def interval(linearised: np.ndarray):
+        variance = stratified_variance(
+            linearised[:, np.newaxis], boundaries, sizes,
+        )[0]
+        return CONFIDENCE_Z * np.sqrt(variance) / count
+
+    # No sampled row had a reading, so none of the stratified
+    # variances can be estimated.
+    if count == 0:
+        estimate = np.array([0.0] + [np.nan] * 7)
+        return estimate, estimate, estimate
+
+    count_width = interval(indicator) * count
+    mean = (weights * y).sum() / count
+    mean_width = interval(indicator * (y - mean))
+
+    deviations = indicator * (y - mean)**2
+    variance = (weights * deviations).sum() / count
+    variance_width = interval(deviations - indicator * variance)
+    total = int(valid.sum())
+    if total > 1:
+        variance *= total / (total - 1)
+    std = np.sqrt(variance)
+    std_width = variance_width / (2 * std) if std > 0 else 0.0
+
+    # Quantile intervals come from the interval of the CDF at
+    # each estimated quantile.
+    sample, sample_weights = values[valid], weights[valid]
+    quantiles = weighted_quantiles(sample, sample_weights, np.array(QUANTILES))
+    cdf_widths = np.array([
+        interval(indicator * ((y <= quantile) - share))
+        for quantile, share in zip(quantiles, QUANTILES)
+    ])
+    quantile_low = weighted_quantiles(
+        sample, sample_weights, np.array(QUANTILES) - cdf_widths,
+    )
+    quantile_high = weighted_quantiles(
+        sample, sample_weights, np.array(QUANTILES) + cdf_widths,
+    )
+
+    minimum, maximum = sample.min(), sample.max()
+    lower_bound = bounds[0] if not np.isnan(bounds[0]) else -np.inf
+    upper_bound = bounds[1] if not np.isnan(bounds[1]) else np.inf
+
+    estimate = np.array([count, mean, std, minimum, *quantiles, maximum])
+    low = np.array([
+        count - count_width, mean - mean_width, max(std - std_width, 0),
+        min(lower_bound, minimum), *quantile_low, maximum,
+    ])
+    high = np.array([
+        count + count_width, mean + mean_width, std + std_width,
+        minimum, *quantile_high, max(upper_bound, maximum),
+    ])
+    return estimate, low, high
+
+def relative_error(estimate: np.ndarray, low: np.ndarray, high: np.ndarray):
+    '''
+    Get the error of a sensor's estimates: the largest half-width of the
+    intervals of the mean, standard deviation and quartiles, relative to the
+    standard deviation, or of the count, relative to the count. The minimum
+    and maximum are not included, since their intervals do not narrow as the
+    sample grows.
+    '''
+    count, std = estimate[0], estimate[2]
+    if count == 0:
+        return 0.0 if high[0] == 0 else np.inf
+
+    widths = (high - low) / 2
+    errors = [widths[0] / count]
+    if std > 0:
+        errors.append(widths[[1, 2, 4, 5, 6]].max() / std)
+    return float(max(errors))
+
+def sample_summary(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+        fraction: float | None = None,
+        max_error: float | None = None,
+    ):
+    '''
+    Estimate the summary of each sensor from a time-stratified sample.
+
+    If `fraction` is passed, that fraction of the rows in the time range is
+    sampled. Otherwise, `INITIAL_FRACTION` is sampled first, and the sample is
+    grown (keeping the rows already drawn) until the error of every sensor
+    (see `relative_error()`) is at most `max_error`, or every row has been
+    sampled.
+
+    Returns the estimates, lower and upper confidence interval ends of each
+    sensor (as `describe()`-style `Series`), the fraction of rows sampled, the
+    largest error, and the time taken.
+    '''
+    start_time = perf_counter()
+    validate_analysis_inputs(*time_range, *sensor_range)
+
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError('Only a single data file can be sampled.')
+    if fraction is None and max_error is None:
+        raise ValueError('Either a sample fraction or an error is needed.')
+    if fraction is not None and not 0 < fraction <= 1:
+        raise ValueError('The sample fraction must be between 0 and 1.')
+    if max_error is not None and max_error <= 0:
+        raise ValueError('The error bound must be positive.')
+
+    sensors = [
+        sensor_name(index)
+        for index in range(sensor_range[0], sensor_range[1] + 1)
+    ]
+    sampler = logger.log_task('Opening data for sampling... ')\
+        (open_sampler)(files[0], time_range, sensors)
+    sizes = sampler.sizes[sampler.sizes > 0]
+    strata = np.flatnonzero(sampler.sizes > 0)
+    total_rows = int(sizes.sum())
+    if total_rows == 0:
+        raise ValueError('There are no rows in the time range to sample.')
+
+    # Each stratum is sampled in a fixed random order, so a
+    # grown sample keeps the rows it already has.
+    rng = np.random.default_rng()
+    orders = [rng.permutation(size) for size in sizes]
+    taken = np.zeros(len(strata), dtype=int)
+    labels, values, bad = np.empty(0, dtype=int), None, np.empty(0, dtype=bool)
+
+    fraction = fraction if fraction is not None else INITIAL_FRACTION
+    while True:
+        wanted = np.minimum(
+            sizes, np.maximum(MIN_STRATUM_SAMPLE, np.ceil(fraction * sizes)),
+        ).astype(int)
+        grown = np.flatnonzero(wanted > taken)
+        new_values, new_bad = sampler.fetch([
+            (strata[position], orders[position][taken[position]:wanted[position]])
+            for position in grown
+        ])
+
+        # Sample rows are kept ordered by stratum, with each
+        # row weighted by the number of rows it stands for.
+        new_labels = np.repeat(grown, (wanted - taken)[grown])
+        labels = np.concatenate([labels, new_labels])
+        values = new_values if values is None\
+            else np.concatenate([values, new_values])
+        bad = np.concatenate([bad, new_bad])
+        order = np.argsort(labels, kind='stable')
+        labels, values, bad = labels[order], values[order], bad[order]
+        taken = wanted
+
+        keep = np.ones_like(bad) if no_clean else ~bad
+        boundaries = np.concatenate([[0], np.cumsum(taken)])
+        weights = np.repeat(sizes / taken, taken)
+
+        results = [
+            estimate_column(
+                values[:, index], keep, boundaries, sizes, weights,
+                sampler.bounds[index],
+            )
+            for index in range(len(sensors))
+        ]
+        error = max(relative_error(*result) for result in results)
+        sampled = int(taken.sum())
+        logger.log(
+            f'Sampled {sampled} of {total_rows} rows'
+            f' ({sampled / total_rows:.2%}); largest error {error:.3g}.\n'
+        )
+
+        if max_error is None or error <= max_error or sampled == total_rows:
+            break
+
+        # The error shrinks roughly with the square root of the
+        # sample size.
+        fraction = min(1.0, sampled / total_rows * max(
+            2.0, 1.2 * (error / max_error)**2,
+        ))
+
+    estimates, lows, highs = (
+        [Series(result[part], index=DESCRIBE_INDEX) for result in results]
+        for part in range(3)
+    )
+    return (
+        estimates, lows, highs,
+        sampled / total_rows, error, perf_counter() - start_time,
+    )
@@ -6,9 +6,14 @@ import sys
 import traceback
 
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import CancelledError, wait as wait_for
+from functools import partial
 from typing import Any, Callable
 
 import logger
+import placement
+from jobs import JobScheduler, active_command
+from placement import make_placement
 from util import TEXT_GREY, TEXT_RESET
 
 
@@ -45,14 +50,33 @@ class _Command:
         '''
         Runs when a `_Command` instance is called.
         '''
-        args = self.arg_parser.parse_args(params)
+        return self.run(self.arg_parser.parse_args(params))
+
+    def run(self, args: Namespace):
+        '''
+        Run the command with arguments which have already been parsed.
+        '''
         result = None
         try:
-            result = self.func(args)
+            # Commands with a `--quiet` option only log their
+            # results when it is passed.
+            # Commands with `--workers` and `--affinity` options
+            # place their workers accordingly.
+            worker_placement = make_placement(
+                getattr(args, 'workers', None),
+                getattr(args, 'affinity', None),
+            )
+            with logger.quiet(getattr(args, 'quiet', False)),\
+                    placement.use(worker_placement):
+                result = self.func(args)
         except KeyboardInterrupt:
         # ^C while command is running should return
         # from command, not entire CLI.
             logger.warn('^C detected, exiting command gracefully...')
+        except CancelledError:
+            # The command was running as a job which has
+            # been cancelled.
+            logger.warn('Command cancelled.\n')
         except SystemExit as exc:
             # If Python's `exit()` function is used,
             # propagate the exception so that it is not
@@ -148,6 +172,14 @@ class SimpleCLI:
         self.add_command = self.command_list.add_command
         self.add_commands = self.command_list.add_commands
 
+        # Background jobs, and whether commands separated by
+        # `;` run at the same time.
+        self.scheduler = JobScheduler()
+        self.concurrent_chains = False
+        # Commands which always run in the foreground, since
+        # they control the CLI itself.
+        self.foreground_commands: set[str] = set()
+
         if include_default_commands:
             self._add_default_commands()
 
@@ -160,6 +192,7 @@ class SimpleCLI:
             '''
             `exit` command.
             '''
+            self.scheduler.cancel_all()
             sys.exit(ns.code)
 
         def cmd_clear(_):
@@ -187,6 +220,103 @@ class SimpleCLI:
         self.add_command('clear', cmd_clear, 'Clear the terminal.', [])
         self.add_command('help', cmd_help, 'List available commands.', [])
 
+        def get_job(job_id: int):
+            '''
+            Get a job by ID, logging an error if there is no such job.
+            '''
+            try:
+                return self.scheduler.get(job_id)
+            except ValueError as exc:
+                logger.error(f'{exc}\n')
+                return None
+
+        def cmd_jobs(_):
+            '''
+            `jobs` command.
+            '''
+            if len(self.scheduler.jobs) == 0:
+                return 'No jobs.'
+            return '\n'.join(
+                f'[{job.id}] {job.status:<9} {job.elapsed:8.1f}s'
+                f'  {job.command_text}'
+                for job in self.scheduler.jobs.values()
+            )
+
+        def cmd_wait(ns: Namespace):
+            '''
+            `wait` command.
+            '''
+            job = get_job(ns.id)
+            if job is None:
+                return None
+            wait_for([job.future])
+            job.reported = True
+            return job.result_text()
+
+        def cmd_cancel(ns: Namespace):
+            '''
+            `cancel` command.
+            '''
+            job = get_job(ns.id)
+            if job is None:
+                return None
+            if job.future.done():
+                return f'[{job.id}] Already {job.status}.'
+            self.scheduler.cancel(job.id)
+            return f'[{job.id}] Cancelling: {job.command_text}'
+
+        def cmd_result(ns: Namespace):
+            '''
+            `result` command.
+            '''
+            job = get_job(ns.id)
+            if job is None:
+                return None
+            if not job.future.done():
+                return f'[{job.id}] Still {job.status}; use `wait {job.id}`.'
+            job.reported = True
+            return job.result_text()
+
+        def cmd_chains(ns: Namespace):
+            '''
+            `chains` command.
+            '''
+            if ns.mode is not None:
+                self.concurrent_chains = ns.mode == 'concurrent'
+            mode = 'concurrent' if self.concurrent_chains else 'serial'
+            return f'Commands separated by ";" run in {mode}.'
+
+        job_id_arg = (['id'], {
+            'action': 'store',
+            'help': 'The ID of the job, as shown by `jobs`.',
+            'type': int,
+        })
+        self.add_command('jobs', cmd_jobs, 'List background jobs.', [])
+        self.add_command(
+            'wait', cmd_wait,
+            'Wait for a background job to finish and show its output.',
+            [job_id_arg],
+        )
+        self.add_command(
+            'cancel', cmd_cancel, 'Cancel a background job.', [job_id_arg],
+        )
+        self.add_command(
+            'result', cmd_result,
+            'Show the output of a finished background job.', [job_id_arg],
+        )
+        self.add_command(
+            'chains', cmd_chains,
+            'Show or set whether commands separated by ";" run one after'
+                ' another (serial) or at the same time (concurrent).',
+            [(['mode'], {
+                'action': 'store',
+                'nargs': '?',
+                'choices': ['serial', 'concurrent'],
+            })],
+        )
+
+        self.foreground_commands.update(self.command_list.list_commands())
+
     def _split_command_text(self, command_text: str):
         '''
         Ensures that all double-quoted string arguments in the input text are
@@ -199,7 +329,7 @@ class SimpleCLI:
         for item in initial_split:
             append = False
 
-            if not '"' in item:
+            if not '"' in item and len(acc) == 0:
                 append = True
             if len(acc) > 0 and '"' in item:
                 append = True
@@ -216,34 +346,142 @@ class SimpleCLI:
 
         return out
 
+    def _split_jobs(self, command_text: str):
+        '''
+        Split a command at each unquoted `&` which ends a word, e.g.
+        `summary & summary-bench &`. Anything between double quotes (such as
+        a file path containing `&`) is kept intact.
+
+        Returns the commands to run in the background, and the command to run
+        in the foreground (which may be empty).
+        '''
+        background = []
+        words = []
+        quoted = False
+        for word in command_text.split():
+            if word.count('"') % 2 == 1:
+                quoted = not quoted
+            if quoted or not word.endswith('&'):
+                words.append(word)
+                continue
+
+            if len(word) > 1:
+                words.append(word[:-1])
+            background.append(' '.join(words))
+            words = []
+
+        return background, ' '.join(words)
+
+    def _report_finished_jobs(self):
+        '''
+        Tell the user about any background jobs which have finished since
+        this was last called.
+        '''
+        for job in self.scheduler.newly_finished():
+            logger.log(
+                f'[{job.id}] {job.status.capitalize()}: {job.command_text}'
+                f' (use `result {job.id}` to see its output)\n'
+            )
+
+    def _run_line(self, command: str):
+        '''
+        Run a single command from a line of input. Any parts of it followed by
+        `&` are run as background jobs, e.g. `summary & summary-bench &`.
+        '''
+        background, foreground = self._split_jobs(command)
+        for text in background:
+            self.run_command(text, background=True)
+        if len(foreground) > 0:
+            self.run_command(foreground)
+
+    def _run_concurrently(self, commands: list[str]):
+        '''
+        Run a chain of commands as background jobs, wait for them all to
+        finish, and show their output in order.
+        '''
+        jobs = []
+        for command in commands:
+            background, foreground = self._split_jobs(command)
+            for text in background:
+                self.run_command(text, background=True)
+            if len(foreground) > 0:
+                job = self.run_command(foreground, background=True)
+                if job is not None:
+                    jobs.append(job)
+
+        try:
+            wait_for([job.future for job in jobs])
+        except KeyboardInterrupt:
+            # ^C should cancel the chain, not exit the CLI.
+            logger.warn('^C detected, cancelling commands...\n')
+            for job in jobs:
+                self.scheduler.cancel(job.id)
+            wait_for([job.future for job in jobs])
+
+        for job in jobs:
+            job.reported = True
+            logger.result(f'{job.result_text()}\n')
+
     def _run_cli(self):
         while True:
-            # Get a line of input.
+            # Tell the user about any jobs which have finished
+            # since the last prompt.
+            self._report_finished_jobs()
+
+            # Get a line of input, once all output so far has
+            # been written.
+            logger.flush()
             line = input('Python: > ')
             # Split by any semicolons (in case the
             # user wants to run multiple commands).
 
-            commands = line.split(';')
+            # Dont't try to run empty command strings!
+            commands = [
+                command for command in line.split(';')
+                if len(command.strip()) > 0
+            ]
+            if self.concurrent_chains and len(commands) > 1:
+                self._run_concurrently(commands)
+                continue
+
             # Run each command in turn.
             for command in commands:
-                # Dont't try to run empty command strings!
-                if len(command) > 0:
-                    self.run_command(command)
-
-    def run_command(self, command_text: str):
-        '''Run a command, if it exists.'''
-        command_name, *command_args = self._split_command_text(command_text)
+                self._run_line(command)
 
-        if command_name == '':
-            return
+    def run_command(self, command_text: str, background: bool = False):
+        '''
+        Run a command, if it exists. If `background` is true, the command is
+        run as a background job, which is returned.
+        '''
+        split_text = self._split_command_text(command_text)
+        if len(split_text) == 0:
+            return None
+        command_name, *command_args = split_text
 
         command = self.command_list.get_command(command_name)
 
-        if command is not None:
-            output = command(command_args)
-            logger.log(f'{output}\n')
-        else:
+        if command is None:
             logger.log(f'No command named: "{command_name}".\n\r')
+            return None
+
+        if background and command_name not in self.foreground_commands:
+            # Parse arguments now, so that mistakes are
+            # reported straight away.
+            try:
+                args = command.arg_parser.parse_args(command_args)
+            except SystemExit:
+                return None
+
+            job = self.scheduler.submit(
+                command_text.strip(), partial(command.run, args),
+            )
+            logger.log(f'[{job.id}] Started: {job.command_text}\n')
+            return job
+
+        with active_command():
+            output = command(command_args)
+        logger.result(f'{output}\n')
+        return None
 
     def start(self):
         '''Start up the CLI.'''
@@ -251,4 +489,5 @@ class SimpleCLI:
             self._run_cli()
         except KeyboardInterrupt:
             logger.warn('^C detected, exiting CLI gracefully...')
+            self.scheduler.cancel_all()
             sys.exit(0)
@@ -0,0 +1,253 @@
+'''
+Power spectra of sensor readings. Readings are placed on a regular time grid,
+gaps are filled (or masked), and the spectrum of every sensor is estimated
+with Welch's method: the data is split into overlapping, windowed segments,
+whose periodograms are computed with one batched FFT per group of segments
+and averaged. Groups of segments are processed in parallel and merged by
+adding them up.
+'''
+
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from pandas import DataFrame, Timedelta
+
+import logger
+from jobs import worker_share
+from planner import plan_selection, select_cells, selected_timestamps
+from proc import generate_descriptions, log_clean_counts
+from time_index import read_time_window
+from util import resolve_data_files, validate_analysis_inputs
+
+
+# Ways of handling gaps in the readings: `interpolate` fills them linearly
+# from the readings either side, while `mask` leaves them out, scaling each
+# segment's power up by the fraction of it that was missing.
+GAP_METHODS = ['interpolate', 'mask']
+
+# Default segment length, and the number of dominant frequencies reported
+# per sensor.
+SEGMENT_LENGTH = '1D'
+TOP_FREQUENCIES = 5
+
+# The most segments transformed in one task, to bound the memory used.
+SEGMENTS_PER_TASK = 32
+
+
+def regular_grid(timestamps: np.ndarray):
+    '''
+    Place timestamps on a regular grid, with a spacing of the median interval
+    between them. Returns the grid position of each timestamp, the number of
+    grid positions and the spacing.
+    '''
+    if len(timestamps) < 2:
+        raise ValueError('At least two rows are needed to compute a spectrum.')
+
+    interval = np.median(np.diff(timestamps))
+    if interval <= np.timedelta64(0, 'ns'):
+        raise ValueError('Timestamps must be increasing.')
+
+    positions = np.rint((timestamps - timestamps[0]) / interval).astype(int)
+    return positions, int(positions[-1]) + 1, Timedelta(interval)
+
+def fill_gaps(block: np.ndarray, gaps: str):
+    '''
+    Remove the mean of each column of a block of readings (with NaN for
+    gaps), and fill its gaps: linearly if `gaps` is `interpolate`, or with
+    zeros (i.e. the mean) if it is `mask`. Columns with no readings are all
+    zero.
+
+    Returns the filled block, and a mask of the readings which were present.
+    '''
+    valid = ~np.isnan(block)
+    filled = np.zeros_like(block)
+    positions = np.arange(len(block))
+
+    for index in range(block.shape[1]):
+        column_valid = valid[:, index]
+        if not column_valid.any():
+            continue
+        readings = block[column_valid, index]
+        readings = readings - readings.mean()
+        if gaps == 'interpolate':
+            filled[:, index] = np.interp(
+                positions, positions[column_valid], readings,
+            )
+        else:
+            filled[column_valid, index] = readings
+
+    return filled, valid
+
+def welch_segments(
+        job: tuple[np.ndarray, np.ndarray | None, np.ndarray, np.ndarray],
+    ):
+    '''
+    Sum the periodograms of a group of segments of every column of a block.
+
+    `job` holds the rows of the block covering the segments, the mask of
+    readings present in them (`None` if gaps were interpolated), the first
+    row of each segment and the window function. Every segment is detrended
+    by removing its mean, windowed, and transformed in a single batched call
+    to `numpy.fft.rfft()`.
+
+    Returns the summed power, of shape `(frequencies, columns)`, and the
+    number of segments included for each column. With a mask, each segment's
+    power is divided by the fraction of its readings present, and segments
+    with no readings are left out.
+    '''
+    block, valid, starts, window = job
+    rows = starts[:, np.newaxis] + np.arange(len(window))
+
+    # Shape: (segments, rows per segment, columns).
+    segments = block[rows]
+    if valid is None:
+        segments = segments - segments.mean(axis=1, keepdims=True)
+        power = np.abs(np.fft.rfft(segments * window[:, np.newaxis], axis=1))**2
+        return power.sum(axis=0), np.full(block.shape[1], len(starts))
+
+    # Gaps are zero, so only the readings present count towards
+    # each segment's mean.
+    present = valid[rows]
+    fraction = present.mean(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(
+            fraction > 0, segments.sum(axis=1) / present.sum(axis=1), 0.0,
+        )
+    segments = np.where(present, segments - means[:, np.newaxis], 0.0)
+    power = np.abs(np.fft.rfft(segments * window[:, np.newaxis], axis=1))**2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        power = np.where(
+            fraction[:, np.newaxis] > 0, power / fraction[:, np.newaxis], 0.0,
+        )
+    return power.sum(axis=0), (fraction > 0).sum(axis=0)
+
+def dominant_frequencies(
+        frequencies: np.ndarray,
+        power: np.ndarray,
+        top: int,
+    ):
+    '''
+    Find the `top` frequencies with the most power in each column of a
+    spectrum, ignoring the zero frequency. Returns the indices of the
+    frequencies, of shape `(top, columns)`, strongest first.
+    '''
+    top = min(top, len(frequencies) - 1)
+    if top <= 0:
+        return np.empty((0, power.shape[1]), dtype=int)
+
+    candidates = power[1:]
+    strongest = np.argpartition(-candidates, top - 1, axis=0)[:top]
+    order = np.argsort(
+        -np.take_along_axis(candidates, strongest, axis=0), axis=0,
+    )
+    return np.take_along_axis(strongest, order, axis=0) + 1
+
+def compute_spectrum(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        method: str,
+        no_clean: bool,
+        segment: str = SEGMENT_LENGTH,
+        gaps: str = 'interpolate',
+        top: int = TOP_FREQUENCIES,
+    ):
+    '''
+    Estimate the power spectral density of each sensor over the time range
+    with Welch's method, using Hann-windowed segments `segment` long (e.g.
+    `1D`) overlapping by half. If the data is shorter than one segment, a
+    single segment covers all of it.
+
+    Returns a `DataFrame` of the `top` dominant frequencies of each sensor,
+    a `DataFrame` of the full spectra (one column per sensor), and the time
+    taken. Frequencies are in Hz, and power in units squared per Hz.
+    '''
+    validate_analysis_inputs(*time_range, *sensor_range)
+    files = resolve_data_files(file_path)
+    if len(files) > 1:
+        raise ValueError('Spectra can only be computed for a single data file.')
+
+    df = logger.log_task('Reading CSV file data into DataFrame... ')\
+        (read_time_window)(files[0], *time_range)
+
+    # Select the rows and sensors for analysis, removing
+    # bad rows only from those selected.
+    rows, names, keep, removed = plan_selection(
+        df, *time_range, *sensor_range, no_clean,
+    )
+    if not no_clean:
+        log_clean_counts(*removed)
+    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
+        (select_cells)(df, rows, names, keep)
+
+    start_time = perf_counter()
+    timestamps = selected_timestamps(df, rows, keep)
+    positions, num_positions, interval = regular_grid(timestamps)
+
+    # Rows missing from the grid (e.g. removed by cleaning)
+    # are gaps, like null readings.
+    block = np.full((num_positions, len(data_subset)), np.nan)
+    block[positions] = np.column_stack(data_subset).astype(float)
+    block, valid = logger.log_task(f'Filling gaps ({gaps})... ')\
+        (fill_gaps)(block, gaps)
+    if gaps == 'interpolate':
+        valid = None
+
+    # Split the data into segments overlapping by half.
+    length = min(max(int(Timedelta(segment) / interval), 2), num_positions)
+    step = max(length // 2, 1)
+    starts = np.arange(0, num_positions - length + 1, step)
+    window = np.hanning(length + 1)[:-1]
+
+    # Each task gets a contiguous group of segments, and only
+    # the rows they cover.
+    num_groups = max(worker_share(), -(-len(starts) // SEGMENTS_PER_TASK))
+    jobs = []
+    for group in np.array_split(starts, num_groups):
+        if len(group) == 0:
+            continue
+        group_rows = slice(group[0], group[-1] + length)
+        jobs.append((
+            block[group_rows],
+            valid[group_rows] if valid is not None else None,
+            group - group[0],
+            window,
+        ))
+
+    results, _, _ = logger.log_task(
+        f'Transforming {len(starts)} segments of {length} rows in'
+        f' {len(jobs)} groups (method: {method})... '
+    )(generate_descriptions)(welch_segments, jobs, method)
+
+    # Average the periodograms, scaled to a one-sided density.
+    sample_rate = 1 / interval.total_seconds()
+    power = sum(result[0] for result in results)
+    counts = sum(result[1] for result in results)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        power = power / counts / (sample_rate * (window**2).sum())
+    # Every frequency but zero (and the Nyquist frequency, for
+    # even lengths) stands for a negative frequency too.
+    power[1:len(power) - 1 + length % 2] *= 2
+    frequencies = np.fft.rfftfreq(length, 1 / sample_rate)
+
+    # Report the dominant frequencies of each sensor.
+    strongest = dominant_frequencies(frequencies, np.nan_to_num(power), top)
+    table = DataFrame([
+        {
+            'sensor': name,
+            'rank': rank + 1,
+            'frequency': frequencies[strongest[rank, index]],
+            'period': Timedelta(
+                seconds = 1 / frequencies[strongest[rank, index]],
+            ).round('s'),
+            'power': power[strongest[rank, index], index],
+        }
+        for index, name in enumerate(names)
+        for rank in range(len(strongest))
+    ])
+    spectra = DataFrame(power, columns=names)
+    spectra.insert(0, 'frequency', frequencies)
+
+    return table, spectra, perf_counter() - start_time
@@ -0,0 +1,54 @@
+'''
+Test configuration. The modules under test live at the top level of the
+repository, so it is put on the import path.
+'''
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pandas import DataFrame, date_range
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from util import sensor_name
+
+
+def write_sensor_csv(
+        file_path: Path,
+        num_rows: int = 3000,
+        num_sensors: int = 4,
+        seed: int = 0,
+        start: str = '2018-04-01',
+    ):
+    '''
+    Write a small data file in the format of the sensor time-series file:
+    one reading a minute from `start`, with some null readings and a failure
+    (BROKEN, then RECOVERING rows). The last sensor has only nulls.
+    '''
+    rng = np.random.default_rng(seed)
+    data = {
+        'timestamp': date_range(start, periods=num_rows, freq='min')
+            .strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    for index in range(num_sensors):
+        values = rng.normal(100 * (index + 1), 10, num_rows)
+        values[rng.random(num_rows) < 0.05] = np.nan
+        # A long gap, so that gaps span partition boundaries.
+        values[num_rows // 3:num_rows // 3 + 200] = np.nan
+        data[sensor_name(index)] = values
+    data[sensor_name(num_sensors - 1)] = np.nan
+
+    statuses = np.full(num_rows, 'NORMAL', dtype=object)
+    statuses[num_rows // 2] = 'BROKEN'
+    statuses[num_rows // 2 + 1:num_rows // 2 + 60] = 'RECOVERING'
+    data['machine_status'] = statuses
+
+    DataFrame(data).to_csv(file_path)
+    return file_path
+
+@pytest.fixture
+def sensor_csv(tmp_path: Path):
+    '''A small data file, as written by `write_sensor_csv()`.'''
+    return write_sensor_csv(tmp_path / 'sensors.csv')
@@ -0,0 +1,76 @@
+'''
+Cancel latency of `generate_descriptions()`: a cancelled or interrupted
+command must get control back within `WORKER_EXIT_TIMEOUT` seconds (plus a
+little slack), and must leave no worker processes behind, even while its
+tasks are still running.
+'''
+
+import os
+import signal
+from concurrent.futures import CancelledError, wait
+from multiprocessing import active_children
+from threading import Timer
+from time import perf_counter, sleep
+
+import pytest
+
+from jobs import JobScheduler
+from proc import generate_descriptions
+from util import WORKER_EXIT_TIMEOUT
+
+
+# Time each task takes, far longer than the latency allowed.
+TASK_SECONDS = 30
+
+# Time to let the workers start on their tasks before cancelling.
+START_SECONDS = 0.5
+
+MAX_LATENCY = WORKER_EXIT_TIMEOUT + 0.5
+
+
+def slow_task(seconds: float):
+    '''Task which does nothing for `seconds` seconds.'''
+    sleep(seconds)
+    return seconds
+
+
+def test_job_cancel_latency():
+    scheduler = JobScheduler()
+    job = scheduler.submit(
+        'slow',
+        lambda: generate_descriptions(slow_task, [TASK_SECONDS] * 4, 'process'),
+    )
+    sleep(START_SECONDS)
+    assert job.status == 'running'
+
+    cancel_start = perf_counter()
+    scheduler.cancel(job.id)
+    done, _ = wait([job.future], timeout=MAX_LATENCY)
+    latency = perf_counter() - cancel_start
+
+    assert job.future in done, f'Not cancelled after {latency:.2f} s.'
+    assert latency <= MAX_LATENCY
+    assert job.status == 'cancelled'
+    with pytest.raises(CancelledError):
+        job.future.result()
+    assert active_children() == []
+
+def test_interrupt_latency():
+    sent = []
+
+    def interrupt():
+        # Interrupt the main thread as ^C would.
+        sent.append(perf_counter())
+        os.kill(os.getpid(), signal.SIGINT)
+
+    timer = Timer(START_SECONDS, interrupt)
+    timer.start()
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            generate_descriptions(slow_task, [TASK_SECONDS] * 4, 'process')
+        latency = perf_counter() - sent[0]
+    finally:
+        timer.cancel()
+
+    assert latency <= MAX_LATENCY
+    assert active_children() == []
@@ -0,0 +1,95 @@
+'''
+A resumed checkpointed summary must give results identical to an
+uninterrupted run, whether it was interrupted or lost some of its saved
+partitions.
+'''
+
+from pathlib import Path
+
+import pytest
+from pandas import Timestamp, Timedelta
+
+import checkpoint
+import proc
+from conftest import write_sensor_csv
+from proc import summarise_file
+
+
+NUM_PARTITIONS = 5
+ROWS_PER_PARTITION = 1000
+TIME_RANGE = ('2018-04-01 00:00:00', '2018-04-04 11:19:00')
+SENSOR_RANGE = (0, 3)
+
+
+@pytest.fixture
+def dataset(tmp_path: Path):
+    '''A dataset of consecutive partition files.'''
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    for index in range(NUM_PARTITIONS):
+        start = Timestamp('2018-04-01')\
+            + index * ROWS_PER_PARTITION * Timedelta('1min')
+        write_sensor_csv(
+            directory / f'part-{index}.csv',
+            num_rows = ROWS_PER_PARTITION,
+            seed = index,
+            start = str(start),
+        )
+    return directory
+
+def summarise(dataset: Path, state_dir: Path, resume: bool, gaps: bool):
+    results, _ = summarise_file(
+        dataset, TIME_RANGE, SENSOR_RANGE, 'sync',
+        checkpoint_dir = state_dir,
+        resume = resume,
+        gaps = gaps,
+    )
+    return results
+
+def assert_identical(results, expected):
+    assert len(results) == len(expected)
+    for df, expected_df in zip(results, expected):
+        assert df.equals(expected_df)
+
+
+@pytest.mark.parametrize('gaps', [False, True])
+def test_resume_after_interrupt(dataset, tmp_path, monkeypatch, gaps):
+    expected = summarise(dataset, tmp_path / 'expected', False, gaps)
+
+    # Interrupt the summary part of the way through, as ^C
+    # would.
+    summarise_partition = proc.summarise_partition
+    calls = []
+
+    def interrupted(*args, **kwargs):
+        calls.append(None)
+        if len(calls) > 2:
+            raise KeyboardInterrupt
+        return summarise_partition(*args, **kwargs)
+
+    state_dir = tmp_path / 'state'
+    monkeypatch.setattr(proc, 'summarise_partition', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        summarise(dataset, state_dir, False, gaps)
+    monkeypatch.undo()
+
+    saved = list(state_dir.glob('*/partition-*.npz'))
+    assert 0 < len(saved) < NUM_PARTITIONS
+
+    assert_identical(summarise(dataset, state_dir, True, gaps), expected)
+
+def test_resume_after_losing_partitions(dataset, tmp_path, monkeypatch):
+    expected = summarise(dataset, tmp_path / 'expected', False, False)
+
+    # Keep the state of a complete run, then lose two of its
+    # saved partitions.
+    state_dir = tmp_path / 'state'
+    monkeypatch.setattr(checkpoint.Checkpoint, 'remove', lambda self: None)
+    summarise(dataset, state_dir, False, False)
+    monkeypatch.undo()
+    saved = sorted(state_dir.glob('*/partition-*.npz'))
+    assert len(saved) == NUM_PARTITIONS
+    saved[1].unlink()
+    saved[3].unlink()
+
+    assert_identical(summarise(dataset, state_dir, True, False), expected)
@@ -0,0 +1,59 @@
+'''
+The gap statistics of `summary --gaps` must be the same whether a dataset is
+read as one file or as several partitions, including for gaps which span a
+partition boundary and for a sensor which has only nulls.
+'''
+
+from pathlib import Path
+
+import pytest
+from pandas import read_csv
+from pandas.testing import assert_frame_equal
+
+from aggregate import GAPS_INDEX
+from conftest import write_sensor_csv
+from proc import summarise_file
+
+
+NUM_ROWS = 3000
+TIME_RANGE = ('2018-04-01 00:00:00', '2018-04-03 01:59:00')
+SENSOR_RANGE = (0, 3)
+
+
+@pytest.mark.parametrize('bounds', [
+    # Inside the long gap (rows 1000 to 1199).
+    [1100, 2200],
+    # At the start and end of the long gap.
+    [1000, 1200],
+    # A partition which has only nulls, inside the long gap.
+    [1050, 1150, 2000],
+])
+def test_partitioned_gaps_match_single_file(tmp_path: Path, bounds):
+    file_path = write_sensor_csv(tmp_path / 'sensors.csv', num_rows=NUM_ROWS)
+
+    # Split the same rows across partition files, in time
+    # order.
+    directory = tmp_path / 'partitions'
+    directory.mkdir()
+    df = read_csv(file_path, index_col=0)
+    edges = [0, *bounds, NUM_ROWS]
+    for index, (start, end) in enumerate(zip(edges, edges[1:])):
+        df.iloc[start:end].to_csv(directory / f'part-{index}.csv')
+
+    single, _ = summarise_file(
+        file_path, TIME_RANGE, SENSOR_RANGE, 'sync', gaps=True,
+    )
+    partitioned, _ = summarise_file(
+        directory, TIME_RANGE, SENSOR_RANGE, 'sync', gaps=True,
+    )
+
+    assert len(single) == len(partitioned)
+    for df, other_df in zip(single, partitioned):
+        assert df.loc[GAPS_INDEX].equals(other_df.loc[GAPS_INDEX])
+        assert_frame_equal(df, other_df, rtol=1e-9)
+
+    # The sensor with only nulls is a single gap over the
+    # whole time range.
+    gaps = single[-1].loc[GAPS_INDEX].iloc[:, -1]
+    assert gaps['null fraction'] == 1.0
+    assert gaps['gaps'] == 1
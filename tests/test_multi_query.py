@@ -0,0 +1,39 @@
+'''
+The shared scan of `summary-multi` must give the same results as running
+each query on its own.
+'''
+
+import pytest
+
+from multi_query import (
+    QuerySpec,
+    max_difference,
+    summarise_queries,
+    summarise_queries_separately,
+)
+
+
+SPECS = [
+    QuerySpec('2018-04-01 00:00:00', '2018-04-02 01:59:00', 0, 3),
+    # Overlaps the first query, and covers the failure.
+    QuerySpec('2018-04-01 12:00:00', '2018-04-02 12:00:00', 1, 2),
+    # Inside the first query, with the sensor which has only nulls.
+    QuerySpec('2018-04-01 06:30:00', '2018-04-01 07:00:00', 3, 3),
+    # Before the first row read, and past the last.
+    QuerySpec('2018-04-01 00:00:00', '2018-04-03 00:00:00', 0, 0),
+]
+
+
+@pytest.mark.parametrize('no_clean', [False, True])
+def test_shared_scan_matches_separate_queries(sensor_csv, no_clean):
+    shared, _ = summarise_queries(sensor_csv, SPECS, 'sync', no_clean)
+    separate, _ = summarise_queries_separately(
+        sensor_csv, SPECS, 'sync', no_clean,
+    )
+
+    assert [len(results) for results in shared]\
+        == [len(spec.sensors) for spec in SPECS]
+    for query_results, other_query_results in zip(shared, separate):
+        for series, other_series in zip(query_results, other_query_results):
+            assert series['count'] == other_series['count']
+    assert max_difference(shared, separate) <= 1e-9
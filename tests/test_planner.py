@@ -0,0 +1,20 @@
+'''
+The time filter must select the same rows however its bounds are written.
+'''
+
+import pytest
+from pandas import read_csv
+
+from planner import time_slice
+
+
+@pytest.mark.parametrize('time_range', [
+    ('2018-04-01T06:00:00', '2018-04-01T12:00:00'),
+    ('2018-04-01T06:00', '2018-04-01 12:00'),
+])
+def test_time_slice_normalises_bounds(sensor_csv, time_range):
+    df = read_csv(sensor_csv, index_col=0)
+    expected = time_slice(df, '2018-04-01 06:00:00', '2018-04-01 12:00:00')
+
+    assert expected == slice(360, 721)
+    assert time_slice(df, *time_range) == expected
@@ -0,0 +1,72 @@
+'''
+Tiled scans of sensor readings. Commands which scan every reading of a single
+data file (e.g. `extremes` and `histogram`) select a block of readings
+(sensors by rows), then split the rows into tiles and the sensors into
+batches, so that each task scans one batch of one tile.
+'''
+
+from pathlib import Path
+
+import numpy as np
+
+import logger
+from jobs import worker_share
+from planner import plan_selection, select_cells, selected_timestamps
+from proc import log_clean_counts
+from time_index import read_time_window
+
+
+# Rows per tile. Larger datasets are split into more tiles than workers.
+TILE_ROWS = 65_536
+
+
+def select_block(
+        file_path: str | Path,
+        time_range: tuple[str, str],
+        sensor_range: tuple[int, int],
+        no_clean: bool,
+        with_times: bool = False,
+    ):
+    '''
+    Read the rows of a data file which may fall in the time range, and select
+    the readings of each sensor in the sensor range from the rows in the time
+    range, removing bad rows unless `no_clean` is true.
+
+    Returns the columns selected, their names and, if `with_times` is true,
+    the time of each row selected (otherwise `None`).
+    '''
+    df = logger.log_task('Reading CSV file data into DataFrame... ')\
+        (read_time_window)(file_path, *time_range)
+
+    # Select the rows and sensors for analysis, removing
+    # bad rows only from those selected.
+    rows, names, keep, removed = plan_selection(
+        df, *time_range, *sensor_range, no_clean,
+    )
+    if not no_clean:
+        log_clean_counts(*removed)
+    data_subset = logger.log_task('Creating DataFrame subset for analysis... ')\
+        (select_cells)(df, rows, names, keep)
+
+    timestamps = selected_timestamps(df, rows, keep) if with_times else None
+    return data_subset, names, timestamps
+
+def split_tiles(num_rows: int, num_sensors: int):
+    '''
+    Split the rows into tiles of at most about `TILE_ROWS` rows, and the
+    sensors into batches so that there are enough tasks for every worker.
+
+    Returns the rows and sensors (as slices) of each task, tile by tile.
+    Raises a `ValueError` if there are no rows.
+    '''
+    num_tiles = max(-(-num_rows // TILE_ROWS), 1)
+    num_batches = min(max(worker_share() // num_tiles, 1), num_sensors)
+    tasks = [
+        (slice(tile[0], tile[-1] + 1), slice(batch[0], batch[-1] + 1))
+        for tile in np.array_split(np.arange(num_rows), num_tiles)
+        if len(tile) > 0
+        for batch in np.array_split(np.arange(num_sensors), num_batches)
+    ]
+    if len(tasks) == 0:
+        raise ValueError('There are no rows in the time range.')
+    return tasks
@@ -0,0 +1,159 @@
+'''
+Sparse timestamp index sidecars. An index records the timestamp and byte
+offset of every Nth row of a time-sorted CSV file, so that a time window can
+be read by seeking straight to it instead of parsing the whole file.
+'''
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from json import dump, load
+from pathlib import Path
+
+from pandas import read_csv
+
+import logger
+from metadata import csv_dtypes
+from reader import ByteRange, read_byte_range, read_column_names
+
+
+# Extension added to a data file's name to give the name of its index.
+INDEX_SUFFIX = '.idx.json'
+
+# Default number of rows between index entries.
+INDEX_EVERY = 1000
+
+
+@dataclass
+class TimeIndex:
+    '''
+    A sparse index of a time-sorted CSV file. Entry `i` gives the timestamp
+    and byte offset of row `i * every`.
+    '''
+    file_path: Path
+    names: tuple[str, ...]
+    every: int
+    timestamps: list[str]
+    offsets: list[int]
+    # Size and modification time of the data file when it was indexed, used
+    # to detect stale indices.
+    source_size: int
+    source_mtime: int
+
+    def byte_range(self, time_start: str, time_end: str):
+        '''
+        Find the byte range of the data file which contains every row between
+        `time_start` and `time_end` (inclusive). The range is widened to the
+        enclosing index entries, so it may contain a few rows either side of
+        the window, which are removed when the data is subset.
+        '''
+        times = [datetime.fromisoformat(stamp) for stamp in self.timestamps]
+
+        # Start at the last entry at or before the start time,
+        # since rows between it and the next entry may be in the
+        # window.
+        first = max(bisect_left(times, datetime.fromisoformat(time_start)) - 1, 0)
+
+        # Stop at the first entry after the end time.
+        last = bisect_right(times, datetime.fromisoformat(time_end))
+        end = self.offsets[last] if last < len(self.offsets)\
+            else self.source_size
+
+        return ByteRange(self.file_path, self.offsets[first], end, self.names)
+
+
+def index_path(file_path: str | Path):
+    '''
+    Get the path of the index sidecar for the data file specified.
+    '''
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + INDEX_SUFFIX)
+
+def build_time_index(file_path: str | Path, every: int = INDEX_EVERY):
+    '''
+    Scan a CSV data file once, recording the timestamp and byte offset of
+    every `every`th row, and save the result as a sidecar next to the file.
+    '''
+    file_path = Path(file_path)
+    names = read_column_names(file_path)
+    timestamp_index = names.index('timestamp')
+
+    timestamps = []
+    offsets = []
+    with open(file_path, 'rb') as file:
+        # Skip the header line.
+        offset = len(file.readline())
+
+        for row, line in enumerate(file):
+            if row % every == 0:
+                timestamps.append(
+                    line.split(b',')[timestamp_index].decode().strip('"')
+                )
+                offsets.append(offset)
+            offset += len(line)
+
+    stat = file_path.stat()
+    index = TimeIndex(
+        file_path = file_path,
+        names = names,
+        every = every,
+        timestamps = timestamps,
+        offsets = offsets,
+        source_size = stat.st_size,
+        source_mtime = stat.st_mtime_ns,
+    )
+
+    with open(index_path(file_path), 'w', encoding='utf-8') as file:
+        dump({
+            'names': list(names),
+            'every': every,
+            'timestamps': timestamps,
+            'offsets': offsets,
+            'source_size': index.source_size,
+            'source_mtime': index.source_mtime,
+        }, file)
+
+    return index
+
+def load_time_index(file_path: str | Path):
+    '''
+    Load the index sidecar of the data file specified. Returns `None` if there
+    is no index, or if the data file has changed since it was indexed.
+    '''
+    file_path = Path(file_path)
+    sidecar = index_path(file_path)
+    if not sidecar.exists():
+        return None
+
+    with open(sidecar, encoding='utf-8') as file:
+        data = load(file)
+
+    stat = file_path.stat()
+    if (data['source_size'], data['source_mtime'])\
+            != (stat.st_size, stat.st_mtime_ns):
+        logger.warn(
+            f'Ignoring stale index "{sidecar}"; rebuild it with `build-index`.\n'
+        )
+        return None
+
+    return TimeIndex(
+        file_path = file_path,
+        names = tuple(data['names']),
+        every = data['every'],
+        timestamps = data['timestamps'],
+        offsets = data['offsets'],
+        source_size = data['source_size'],
+        source_mtime = data['source_mtime'],
+    )
+
+def read_time_window(file_path: str | Path, time_start: str, time_end: str):
+    '''
+    Read the rows of a CSV data file which may fall between `time_start` and
+    `time_end`. If the file has an index, only the indexed window is parsed;
+    otherwise the whole file is read.
+    '''
+    index = load_time_index(file_path)
+    if index is None or len(index.offsets) == 0:
+        return read_csv(file_path, dtype=csv_dtypes(file_path))
+
+    return read_byte_range(index.byte_range(time_start, time_end))
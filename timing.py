@@ -0,0 +1,146 @@
+'''
+Timing utilities used to break down where the time reported by
+`proc.generate_descriptions()` is actually spent.
+'''
+
+from dataclasses import asdict, dataclass
+from statistics import median
+
+from pandas import DataFrame, Series
+
+
+@dataclass
+class TaskTiming:
+    '''
+    Timestamps recorded for a single analysis task.
+
+    All timestamps are `time.perf_counter()` readings. On the platforms this
+    program supports, `perf_counter()` reads a system-wide monotonic clock,
+    so readings taken inside worker processes can be compared with readings
+    taken in the main process.
+    '''
+    # Recorded in the main process when the task is handed to the executor.
+    submitted: float
+    # Recorded inside the worker.
+    started: float
+    compute_start: float
+    compute_end: float
+    finished: float
+    # Time spent in the main process unpickling the result, in seconds.
+    unpickle: float = 0.0
+
+    @property
+    def queue_wait(self):
+        '''Time between submission and the task starting in a worker.'''
+        return self.started - self.submitted
+
+    @property
+    def compute(self):
+        '''Time spent running the task function itself.'''
+        return self.compute_end - self.compute_start
+
+    @property
+    def worker_serialise(self):
+        '''
+        Time spent inside the worker unpickling the arguments and pickling the
+        result.
+        '''
+        return (self.compute_start - self.started)\
+            + (self.finished - self.compute_end)
+
+
+@dataclass
+class PhaseTimings:
+    '''
+    Per-phase breakdown of a single `generate_descriptions()` call. All values
+    are durations in seconds, except for `straggler_ratio`.
+    '''
+    # Creating the executor.
+    pool_start: float = 0.0
+    # Pickling the columns in the main process.
+    serialise: float = 0.0
+    # Handing the tasks to the executor (includes worker spawning on some
+    # platforms, since workers are started lazily).
+    submit: float = 0.0
+    # From the first submission until the first task starts in a worker.
+    first_task: float = 0.0
+    # Waiting in the executor's queue before a worker picks a task up.
+    queue_wait_mean: float = 0.0
+    queue_wait_max: float = 0.0
+    # Running the task function, measured inside the workers.
+    compute_total: float = 0.0
+    compute_mean: float = 0.0
+    compute_max: float = 0.0
+    # Unpickling arguments and pickling results inside the workers.
+    worker_serialise: float = 0.0
+    # Unpickling the results in the main process.
+    unpickle: float = 0.0
+    # Shutting the executor down.
+    shutdown: float = 0.0
+    # How long the last task finished after the median task did, and how many
+    # times longer the slowest task took to compute than the median task.
+    straggler: float = 0.0
+    straggler_ratio: float = 0.0
+    # The entire call.
+    total: float = 0.0
+
+    @classmethod
+    def from_tasks(
+            cls,
+            tasks: list[TaskTiming],
+            pool_start: float,
+            serialise: float,
+            submit: float,
+            shutdown: float,
+            total: float,
+        ):
+        '''
+        Build a `PhaseTimings` instance from the timings of the individual
+        tasks and the phases recorded in the main process.
+        '''
+        timings = cls(
+            pool_start = pool_start,
+            serialise = serialise,
+            submit = submit,
+            shutdown = shutdown,
+            total = total,
+        )
+
+        # Nothing else can be worked out if no tasks were run.
+        if len(tasks) == 0:
+            return timings
+
+        queue_waits = [task.queue_wait for task in tasks]
+        computes = [task.compute for task in tasks]
+        finishes = [task.finished for task in tasks]
+
+        timings.first_task = min(task.started for task in tasks)\
+            - min(task.submitted for task in tasks)
+        timings.queue_wait_mean = sum(queue_waits) / len(tasks)
+        timings.queue_wait_max = max(queue_waits)
+        timings.compute_total = sum(computes)
+        timings.compute_mean = timings.compute_total / len(tasks)
+        timings.compute_max = max(computes)
+        timings.worker_serialise = sum(task.worker_serialise for task in tasks)
+        timings.unpickle = sum(task.unpickle for task in tasks)
+        timings.straggler = max(finishes) - median(finishes)
+
+        # Guard against tasks so quick that the clock did not move.
+        median_compute = median(computes)
+        if median_compute > 0:
+            timings.straggler_ratio = timings.compute_max / median_compute
+
+        return timings
+
+    def as_series(self):
+        '''Return the timings as a `Series` indexed by phase name.'''
+        return Series(asdict(self), dtype=float)
+
+
+def summarise_phase_timings(timings: list[PhaseTimings]):
+    '''
+    Summarise the phase timings of several runs, giving one row per phase and
+    one column per statistic.
+    '''
+    return DataFrame([timing.as_series() for timing in timings])\
+        .describe().transpose()
@@ -3,19 +3,34 @@ Contains general utilities used throughout the program.
 '''
 
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import Value
+from csv import reader as csv_reader
 from datetime import datetime
+from glob import glob
+from io import SEEK_END
+from pathlib import Path
 from pandas import DataFrame
 from shutil import get_terminal_size
+from signal import SIGINT, SIG_IGN, signal
+from threading import local
+from time import perf_counter
 
+import placement
 
-# Minimum and maximum values for measurement time.
+
+# Minimum and maximum values for measurement time, used when the data file
+# being analysed has no metadata manifest (see `metadata`).
 TIME_MIN = '2018-04-01 00:00:00'
 TIME_MAX = '2018-08-31 23:59:00'
 
-# Minimum and maximum values for sernsor index.
+# Minimum and maximum values for sernsor index, used likewise.
 SENSOR_INDEX_MIN = 0
 SENSOR_INDEX_MAX = 51
 
+# Bounds of the data file being analysed by each thread.
+_query_bounds = local()
+
 # Text formatting escape codes
 CLEAR_LINE = '\x1b[2K\x1b[G'
 CLEAR_SCREEN = '\x1b[2J\x1b[H'
@@ -24,6 +39,17 @@ TEXT_GREY = '\x1b[38;5;245m'
 TEXT_YELLOW = '\x1b[33m'
 TEXT_RED = '\x1b[31m'
 
+# File name endings of the data files picked up when a directory is
+# passed as the data file path.
+DATA_FILE_SUFFIXES = ('.csv', '.csv.gz', '.csv.zst')
+
+# Characters which mark a data file path as a glob pattern.
+GLOB_CHARACTERS = '*?['
+
+# Longest time, in seconds, to wait for terminated worker processes to exit
+# before killing them.
+WORKER_EXIT_TIMEOUT = 1.0
+
 # Column width used in formatting results.
 # MINIMUM VALUE: 15
 COLUMN_WIDTH = 16
@@ -40,15 +66,14 @@ def date_string(date_str: str):
     '''
     Validation function for use with `argparse`. Works like a type checker.
 
-    Checks if the passed date string is valid, then returns that same date
-    string. Invalid strings will raise a `ValueError`.
+    Checks if the passed date string is valid, then returns it in the format
+    of the data file's timestamps (e.g. "2018-04-01 00:00:00"), so that it
+    can be compared with them as a string. Invalid strings will raise a
+    `ValueError`.
     '''
 
     # Raises a ValueError if the string is invalid.
-    datetime.fromisoformat(date_str)
-    # Return the same strin that was passed in since no
-    # processing is required.
-    return date_str
+    return datetime.fromisoformat(date_str).isoformat(sep=' ')
 
 def date_string_lt(date_string_1: str, date_string_2: str):
     '''
@@ -72,6 +97,31 @@ def date_string_gt(date_string_1: str, date_string_2: str):
     return datetime.fromisoformat(date_string_1)\
         > datetime.fromisoformat(date_string_2)
 
+def query_bounds():
+    '''
+    Get the time and sensor bounds which queries made by the calling thread
+    are validated against: those of the data file being analysed, if set with
+    `use_query_bounds()`, or the defaults otherwise.
+    '''
+    return getattr(_query_bounds, 'bounds', None)\
+        or ((TIME_MIN, TIME_MAX), (SENSOR_INDEX_MIN, SENSOR_INDEX_MAX))
+
+@contextmanager
+def use_query_bounds(
+        time_bounds: tuple[str, str],
+        sensor_bounds: tuple[int, int],
+    ):
+    '''
+    Validate the queries made by the calling thread against the bounds given,
+    for the duration of the `with` block.
+    '''
+    previous = getattr(_query_bounds, 'bounds', None)
+    _query_bounds.bounds = (time_bounds, sensor_bounds)
+    try:
+        yield
+    finally:
+        _query_bounds.bounds = previous
+
 def validate_analysis_inputs(
         time_start: str,
         time_end: str,
@@ -79,37 +129,39 @@ def validate_analysis_inputs(
         sensor_end: int,
     ):
     '''
-    Perform validation on the inputs passed to the analysis functions.
+    Perform validation on the inputs passed to the analysis functions, against
+    the bounds of the data file being analysed (see `query_bounds()`).
 
     Only value validation is performed since type validation is handled by
     `argparse` beforehand.
     '''
+    (time_min, time_max), (sensor_min, sensor_max) = query_bounds()
 
     # Ensure that the start and end times are within the
-    # predefined limits. Also check that the start time is
-    # not greater than the end time, as that would not make
+    # data's limits. Also check that the start time is not
+    # greater than the end time, as that would not make
     # sense.
-    if date_string_lt(time_start, TIME_MIN):
-        raise ValueError(f'Start time must be "{TIME_MIN}" or later.')
-    if date_string_gt(time_end, TIME_MAX):
-        raise ValueError(f'End time must be "{TIME_MAX}" or earlier.')
+    if date_string_lt(time_start, time_min):
+        raise ValueError(f'Start time must be "{time_min}" or later.')
+    if date_string_gt(time_end, time_max):
+        raise ValueError(f'End time must be "{time_max}" or earlier.')
     if date_string_gt(time_start, time_end):
         raise ValueError('Start time cannot be after end time.')
 
     # Perform similar vaildation on the sensor indices,
     # ensuring that the start and end indices are within
-    # the predefined limits and that the start index is not
+    # the data's limits and that the start index is not
     # greater than the end index, since that would, again,
     # not make sense.
-    if sensor_start < SENSOR_INDEX_MIN:
+    if sensor_start < sensor_min:
         raise ValueError(
             'Sensor start index must be greater than or equal to'
-            f' {SENSOR_INDEX_MIN}.'
+            f' {sensor_min}.'
         )
-    if sensor_start < SENSOR_INDEX_MIN:
+    if sensor_end > sensor_max:
         raise ValueError(
             'Sensor end index must be less than or equal to'
-            f' {SENSOR_INDEX_MAX}.'
+            f' {sensor_max}.'
         )
     if sensor_start > sensor_end:
         raise ValueError(
@@ -221,6 +273,67 @@ def get_executor_class(method: str) -> type[ThreadPoolExecutor | ProcessPoolExec
 
     return executor_class
 
+def _init_process(counter, cpu_sets: tuple[frozenset[int], ...] | None):
+    '''
+    Initializer for worker processes. ^C is sent to every process in the
+    terminal's process group, so workers ignore it and leave the main process
+    to shut them down cleanly. Workers are then pinned to their CPUs, if the
+    command's placement pins them.
+    '''
+    signal(SIGINT, SIG_IGN)
+    if cpu_sets is not None:
+        placement.pin_worker(counter, cpu_sets)
+
+def create_executor(method: str, max_workers: int):
+    '''
+    Create an executor for the passed execution method, with at most
+    `max_workers` workers, placed as set by `placement.use()`. Returns `None`
+    if the operation should be performed synchronously.
+    '''
+    executor_class = get_executor_class(method)
+    if executor_class is None:
+        return None
+
+    cpu_sets = placement.current().cpu_sets
+    counter = Value('i', 0)
+    if executor_class is ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers = max_workers,
+            initializer = _init_process,
+            initargs = (counter, cpu_sets),
+        )
+    if cpu_sets is not None:
+        return executor_class(
+            max_workers = max_workers,
+            initializer = placement.pin_worker,
+            initargs = (counter, cpu_sets),
+        )
+    return executor_class(max_workers=max_workers)
+
+def shutdown_now(executor: ThreadPoolExecutor | ProcessPoolExecutor):
+    '''
+    Shut down an executor without waiting for its tasks to finish: queued
+    tasks are cancelled and worker processes are terminated (or killed, if
+    they do not exit within `WORKER_EXIT_TIMEOUT` seconds). Threads cannot be
+    stopped, so any running thread tasks finish in the background.
+
+    Returns the number of worker processes stopped.
+    '''
+    # The executor forgets its processes once shut down.
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    for process in processes:
+        process.terminate()
+    deadline = perf_counter() + WORKER_EXIT_TIMEOUT
+    for process in processes:
+        process.join(max(deadline - perf_counter(), 0))
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    return len(processes)
+
 def get_summaries_per_df():
     '''
     Estimate how many DataFrame columns should fit within the terminal window
@@ -243,3 +356,88 @@ def get_summaries_per_df():
     # truncate any decimal points and round down every
     # time.
     return (width - 5) // COLUMN_WIDTH
+
+def resolve_data_files(file_path: str | Path):
+    '''
+    Resolve the data file path passed by the user to a list of data files.
+
+    `file_path` may be a single file, a directory (in which case every data
+    file directly inside it is used) or a glob pattern. Files are returned in
+    sorted order so that results do not depend on the order in which the
+    filesystem lists them.
+    '''
+    file_path = Path(file_path)
+
+    if file_path.is_dir():
+        files = sorted(
+            path for path in file_path.iterdir()
+            if path.name.endswith(DATA_FILE_SUFFIXES)
+        )
+    elif any(char in str(file_path) for char in GLOB_CHARACTERS):
+        files = sorted(Path(path) for path in glob(str(file_path)))
+    else:
+        return [file_path]
+
+    if len(files) == 0:
+        raise FileNotFoundError(f'No data files found matching "{file_path}".')
+
+    return files
+
+def probe_time_bounds(file_path: str | Path, block_size: int = 64 * 1024):
+    '''
+    Find the timestamps of the first and last rows of a CSV data file without
+    reading the whole file: the header and first row are read from the start
+    of the file, and the last row from the end.
+
+    Returns `None` if the file contains no rows.
+    '''
+    with open(file_path, 'rb') as file:
+        header = next(csv_reader([file.readline().decode()]))
+        timestamp_index = header.index('timestamp')
+
+        first_line = file.readline().decode().strip()
+        if first_line == '':
+            return None
+
+        # Read ever larger blocks from the end of the file
+        # until one contains a complete last line.
+        size = file.seek(0, SEEK_END)
+        while True:
+            start = max(0, size - block_size)
+            file.seek(start)
+            lines = file.read().decode().strip().splitlines()
+            if len(lines) > 1 or start == 0:
+                break
+            block_size *= 2
+        last_line = lines[-1]
+
+    first_row, last_row = csv_reader([first_line, last_line])
+    return first_row[timestamp_index], last_row[timestamp_index]
+
+def files_in_time_range(files: list[Path], time_start: str, time_end: str):
+    '''
+    Select the data files which may contain rows within the time range
+    specified, using `probe_time_bounds()` so that only the first and last
+    rows of each file are read. Empty files are dropped. Files which cannot be
+    probed this way (e.g. compressed files) are always selected.
+    '''
+    selected = []
+    for file_path in files:
+        try:
+            bounds = probe_time_bounds(file_path)
+        except (UnicodeDecodeError, ValueError):
+            selected.append(file_path)
+            continue
+        if bounds is None:
+            continue
+
+        first_time, last_time = bounds
+        # Skip files which end before the range starts, or
+        # start after the range ends.
+        if date_string_lt(last_time, time_start)\
+                or date_string_gt(first_time, time_end):
+            continue
+
+        selected.append(file_path)
+
+    return selected